@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
-import random
 import argparse
+import json
+import os
 
 # Haplogroup distribution based on given counts
 haplogroups = [
@@ -11,64 +12,226 @@ haplogroups = [
     ("T", 230), ("U", 533), ("V", 61), ("W", 60), ("X", 89), ("Y", 14), ("Z", 27)
 ]
 
-# Create weighted list of haplogroups
-haplogroup_choices = [hg for hg, count in haplogroups for _ in range(count)]
-                                                                         
-
-def generate_patient_data(num_patients, min_variants, max_variants, output_file):
-    data = []
-    
-    for i in range(1, num_patients + 1):
-        patient_id = f"PAT{str(i).zfill(3)}"
-        sex = random.choice(["M", "F"])
-        age_of_onset = random.randint(1, 80)
-        age_at_sampling = random.randint(age_of_onset, 90)  # Ensure logical consistency
-        haplogroup = random.choice(haplogroup_choices) + str(random.randint(1000, 9999))  # Append 4 random digits
-        
-        # Random number of variants per patient
-        num_variants = random.randint(min_variants, max_variants)
-
-        for _ in range(num_variants):
-            # No need of m3243 heteroplasmy as they are controls
-            # m3243_het = round(np.random.uniform(0, 1), 3)
-            # m3243_het_normalized = round(np.random.uniform(m3243_het, 1), 3)
-
-
-            data.append([
-                "chrMT",  # Mitochondrial chromosome
-                np.random.randint(1, 16659),  # Position of variant
-                random.choice(["A", "T", "C", "G"]),  # Reference allele
-                random.choice(["A", "T", "C", "G"]),  # Alternate allele
-                round(np.random.uniform(0, 1), 3),  # Heteroplasmy rate
-                patient_id,  
-                sex,
-                age_of_onset,
-                age_at_sampling,
-                random.choice(["Blood", "Urine"]),  # Tissue type
-                haplogroup,
-                # m3243_het,  # m3243_het value
-                # m3243_het_normalized,  # Normalized m3243_het
-            ])
-
-    # Create DataFrame
-    df = pd.DataFrame(data, columns=[
-        "chr", "pos", "ref", "alt", "heteroplasmy_rate", "patient_id", "sex", "age_of_onset", "age_at_sampling",
-        "tissue", "haplogroup"
-    ])
-
-    # Save to CSV
-    df.to_csv(output_file, index=False)
-    print(f"Generated {len(df)} variants for {num_patients} patients.")
-    print(f"Data saved to: {output_file}")
+# Haplogroup names and drawing probabilities (weighted by their counts)
+haplogroup_names = np.array([hg for hg, _ in haplogroups])
+haplogroup_probabilities = np.array([count for _, count in haplogroups], dtype=float)
+haplogroup_probabilities /= haplogroup_probabilities.sum()
+
+GENOME_LENGTH = 16569  # Length of the mitochondrial genome (rCRS)
+NUCLEOTIDES = np.array(["A", "T", "C", "G"])
+
+CSV_COLUMNS = [
+    "chr", "pos", "ref", "alt", "heteroplasmy_rate", "patient_id", "sex", "age_of_onset", "age_at_sampling",
+    "tissue", "haplogroup"
+]
+
+# HPO terms of the m.3243A>G phenotypes (MELAS, MIDD, ...), drawn for the JSON patients
+m3243_hpo_terms = [
+    ("HP:0001250", "Seizure"), ("HP:0002401", "Stroke-like episode"), ("HP:0000365", "Hearing impairment"),
+    ("HP:0000819", "Diabetes mellitus"), ("HP:0003128", "Lactic acidosis"), ("HP:0001324", "Muscle weakness"),
+    ("HP:0000590", "Progressive external ophthalmoplegia"), ("HP:0001638", "Cardiomyopathy"),
+    ("HP:0001251", "Ataxia"), ("HP:0002076", "Migraine"), ("HP:0001508", "Failure to thrive"),
+    ("HP:0000648", "Optic atrophy")
+]
+
+
+def generating_patients(rng, first_patient, num_patients, min_variants, max_variants):
+    """
+    Draws the information of a chunk of patients at once.
+
+    :param rng: numpy random Generator.
+    :param first_patient: Number of the first patient of the chunk (patients are numbered from 1).
+    :param num_patients: Number of patients of the chunk.
+    :param min_variants: Minimum variants per patient.
+    :param max_variants: Maximum variants per patient.
+    :return: Dictionary of patient columns (numpy arrays) and the number of variants of each patient.
+    """
+    numbers = np.arange(first_patient, first_patient + num_patients)
+    age_of_onset = rng.integers(1, 81, num_patients)
+
+    patients = {
+        "patient_id": np.char.add("PAT", np.char.zfill(numbers.astype(str), 3)),
+        "sex": rng.choice(["M", "F"], num_patients),
+        "age_of_onset": age_of_onset,
+        "age_at_sampling": rng.integers(age_of_onset, 91),  # Ensure logical consistency
+        # Weighted haplogroup with 4 random digits appended
+        "haplogroup": np.char.add(rng.choice(haplogroup_names, num_patients, p=haplogroup_probabilities),
+                                  rng.integers(1000, 10000, num_patients).astype(str)),
+    }
+
+    # Random number of variants per patient
+    num_variants = rng.integers(min_variants, max_variants + 1, num_patients)
+
+    return patients, num_variants
+
+
+def generating_csv_chunk(rng, patients, num_variants):
+    """
+    Draws the variants of a chunk of patients as rows of the flat control CSV.
+
+    :param rng: numpy random Generator.
+    :param patients: Patient columns (see generating_patients).
+    :param num_variants: Number of variants of each patient.
+    :return: pandas DataFrame with the CSV_COLUMNS columns.
+    """
+    total = int(num_variants.sum())
+    owner = np.repeat(np.arange(len(num_variants)), num_variants)  # Patient of each variant
+
+    # No need of m3243 heteroplasmy as they are controls
+    chunk = {
+        "chr": np.full(total, "chrMT"),  # Mitochondrial chromosome
+        "pos": rng.integers(1, GENOME_LENGTH + 1, total),  # Position of variant
+        "ref": rng.choice(NUCLEOTIDES, total),  # Reference allele
+        "alt": rng.choice(NUCLEOTIDES, total),  # Alternate allele
+        "heteroplasmy_rate": np.round(rng.uniform(0, 1, total), 3),  # Heteroplasmy rate
+    }
+    for column in ["patient_id", "sex", "age_of_onset", "age_at_sampling"]:
+        chunk[column] = patients[column][owner]
+    chunk["tissue"] = rng.choice(["Blood", "Urine"], total)  # Tissue type
+    chunk["haplogroup"] = patients["haplogroup"][owner]
+
+    return pd.DataFrame(chunk, columns=CSV_COLUMNS)
+
+
+def generating_json_chunk(rng, patients, num_variants, m3243_het_min, m3243_het_max, m3243_fraction):
+    """
+    Draws a chunk of patients as pipeline input JSON (Clinical, Sample, Ontology and Catalog sections).
+
+    Catalog heteroplasmy rates are on the 0-100 scale of the pipeline inputs, and the alternative allele
+    always differs from the reference allele.
+
+    :param rng: numpy random Generator.
+    :param patients: Patient columns (see generating_patients).
+    :param num_variants: Number of variants of each patient (A3243G excluded).
+    :param m3243_het_min: Minimum A3243G heteroplasmy rate (0-100).
+    :param m3243_het_max: Maximum A3243G heteroplasmy rate (0-100).
+    :param m3243_fraction: Fraction of the patients carrying A3243G.
+    :return: List of (patient_id, patient data) tuples.
+    """
+    num_patients = len(num_variants)
+    total = int(num_variants.sum())
+    offsets = np.concatenate(([0], np.cumsum(num_variants))).tolist()
+
+    # Variants of the whole chunk
+    positions = rng.integers(1, GENOME_LENGTH + 1, total)
+    reference = rng.integers(0, 4, total)
+    alternative = (reference + rng.integers(1, 4, total)) % 4  # Substitutions only
+    heteroplasmy = np.round(rng.uniform(0, 100, total), 2)
+
+    positions, heteroplasmy = positions.tolist(), heteroplasmy.tolist()
+    reference, alternative = NUCLEOTIDES[reference].tolist(), NUCLEOTIDES[alternative].tolist()
+
+    # Patient information of the whole chunk
+    carrier = (rng.random(num_patients) < m3243_fraction).tolist()
+    m3243_het = np.round(rng.uniform(m3243_het_min, m3243_het_max, num_patients), 2).tolist()
+    tissue = rng.choice(["Blood", "Urine"], num_patients).tolist()
+    num_hpo = rng.integers(1, 5, num_patients).tolist()
+    hpo_draws = rng.random((num_patients, len(m3243_hpo_terms))).argsort(axis=1).tolist()
+
+    columns = {column: values.tolist() for column, values in patients.items()}
+
+    json_patients = []
+    for i in range(num_patients):
+        catalog = []
+        if carrier[i]:
+            catalog.append({"chr": "chrM", "pos": 3243, "ref": "A", "alt": "G", "heteroplasmy_rate": m3243_het[i]})
+        for j in range(offsets[i], offsets[i + 1]):
+            catalog.append({"chr": "chrM", "pos": positions[j], "ref": reference[j], "alt": alternative[j],
+                            "heteroplasmy_rate": heteroplasmy[j]})
+
+        patient_id = columns["patient_id"][i]
+        json_patients.append((patient_id, {
+            "Clinical": {"patient_id": patient_id, "sex": columns["sex"][i],
+                         "age_of_onset": columns["age_of_onset"][i]},
+            "Sample": {"age_at_sampling": columns["age_at_sampling"][i], "tissue": tissue[i], "type": "DNA",
+                       "haplogroup": columns["haplogroup"][i]},
+            "Ontology": {"hpo": dict(m3243_hpo_terms[k] for k in hpo_draws[i][:num_hpo[i]])},
+            "Catalog": catalog,
+        }))
+
+    return json_patients
+
+
+def generate_patient_data(num_patients, min_variants, max_variants, output_file, seed=None, chunk_size=10000,
+                          json_folder=None, m3243_het_min=5, m3243_het_max=90, m3243_fraction=1.0):
+    """
+    Generates the random cohort chunk by chunk, so that the memory used does not depend on the cohort size.
+
+    The same seed and chunk size always generate the same cohort.
+
+    :param num_patients: Number of patients.
+    :param min_variants: Minimum variants per patient.
+    :param max_variants: Maximum variants per patient.
+    :param output_file: Output CSV file, or None to only write the JSON files.
+    :param seed: Seed of the random generator (None for a random cohort).
+    :param chunk_size: Number of patients generated at once.
+    :param json_folder: If given, one pipeline input JSON per patient is written in this folder.
+    :param m3243_het_min: Minimum A3243G heteroplasmy rate of the JSON patients (0-100).
+    :param m3243_het_max: Maximum A3243G heteroplasmy rate of the JSON patients (0-100).
+    :param m3243_fraction: Fraction of the JSON patients carrying A3243G.
+    """
+    rng = np.random.default_rng(seed)
+
+    if json_folder:
+        os.makedirs(json_folder, exist_ok=True)
+
+    fh_csv = open(output_file, "w", newline="") if output_file else None
+    num_rows = 0
+
+    try:
+        for first_patient in range(1, num_patients + 1, chunk_size):
+            patients, num_variants = generating_patients(
+                rng, first_patient, min(chunk_size, num_patients + 1 - first_patient), min_variants, max_variants
+            )
+
+            if fh_csv:
+                df = generating_csv_chunk(rng, patients, num_variants)
+                df.to_csv(fh_csv, index=False, header=(first_patient == 1))
+                num_rows += len(df)
+
+            if json_folder:
+                for patient_id, patient_data in generating_json_chunk(rng, patients, num_variants, m3243_het_min,
+                                                                      m3243_het_max, m3243_fraction):
+                    with open(os.path.join(json_folder, f"{patient_id}.json"), "w") as fh_json:
+                        json.dump(patient_data, fh_json)
+    finally:
+        if fh_csv:
+            fh_csv.close()
+
+    if output_file:
+        print(f"Generated {num_rows} variants for {num_patients} patients.")
+        print(f"Data saved to: {output_file}")
+    if json_folder:
+        print(f"{num_patients} patient JSON files saved to: {json_folder}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate random patient variant data.")
-    
+
     parser.add_argument("--num_patients", type=int, default=100, help="Number of patients (default: 100)")
     parser.add_argument("--min_variants", type=int, default=30, help="Minimum variants per patient (default: 30)")
     parser.add_argument("--max_variants", type=int, default=50, help="Maximum variants per patient (default: 50)")
     parser.add_argument("--output", type=str, default="patients_random_variants.csv", help="Output CSV file name (default: patients_random_variants.csv)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random generator (default: random)")
+    parser.add_argument("--chunk_size", type=int, default=10000, help="Number of patients generated at once (default: 10000)")
+    parser.add_argument("--json_dir", type=str, default=None, help="Also write one pipeline input JSON per patient in this folder")
+    parser.add_argument("--no_csv", action="store_true", help="Do not write the CSV file (with --json_dir)")
+    parser.add_argument("--m3243_het_min", type=float, default=5, help="Minimum A3243G heteroplasmy rate of the JSON patients, 0-100 (default: 5)")
+    parser.add_argument("--m3243_het_max", type=float, default=90, help="Maximum A3243G heteroplasmy rate of the JSON patients, 0-100 (default: 90)")
+    parser.add_argument("--m3243_fraction", type=float, default=1.0, help="Fraction of the JSON patients carrying A3243G (default: 1.0)")
 
     args = parser.parse_args()
-    
-    generate_patient_data(args.num_patients, args.min_variants, args.max_variants, args.output)
\ No newline at end of file
+
+    if args.min_variants > args.max_variants:
+        parser.error("--min_variants must not be greater than --max_variants")
+    if args.chunk_size < 1:
+        parser.error("--chunk_size must be at least 1")
+    if not 0 <= args.m3243_het_min <= args.m3243_het_max <= 100:
+        parser.error("the A3243G heteroplasmy range must be within 0-100")
+    if args.no_csv and not args.json_dir:
+        parser.error("--no_csv requires --json_dir")
+
+    generate_patient_data(args.num_patients, args.min_variants, args.max_variants,
+                          None if args.no_csv else args.output, seed=args.seed, chunk_size=args.chunk_size,
+                          json_folder=args.json_dir, m3243_het_min=args.m3243_het_min,
+                          m3243_het_max=args.m3243_het_max, m3243_fraction=args.m3243_fraction)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the clinical table grouping (generation_clinical_table.getting_one_row_by_patient).
+
+Builds a synthetic per-file patient information dictionary where a share of the patients have
+several samples, then times the single-pass grouping and checks the multi-sample merge.
+
+Usage:
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_clinical_table.py --samples 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from generation_clinical_table import getting_one_row_by_patient
+
+
+def generating_patient_information(num_samples, multi_sample_rate, seed):
+    """
+    Generates a synthetic { file_name: patient_info } dictionary.
+
+    :param num_samples: Number of samples (files) to generate.
+    :param multi_sample_rate: Share of the samples that belong to a patient having another sample.
+    :param seed: Seed of the random generator.
+    :return: Dictionary { file_name: patient_info } as built by filtering_global_variant.
+    """
+    rng = random.Random(seed)
+    unique_patient_information = {}
+    patient_count = 0
+
+    for sample in range(num_samples):
+        # Either a second sample of an existing patient, or a new patient
+        if patient_count and rng.random() < multi_sample_rate:
+            patient_id = f"PAT{rng.randrange(patient_count):06d}"
+        else:
+            patient_id = f"PAT{patient_count:06d}"
+            patient_count += 1
+
+        unique_patient_information[f"sample_{sample:06d}"] = [
+            patient_id, rng.choice(["M", "F"]), rng.randint(1, 80), rng.randint(1, 90),
+            rng.choice(["blood", "urine", "muscle"]), "DNA", rng.choice(["H1", "U5", "J2"]),
+            round(rng.uniform(0, 100), 2), round(rng.uniform(0, 100), 2),
+        ]
+
+    return unique_patient_information
+
+
+def main(num_samples, multi_sample_rate, seed):
+    unique_patient_information = generating_patient_information(num_samples, multi_sample_rate, seed)
+
+    start = time.perf_counter()
+    one_patient_by_row = getting_one_row_by_patient(unique_patient_information)
+    elapsed = time.perf_counter() - start
+
+    # Every sample must end up in exactly one patient row
+    assert len(one_patient_by_row) == len({info[0] for info in unique_patient_information.values()})
+
+    print(f"{num_samples} samples -> {len(one_patient_by_row)} patients grouped in {elapsed:.3f} s "
+          f"({num_samples / elapsed:,.0f} samples/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the clinical table grouping.')
+    parser.add_argument('--samples', type=int, default=100000, help='Number of samples (default: 100000)')
+    parser.add_argument('--multi-sample-rate', type=float, default=0.1,
+                        help='Share of samples belonging to a patient with several samples (default: 0.1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+
+    args = parser.parse_args()
+    main(args.samples, args.multi_sample_rate, args.seed)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the cohort index: build time of the inverted indexes of a synthetic cohort and latency of the
+carrier, co-occurrence and phenotype queries on the memory-mapped index, against a scan of the variant table.
+
+Usage:
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_cohort_index.py --samples 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from variant_table import VariantColumns, VariantTable
+from cohort_index import writing_cohort_index, load_cohort_index
+
+
+def generating_cohort(num_samples, num_variants, num_hpo, seed):
+    """
+    Generates a cohort whose variants are drawn from a pool of common variants.
+
+    :return: Tuple (VariantTable, HPO result { patient_id: [(hpo_id, hpo_name), ...] }).
+    """
+    rng = random.Random(seed)
+    pool = [(rng.randint(1, 16569), rng.choice("ACGT"), rng.choice("ACGT")) for _ in range(num_variants * 100)]
+    pool.append((3243, "A", "G"))
+    hpo_terms = [(f"HP_{number:07d}", f"name_HP_{number:07d}") for number in range(num_hpo)]
+
+    table = VariantTable()
+    hpo_result = {}
+    for sample in range(num_samples):
+        patient_id = f"PAT{sample:06d}"
+        metadata = [patient_id, "F", 30, 35, "blood", "DNA", "H1", 20.0, 25.0]
+        variants = VariantColumns()
+        for pos, ref, alt in rng.sample(pool, num_variants):
+            variants.adding_variant("chrM", pos, ref, alt, round(rng.uniform(0, 100), 2))
+        table.add_patient(f"/input/{patient_id}", variants, metadata)
+        hpo_result[patient_id] = rng.sample(hpo_terms, rng.randint(1, 5))
+    return table, hpo_result
+
+
+def timing(function, repeat=20):
+    """
+    Returns the result of a function and its median time over several calls, in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, float(np.median(times)) * 1000
+
+
+def main(num_samples, num_variants, num_hpo, seed):
+    table, hpo_result = generating_cohort(num_samples, num_variants, num_hpo, seed)
+    print(f"{num_samples} samples x {num_variants} variants, {num_hpo} HPO terms:")
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        start = time.perf_counter()
+        writing_cohort_index(table, hpo_result, output_folder, "/input")
+        print(f"  index built and written in {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        index = load_cohort_index(output_folder)
+        print(f"  index loaded in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        columns = table.columns()
+        alleles = table.vocabularies["allele"]
+        scan = lambda: np.unique(columns["patient_index"][(columns["pos"] == 3243) & (columns["ref"] == alleles["A"])
+                                                          & (columns["alt"] == alleles["G"])
+                                                          & (columns["heteroplasmy_rate"] >= 20)])
+
+        label = str(index.variant_labels[len(index.variant_labels) // 2])
+        samples, elapsed = timing(lambda: index.carriers("A3243G", min_het=20)[0])
+        _, scan_elapsed = timing(scan, repeat=3)
+        print(f"  carriers of A3243G >= 20%: {len(samples)} samples in {elapsed:.3f} ms "
+              f"(column scan: {scan_elapsed:.1f} ms)")
+        samples, elapsed = timing(lambda: index.co_carriers(["A3243G", label]))
+        print(f"  co-occurrence A3243G + {label}: {len(samples)} samples in {elapsed:.3f} ms")
+        patients, elapsed = timing(lambda: index.phenotype_patients(["HP_0000001", "HP_0000002"]))
+        print(f"  phenotype HP_0000001 + HP_0000002: {len(patients)} patients in {elapsed:.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the cohort index queries.')
+    parser.add_argument('--samples', type=int, default=100000, help='Number of samples (default: 100000)')
+    parser.add_argument('--variants', type=int, default=30, help='Number of variants per sample (default: 30)')
+    parser.add_argument('--hpo', type=int, default=200, help='Number of distinct HPO terms (default: 200)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+
+    args = parser.parse_args()
+    main(args.samples, args.variants, args.hpo, args.seed)
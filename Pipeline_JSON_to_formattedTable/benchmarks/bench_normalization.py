@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the m3243 heteroplasmy normalization: scalar per-variant path
+(variants_unique_format.blood/urine_m3243_normalization) against the batch engine
+(heteroplasmy_normalization.normalize_heteroplasmy_batch), and check that both agree.
+
+Usage:
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_normalization.py --variants 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+import numpy as np
+
+from heteroplasmy_normalization import normalize_heteroplasmy_batch
+from variants_unique_format import normalize_heteroplasmy
+
+
+def generating_columns(num_variants, seed):
+    """
+    Generates synthetic heteroplasmy, age, sex and tissue columns, including the 0% and 100% edge cases.
+
+    :param num_variants: Number of values to generate.
+    :param seed: Seed of the random generator.
+    :return: Tuple (heteroplasmy, age, sex, tissue) of lists.
+    """
+    rng = random.Random(seed)
+    heteroplasmy = [rng.choice([0.0, 100.0, round(rng.uniform(0, 100), 2)]) for _ in range(num_variants)]
+    age = [rng.randint(0, 90) for _ in range(num_variants)]
+    sex = [rng.choice(["M", "F"]) for _ in range(num_variants)]
+    tissue = [rng.choice(["blood", "urine", "muscle"]) for _ in range(num_variants)]
+    return heteroplasmy, age, sex, tissue
+
+
+def main(num_variants, normalization_status, seed):
+    heteroplasmy, age, sex, tissue = generating_columns(num_variants, seed)
+
+    start = time.perf_counter()
+    scalar = [normalize_heteroplasmy([None, None, None, None, het], [s, a, t], normalization_status)
+              for het, a, s, t in zip(heteroplasmy, age, sex, tissue)]
+    scalar_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = normalize_heteroplasmy_batch(heteroplasmy, age, sex, tissue, normalization_status)
+    batch_elapsed = time.perf_counter() - start
+
+    # Both paths must give the same values
+    assert np.array_equal(np.asarray(scalar), batch)
+
+    print(f"{num_variants} values ('{normalization_status}'): scalar {scalar_elapsed:.3f} s, "
+          f"batch {batch_elapsed:.3f} s ({scalar_elapsed / batch_elapsed:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the heteroplasmy normalization.')
+    parser.add_argument('--variants', type=int, default=1000000, help='Number of values (default: 1000000)')
+    parser.add_argument('--norm-status', default='yes', choices=['yes', 'no', 'blood', 'urine'],
+                        help='Normalization status (default: yes)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+
+    args = parser.parse_args()
+    main(args.variants, args.norm_status, args.seed)
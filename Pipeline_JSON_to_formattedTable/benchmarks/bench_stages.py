@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+"""
+Stage-level benchmark of the pipeline with cohort-size scaling curves.
+
+Generates synthetic cohorts (1k, 10k and 100k patients by default) and times each stage on its own:
+verification, HPO lookup, variant structuring, presence/absence table, CSV writing and clinical table.
+Each stage is run a second time under tracemalloc to measure the peak memory it allocates (this run is
+several times slower than the timed one, --no-memory skips it).
+
+The results are written as JSON. The time of each stage is fitted against the cohort size on a log-log
+scale: a stage whose exponent exceeds --superlinear-threshold is flagged as superlinear. Passing a
+previous results file with --baseline compares both runs and flags the regressions.
+
+Usage:
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_stages.py --output bench_stages.json
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_stages.py --sizes 1000,10000 --baseline bench_stages.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from JSON_verification import verify_patient_record
+from HPO_index import HPOIndex
+from HPO_terms_infile_research import research_HPO_from_data
+from HPO_unique_csv import hpo_standard_output_file
+from variants_unique_format import concatenation_sample_from_data
+from variant_table import VariantTable
+from variant_generation_csv import generate_variant_csv
+from generate_absence_presence_HPO import main_generation_absence_presence_hpo
+from generation_clinical_table import generation_clinical_table_from_information
+
+STAGES = ["verification", "hpo_lookup", "variant_structuring", "presence_absence", "csv_writing", "clinical_table"]
+
+RESULTS_VERSION = 1  # Bump when the layout of the results file changes
+
+
+def generating_hpo_index(num_terms):
+    """
+    Generates a synthetic HPO index.
+
+    :param num_terms: Number of HPO terms.
+    :return: HPOIndex.
+    """
+    return HPOIndex({f"HP_{term:07d}": f"Phenotype {term}" for term in range(num_terms)})
+
+
+def generating_cohort(num_patients, num_variants, num_terms, seed):
+    """
+    Generates synthetic patient records as load_json returns them.
+
+    Every patient carries A3243G; the other variants are random substitutions, and 1% of the HPO terms
+    are absent from the HPO index.
+
+    :param num_patients: Number of patients.
+    :param num_variants: Average number of variants per patient.
+    :param num_terms: Number of HPO terms of the HPO index.
+    :param seed: Seed of the random generator.
+    :return: List of (input path, patient record) tuples.
+    """
+    rng = random.Random(seed)
+    cohort = []
+
+    for patient in range(num_patients):
+        patient_id = f"PAT{patient:06d}"
+
+        catalog = [{"chr": "chrM", "pos": 3243, "ref": "A", "alt": "G",
+                    "heteroplasmy_rate": round(rng.uniform(5, 90), 2)}]
+        for _ in range(rng.randint(num_variants // 2, num_variants * 3 // 2)):
+            catalog.append({"chr": "chrM", "pos": rng.randint(1, 16569), "ref": rng.choice("ACGT"),
+                            "alt": rng.choice("ACGT"), "heteroplasmy_rate": round(rng.uniform(0, 100), 2)})
+
+        hpo = {f"HP:{rng.randrange(num_terms * 101 // 100):07d}": "" for _ in range(rng.randint(1, 6))}
+
+        cohort.append((f"bench/{patient_id}.json", {
+            "Clinical": {"patient_id": patient_id, "sex": rng.choice("MF"), "age_of_onset": rng.randint(1, 80)},
+            "Sample": {"age_at_sampling": rng.randint(1, 90), "tissue": rng.choice(["Blood", "urines", "muscle"]),
+                       "type": "DNA", "haplogroup": rng.choice(["H1", "U5", "J2"])},
+            "Ontology": {"hpo": hpo},
+            "Catalog": catalog,
+        }))
+
+    return cohort
+
+
+def running_stages(cohort, hpo_index, output_folder, input_variants, het_treshold, normalization_status, tracing):
+    """
+    Runs the pipeline stages one after the other, measuring each of them.
+
+    :param cohort: List of (input path, patient record) tuples.
+    :param hpo_index: HPOIndex.
+    :param output_folder: Folder of the written tables.
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode.
+    :param tracing: If True, the peak memory allocated by each stage is measured (tracemalloc must be started).
+    :return: Dictionary { stage: measures }.
+    """
+    measures = {}
+
+    def measuring(stage, function):
+        if tracing:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        value = function()
+        measure = {"seconds": time.perf_counter() - start_wall, "cpu_seconds": time.process_time() - start_cpu}
+
+        if tracing:
+            measure["peak_bytes"] = tracemalloc.get_traced_memory()[1] - start_memory
+        measures[stage] = measure
+        return value
+
+    def verifying():
+        return [(path, data) for path, data in cohort
+                if verify_patient_record(data, path, input_variants, het_treshold)[0]]
+
+    def looking_up_hpo():
+        hpo_result = {}
+        for _, data in verified:
+            hpo_result.update(research_HPO_from_data(data, hpo_index))
+        return hpo_result
+
+    def structuring_variants():
+        table = VariantTable()
+        for path, data in verified:
+            table.add_variants(*concatenation_sample_from_data(path, data, het_treshold, input_variants,
+                                                               normalization_status))
+        return table
+
+    def writing_csv():
+        generate_variant_csv(variant_table, os.path.join(output_folder, "concatenate_variants.csv"))
+        hpo_standard_output_file(hpo_result, os.path.join(output_folder, "concatenate_HPO.csv"))
+
+    verified = measuring("verification", verifying)
+    hpo_result = measuring("hpo_lookup", looking_up_hpo)
+    variant_table = measuring("variant_structuring", structuring_variants)
+    measuring("presence_absence", lambda: main_generation_absence_presence_hpo(hpo_result, output_folder))
+    measuring("csv_writing", writing_csv)
+    measuring("clinical_table", lambda: generation_clinical_table_from_information(
+        variant_table.patient_information(), output_folder))
+
+    for measure in measures.values():
+        measure["patients_per_second"] = len(cohort) / measure["seconds"] if measure["seconds"] else None
+    measures["variant_structuring"]["variants"] = len(variant_table.pos)
+
+    return measures
+
+
+def fitting_scaling_exponents(results, superlinear_threshold):
+    """
+    Fits time = a * size ** exponent for every stage (least squares on the log-log scale).
+
+    :param results: Dictionary { size: { stage: measures } }.
+    :param superlinear_threshold: Exponent above which a stage is flagged as superlinear.
+    :return: Dictionary { stage: { "exponent", "superlinear" } }, empty with less than two sizes.
+    """
+    sizes = sorted(results, key=int)
+    if len(sizes) < 2:
+        return {}
+
+    scaling = {}
+    for stage in STAGES:
+        seconds = [max(results[size][stage]["seconds"], 1e-9) for size in sizes]
+        exponent = float(np.polyfit(np.log([int(size) for size in sizes]), np.log(seconds), 1)[0])
+        scaling[stage] = {"exponent": round(exponent, 3), "superlinear": exponent > superlinear_threshold}
+
+    return scaling
+
+
+def comparing_to_baseline(results, baseline, tolerance, min_seconds):
+    """
+    Compares the stage times to a baseline run.
+
+    :param results: Dictionary { size: { stage: measures } } of this run.
+    :param baseline: Results file of the baseline run.
+    :param tolerance: Relative slowdown above which a stage is flagged as a regression (0.2 = 20% slower).
+    :param min_seconds: Stages faster than this in both runs are never flagged (timer noise).
+    :return: List of { "size", "stage", "seconds", "baseline_seconds", "ratio", "regression" }.
+    """
+    comparison = []
+    for size, stages in results.items():
+        for stage, measure in stages.items():
+            baseline_measure = baseline.get("results", {}).get(size, {}).get(stage)
+            if not baseline_measure or not baseline_measure["seconds"]:
+                continue
+
+            ratio = measure["seconds"] / baseline_measure["seconds"]
+            comparison.append({"size": size, "stage": stage, "seconds": measure["seconds"],
+                               "baseline_seconds": baseline_measure["seconds"], "ratio": round(ratio, 3),
+                               "regression": ratio > 1 + tolerance and measure["seconds"] >= min_seconds})
+    return comparison
+
+
+def printing_results(results, scaling, comparison):
+    """
+    Prints the measures, scaling exponents and baseline comparison.
+    """
+    for size, stages in results.items():
+        print(f"\n{int(size):,} patients:")
+        for stage, measure in stages.items():
+            memory = f"  peak {measure['peak_bytes'] / 2 ** 20:8.1f} MiB" if "peak_bytes" in measure else ""
+            print(f"  {stage:<20} {measure['seconds']:9.3f} s  cpu {measure['cpu_seconds']:9.3f} s{memory}"
+                  f"  {measure['patients_per_second'] or 0:12,.0f} patients/s")
+
+    if scaling:
+        print("\nScaling exponents (time ~ size ** exponent):")
+        for stage, fit in scaling.items():
+            print(f"  {stage:<20} {fit['exponent']:6.2f}{'  SUPERLINEAR' if fit['superlinear'] else ''}")
+
+    if comparison:
+        print("\nComparison to the baseline:")
+        for row in comparison:
+            print(f"  {int(row['size']):>9,} {row['stage']:<20} {row['baseline_seconds']:9.3f} s -> "
+                  f"{row['seconds']:9.3f} s  x{row['ratio']:.2f}{'  REGRESSION' if row['regression'] else ''}")
+
+
+def main(sizes, num_variants, num_terms, input_variants, het_treshold, normalization_status, seed, memory,
+         output_path, baseline_path, tolerance, min_seconds, superlinear_threshold):
+    # The stages log like in a pipeline run, to a process.log of the temporary output folder
+    output_folder = tempfile.mkdtemp(prefix="bench_stages_")
+    logging.basicConfig(filename=os.path.join(output_folder, "process.log"), level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    hpo_index = generating_hpo_index(num_terms)
+    results = {}
+
+    for size in sizes:
+        cohort = generating_cohort(size, num_variants, num_terms, seed)
+        measures = running_stages(cohort, hpo_index, output_folder, input_variants, het_treshold,
+                                  normalization_status, tracing=False)
+
+        # Memory is measured in a separate run, tracemalloc slowing the stages down
+        if memory:
+            tracemalloc.start()
+            traced = running_stages(cohort, hpo_index, output_folder, input_variants, het_treshold,
+                                    normalization_status, tracing=True)
+            tracemalloc.stop()
+            for stage, measure in measures.items():
+                measure["peak_bytes"] = traced[stage]["peak_bytes"]
+
+        results[str(size)] = measures
+        del cohort
+
+    scaling = fitting_scaling_exponents(results, superlinear_threshold)
+
+    comparison = []
+    if baseline_path:
+        with open(baseline_path, "r") as fh:
+            comparison = comparing_to_baseline(results, json.load(fh), tolerance, min_seconds)
+
+    printing_results(results, scaling, comparison)
+
+    logging.shutdown()
+    shutil.rmtree(output_folder, ignore_errors=True)
+
+    if output_path:
+        report = {
+            "version": RESULTS_VERSION,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                         "system": platform.system(), "cpu_count": os.cpu_count()},
+            "parameters": {"variants": num_variants, "hpo_terms": num_terms, "input_variants": input_variants,
+                           "het_treshold": het_treshold, "norm_status": normalization_status, "seed": seed},
+            "results": results,
+            "scaling": scaling,
+            "comparison": comparison,
+        }
+        with open(output_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResults saved to: {output_path}")
+
+    return any(row["regression"] for row in comparison)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stage-level benchmark of the pipeline with scaling curves.')
+    parser.add_argument('--sizes', type=str, default="1000,10000,100000",
+                        help='Comma-separated cohort sizes, in patients (default: 1000,10000,100000)')
+    parser.add_argument('--variants', type=int, default=20,
+                        help='Average number of variants per patient (default: 20)')
+    parser.add_argument('--hpo-terms', type=int, default=500, help='Number of HPO terms (default: 500)')
+    parser.add_argument('--invariants', type=str, default="A3243G", help='Requested variants (default: A3243G)')
+    parser.add_argument('--het-treshold', type=float, default=1, help='Heteroplasmy threshold (default: 1)')
+    parser.add_argument('--norm-status', type=str, default="yes", help='Normalization mode (default: yes)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run of the stages')
+    parser.add_argument('--output', type=str, default="bench_stages.json",
+                        help='Results JSON file (default: bench_stages.json)')
+    parser.add_argument('--baseline', type=str, default=None, help='Results JSON file of a previous run to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression (default: 0.2)')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Stages faster than this are not flagged as regressions (default: 0.05)')
+    parser.add_argument('--superlinear-threshold', type=float, default=1.2,
+                        help='Scaling exponent above which a stage is flagged as superlinear (default: 1.2)')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 if a stage regressed against the baseline')
+
+    args = parser.parse_args()
+    try:
+        sizes = sorted({int(size) for size in args.sizes.split(",") if size})
+    except ValueError:
+        parser.error(f"Invalid --sizes '{args.sizes}'")
+
+    regression = main(sizes, args.variants, args.hpo_terms, args.invariants, args.het_treshold, args.norm_status,
+                      args.seed, not args.no_memory, args.output, args.baseline, args.tolerance, args.min_seconds,
+                      args.superlinear_threshold)
+    sys.exit(1 if regression and args.fail_on_regression else 0)
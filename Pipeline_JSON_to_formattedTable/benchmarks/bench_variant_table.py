@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the in-memory variant storage: peak memory of the per-file dictionary of denormalized
+rows { file_name: [variant + patient metadata] } against the compact variant_table.VariantTable.
+
+Usage:
+    python3 Pipeline_JSON_to_formattedTable/benchmarks/bench_variant_table.py --samples 2000 --variants 1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from variant_table import VariantColumns, VariantTable
+
+
+def generating_sample(sample, num_variants, rng):
+    """
+    Generates the variants and the patient metadata of one sample.
+
+    :param sample: Sample number.
+    :param num_variants: Number of variants of the sample.
+    :param rng: Random generator.
+    :return: Tuple (list of variants [chr, pos, ref, alt, het], patient metadata).
+    """
+    kept_elements = [f"PAT{sample:06d}", rng.choice(["M", "F"]), rng.randint(1, 80), rng.randint(1, 90),
+                     rng.choice(["blood", "urine", "muscle"]), "DNA", rng.choice(["H1", "U5", "J2"]),
+                     round(rng.uniform(0, 100), 2), round(rng.uniform(0, 100), 2)]
+
+    return [["chrM", rng.randint(1, 16569), rng.choice("ACGT"), rng.choice("ACGT"), round(rng.uniform(0, 100), 2)]
+            for _ in range(num_variants)], kept_elements
+
+
+def measuring(num_samples, num_variants, seed, compact):
+    """
+    Builds the cohort storage sample by sample, as main.update_global_variant does: denormalized rows in a
+    dictionary, or the typed columns returned by the workers (see variants_unique_format) added to a VariantTable.
+
+    :return: Tuple (peak memory in bytes, elapsed seconds).
+    """
+    rng = random.Random(seed)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    storage = VariantTable() if compact else {}
+    for sample in range(num_samples):
+        file_name = f"sample_{sample:06d}"
+        variants, kept_elements = generating_sample(sample, num_variants, rng)
+        if compact:
+            columns = VariantColumns()
+            for variant in variants:
+                columns.adding_variant(*variant)
+            storage.add_patient(file_name, columns, kept_elements)
+        else:
+            storage[file_name] = [variant + kept_elements for variant in variants]
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak, elapsed
+
+
+def main(num_samples, num_variants, seed):
+    dict_peak, dict_elapsed = measuring(num_samples, num_variants, seed, compact=False)
+    table_peak, table_elapsed = measuring(num_samples, num_variants, seed, compact=True)
+
+    print(f"{num_samples} samples x {num_variants} variants:")
+    print(f"  dictionary of rows: peak {dict_peak / 2 ** 20:,.1f} MiB ({dict_elapsed:.2f} s)")
+    print(f"  VariantTable:       peak {table_peak / 2 ** 20:,.1f} MiB ({table_elapsed:.2f} s)"
+          f" -> {dict_peak / table_peak:.1f}x less memory")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the in-memory variant storage.')
+    parser.add_argument('--samples', type=int, default=2000, help='Number of samples (default: 2000)')
+    parser.add_argument('--variants', type=int, default=1000, help='Number of variants per sample (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+
+    args = parser.parse_args()
+    main(args.samples, args.variants, args.seed)
@@ -11,20 +11,39 @@ This pipeline:
 - Generates clinical summary tables and structured CSV files.
 
 Modules used:
+- patient_record: Parses each patient JSON once and runs the per-patient stages on it.
+- patient_executor: Runs the per-patient stages serially or in a bounded process pool.
+- streaming_output: Writes the concatenated variant file patient by patient (streaming mode).
+- columnar_output: Writes the variant and clinical tables as typed Parquet/Arrow files.
+- manifest_cache: Caches per-patient results so re-runs only process new or changed files.
 - JSON_verification: Checks and validates JSON structure.
-- HPO_terms_API_request: Queries HPO terms via an API.
+- HPO_terms_API_request: Queries HPO terms via an API (deduplicated, concurrent and cached lookups).
+- HPO_index: Loads the HPO ontology once per run, with an on-disk cache.
+- HPO_ontology: Builds the ancestor closure of the HPO terms as cached bitsets, to propagate the patients' terms.
 - HPO_terms_infile_research: Extracts HPO terms from local files.
 - HPO_unique_csv: Standardizes HPO data output.
 - Pipeline_JSON_to_formattedTable.pipeline.variants_unique_format: Processes variant data.
 - Pipeline_JSON_to_formattedTable.pipeline.variant_generation_csv: Generates variant CSV outputs.
+- variant_table: Holds the cohort variants as typed columns plus a patient table (compact in memory).
+- variant_key: Integer keys of the variants, used to match the requested variants.
+- variant_annotation: Annotates the variants (locus, strand, APOGEE scores) from a position-indexed array.
+- variant_filter: Compiles the locus, APOGEE2 and position filters into a mask applied during extraction.
+- run_metrics: Measures every stage (time, memory, throughput) into process.log and metrics.json.
+- watch_folder: Resident mode watching the input folder, with the references and results kept in memory.
+- parameter_sweep: Evaluates several heteroplasmy thresholds and normalization modes in one pass over the files.
+- catalog_stream: Parses large patient files incrementally, keeping only the catalog variants that reach the outputs.
+- input_sources: Reads the patient records from JSON files, gzipped files, tar/zip archives and NDJSON bundles.
+- cohort_store: Bulk-loads the patients, samples, variants and HPO terms into an indexed SQLite database (upserts).
+- cohort_index: Writes the variant -> samples and HPO term -> patients inverted indexes, queried from the command line.
+- run_options: Groups the optional settings of a run and checks the modes that cannot be combined.
 - generate_absence_presence_HPO: Creates presence/absence tables for HPO terms.
 - generation_clinical_table: Generates the final clinical dataset.
 """
 
 import argparse
+from contextlib import nullcontext
 import os
 import logging
-import threading
 # import re
 import sys
 
@@ -37,16 +56,31 @@ sys.path.append(pipeline_path)
 print(f"Appending to sys.path: {pipeline_path}")
 
 
-import JSON_verification
-
 # Importing necessary functions from other modules
-from HPO_terms_API_request import HPO_requesting_process
-from HPO_terms_infile_research import main_research_HPO
+from JSON_verification import writing_verification_report, REPORT_FORMATS
+from patient_executor import PatientExecutor, iter_patient_results
+from HPO_index import load_HPO_index
+from HPO_ontology import HPOPropagation, load_HPO_ontology
+from HPO_terms_API_request import HPOAPIClient, HPO_API_URL, HPO_API_CACHE_TTL, naming_HPO_results
 from HPO_unique_csv import hpo_standard_output_file
-from variants_unique_format import main_concatenation_variants
 from variant_generation_csv import generate_variant_csv
-from generate_absence_presence_HPO import main_generation_absence_presence_hpo
-from generation_clinical_table import generation_clinical_table
+from variant_table import VariantTable
+from variant_annotation import DEFAULT_ANNOTATION_FOLDER, load_variant_annotation
+from variant_filter import building_variant_filter, parsing_position_ranges
+from generate_absence_presence_HPO import main_generation_absence_presence_hpo, PRESENCE_ABSENCE_FORMATS
+from generation_clinical_table import generation_clinical_table_from_information
+from streaming_output import StreamingOutput
+from columnar_output import OUTPUT_FORMATS, generate_variant_columnar, output_path_for_format
+from manifest_cache import PatientManifest, parameters_key, iter_incremental_results
+from run_metrics import RunMetrics
+from catalog_stream import CATALOG_STREAMING_SIZE
+from input_sources import listing_input_sources, iterating_patient_inputs
+from watch_folder import WATCH_INTERVAL, WatchedCohort, watching_input_folder
+from parameter_sweep import SweepConfiguration, sweep_configurations, parsing_sweep_thresholds, \
+    parsing_sweep_normalizations
+from cohort_store import CohortStore
+from cohort_index import writing_cohort_index
+from run_options import RunOptions
 
 
 
@@ -67,7 +101,7 @@ def setup_logger(log_file):
 
 # Global dictionaries for storing extracted HPO and variant data
 global_hpo_result = {}  # Stores HPO results per patient
-global_variant_result = {}  # Stores variant results per patient
+global_variant_result = VariantTable()  # Stores variant results per patient (compact table)
 
 
 def update_global_hpo(result):
@@ -80,38 +114,46 @@ def update_global_hpo(result):
     global_hpo_result.update(result)
 
 
-def update_global_variant(result):
+def update_global_variant(result, patient_information):
     """
     Updates the global variant result dictionary with new patient data.
 
-    :param result: Dictionary containing extracted variant information for a patient.
+    :param result: Dictionary containing extracted variant information for a patient (typed columns per file).
+    :param patient_information: Dictionary containing the patient information of the files, kept for the
+                                clinical table even when a file has no variants.
     """
     global global_variant_result
-    global_variant_result.update(result)
+    global_variant_result.add_variants(result, patient_information)
 
 
 # ------------------------------
 # MAIN PROCESSING FUNCTION
 # ------------------------------
 
-def main(input_folder, output_folder, hpo_path, input_variants, het_treshold, normalization_status=None):
+def main(input_folder, output_folder, hpo_path, input_variants, het_treshold, normalization_status=None,
+         options=None):
     """
     Main function to process JSON files, extract variant and HPO information, and generate output files.
 
     Steps:
-    1. Verify JSON file correctness.
-    2. Extract HPO terms from API/local file.
-    3. Generate presence/absence tables for HPO terms.
-    4. Extract variant data and apply filtering.
-    5. Generate final structured clinical dataset.
+    1. Load each JSON file once, verify it, then extract its HPO terms and filtered variant data.
+    2. Generate presence/absence tables for HPO terms.
+    3. Generate the structured variant file.
+    4. Generate final structured clinical dataset.
 
-    :param input_folder: Path to the input folder containing JSON files.
+    :param input_folder: Path to the input folder containing JSON files (".json" or ".json.gz"), tar/zip archives
+                         of JSON files and NDJSON bundles (see input_sources), or path to a single archive or bundle.
     :param output_folder: Path to the output folder where results will be stored.
     :param hpo_path: Path to the HPO reference file.
     :param input_variants: List of variants used for filtering, formatted as "A3243G,A73G".
     :param het_treshold: Minimum heteroplasmy threshold for variant filtering.
     :param normalization_status: Defines normalization behavior ("yes", "no", "blood", "urine").
+    :param options: RunOptions of the run (modes, execution, HPO, output and variant filter settings), the
+                    defaults of the command line if None. Modes that cannot be combined are reported in the
+                    log and nothing is processed (see run_options.RunOptions.checking_modes).
     """
+    if options is None:
+        options = RunOptions()
 
     # ------------------------------
     # STEP 0: FOLDER & LOG SETUP
@@ -128,84 +170,199 @@ def main(input_folder, output_folder, hpo_path, input_variants, het_treshold, no
     logger = logging.getLogger(__name__)
     logger.info("Starting pipeline\n################################\n")
 
+    # Time, memory and throughput of every stage, written to metrics.json at the end of the run
+    metrics = RunMetrics(output_folder, options.profile, options.workers)
+    if options.profile and options.workers > 1:
+        logger.info("Profiling covers the main process only, not the per-patient stages run by the workers.")
+
     # Validate input folder existence
-    if not os.path.isdir(input_folder):
+    if not os.path.exists(input_folder):
         logger.error(f"Input folder '{input_folder}' does not exist.")
         return
 
+    try:
+        options.checking_modes(input_folder)
+    except ValueError as e:
+        logger.error(f"Invalid options: {e}")
+        return
+
+    # Sorted so that the outputs do not depend on the directory listing order
+    source_paths = listing_input_sources(input_folder)
+
+    with metrics.stage("references"):
+        # Load the HPO ontology once, it is shared by every patient (not needed when names come from the API)
+        hpo_index = None if options.hpo_api else load_HPO_index(hpo_path, options.hpo_cache_folder,
+                                                                options.use_hpo_cache)
+
+        # Load the variant annotation array once (memory-mapped from its cache after the first run),
+        # needed by the annotation columns and by the loci, tRNA and APOGEE2 filters
+        annotation_filters = bool(options.filter_loci or options.trna_only or options.apogee2_classes)
+        variant_annotation = load_variant_annotation(options.annotation_folder) \
+            if options.annotate or annotation_filters else None
+        annotation = variant_annotation if options.annotate else None  # Annotation columns of the variant table
+
+        # Compile the extraction-time filters into a position x allele mask
+        try:
+            variant_filter = building_variant_filter(variant_annotation, options.filter_loci, options.trna_only,
+                                                     options.apogee2_classes, options.position_ranges,
+                                                     options.annotation_folder)
+        except ValueError as e:
+            logger.error(f"Invalid variant filter: {e}")
+            return
+
+        # Ancestor closure of the HPO terms, built once and cached next to the HPO file
+        hpo_propagation = None
+        if options.hpo_propagate or options.hpo_depth is not None or options.hpo_subtrees:
+            hpo_ontology = load_HPO_ontology(hpo_path, options.hpo_cache_folder, options.use_hpo_cache)
+            hpo_propagation = HPOPropagation(hpo_ontology, options.hpo_depth,
+                                             tuple(hpo.replace(":", "_") for hpo in options.hpo_subtrees or ()))
+            missing = [hpo for hpo in hpo_propagation.subtrees if hpo not in hpo_propagation.ontology.term_index]
+            if missing:
+                logger.error(f"Invalid HPO subtree: {', '.join(missing)} not found in '{hpo_path}'.")
+                return
+    if variant_filter is not None:
+        logger.info(f"Variant filter: {variant_filter.criteria} ({int(variant_filter.mask[:, :-1].sum())} "
+                    f"single nucleotide variants accepted).")
+
+    if options.watch:
+        # Resident mode: the references loaded above stay in memory while the input folder is watched
+        # and the worker processes are started once, then reused by every cycle
+        with PatientExecutor(hpo_index, input_variants, het_treshold, normalization_status, workers=options.workers,
+                             log_file=log_file, chunk_size=options.chunk_size, variant_filter=variant_filter,
+                             catalog_streaming_size=options.catalog_streaming_size) as executor:
+            cohort = WatchedCohort(output_folder, executor.results, annotation, options.output_format,
+                                   options.report_format, options.hpo_matrix_format, hpo_propagation)
+            watching_input_folder(input_folder, cohort, options.watch_interval)
+        return
+
+    if options.sweep:
+        running_parameter_sweep(input_folder, source_paths, output_folder, hpo_index, input_variants,
+                                sweep_configurations(options.sweep_thresholds or [het_treshold],
+                                                     options.sweep_normalizations or [normalization_status]),
+                                metrics, options, log_file=log_file, variant_filter=variant_filter,
+                                annotation=annotation, hpo_propagation=hpo_propagation)
+        return
+
     # ------------------------------
-    # STEP 1: VERIFY JSON FILES
+    # STEP 1: LOAD, VERIFY AND EXTRACT PATIENT DATA
     # ------------------------------
-    
-    logger.info("STEP 1: Verifying JSON files.\n####################")
+
+    logger.info("STEP 1: Verifying JSON files and extracting HPO terms and variant data.\n####################")
 
     correct_JSON_files = []  # Stores valid JSON files
     total_JSON_files = []  # Tracks all tested JSON files
+    verification_report = []  # Status and failure reason of every tested file
+
+    def process_results(paths):
+        # Each file is parsed once, the same record feeds verification, HPO and variant stages
+        return iter_patient_results(paths, hpo_index, input_variants, het_treshold, normalization_status,
+                                    workers=options.workers, log_file=log_file, chunk_size=options.chunk_size,
+                                    variant_filter=variant_filter,
+                                    catalog_streaming_size=options.catalog_streaming_size)
+
+    if options.incremental:
+        # Only new or changed files (or files processed with other parameters) are processed again
+        manifest = PatientManifest(output_folder, parameters_key(
+            input_variants, het_treshold, normalization_status,
+            "api" if options.hpo_api else hpo_index.source_sha256,
+            variant_filter.digest if variant_filter is not None else None))
+        patient_results = iter_incremental_results(source_paths, manifest, process_results)
+    else:
+        # Archives and bundles are read as the records are processed, without unpacking them
+        patient_results = process_results(iterating_patient_inputs(source_paths))
+
+    # In streaming mode the concatenated variant file is written while the patients are processed, the HPO
+    # file once they all are (with the API, once the names of the whole cohort are known)
+    stream = StreamingOutput(output_folder, write_hpo=not options.hpo_api, output_format=options.output_format,
+                             annotation=annotation) \
+        if options.streaming else nullcontext()
+
+    # The cohort database is loaded as the patients are processed, in one transaction committed at the end
+    try:
+        cohort_store = CohortStore(options.cohort_db, input_folder) if options.cohort_db else None
+    except ValueError as e:
+        logger.error(f"Invalid cohort database: {e}")
+        return
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".json"):
-            input_path = os.path.join(input_folder, filename)
+    with metrics.stage("patients", profile=True), stream:
+        for patient_result in patient_results:
+            filename = patient_result["filename"]
             total_JSON_files.append(filename)
-
-            try:
-                # Perform JSON verification and filtering
-                tested_file = JSON_verification.verification_JSON(input_path, input_variants, het_treshold)
-
-                if tested_file:
-                    correct_JSON_files.append(tested_file)
-                    logger.info(f"File '{filename}' passed verification.\n")
+            metrics.add_patient_result(patient_result, hpo_named=not options.hpo_api)
+
+            if "error" in patient_result:
+                status = "error"
+                logger.error(f"Error processing file '{filename}': {patient_result['error']}\n")
+            elif patient_result["verified"]:
+                status = "passed"
+                correct_JSON_files.append(filename)
+                cached = " (cached)" if patient_result.get("cached") else ""
+                logger.info(f"File '{filename}' passed verification{cached}.\n")
+                if options.streaming:
+                    stream.add_patient_result(patient_result)
                 else:
-                    logger.error(f"File '{filename}' failed verification.\n")
+                    update_global_hpo(patient_result["hpo"])
+                    update_global_variant(patient_result["variants"], patient_result["patient"])
+                if cohort_store is not None:
+                    cohort_store.add_patient_result(patient_result)
+            else:
+                status = "failed"
+                logger.error(f"File '{filename}' failed verification: {patient_result.get('reason', '')}.\n")
 
-            except Exception as e:
-                logger.error(f"Error verifying file '{filename}': {e}\n")
+            verification_report.append({"filename": filename, "status": status,
+                                        "reason": patient_result.get("reason", "")})
 
     logger.info(f"Total correct JSON files: {len(correct_JSON_files)}")
     logger.info(f"Total JSON files tested: {len(total_JSON_files)}\n")
 
+    with metrics.stage("verification_report", files=len(verification_report)):
+        report_path = writing_verification_report(verification_report, output_folder, options.report_format)
+    logger.info(f"The verification report '{report_path}' has been created.")
+
     # ------------------------------
-    # STEP 2: PROCESS HPO DATA
+    # STEP 2: WRITE HPO DATA
     # ------------------------------
 
-    logger.info("STEP 2: Extracting HPO terms.\n####################")
-
-    # Extract HPO terms for each patient
-    for filename in correct_JSON_files:
-        if filename.endswith(".json"):
-            input_path = os.path.join(input_folder, filename)
-            update_global_hpo(main_research_HPO(input_path, hpo_path))
+    logger.info("STEP 2: Writing HPO tables.\n####################")
 
     # Generate presence/absence HPO table
-    for_clinical_presence_absence = main_generation_absence_presence_hpo(global_hpo_result, output_folder)
-
-    # Save full HPO data to CSV
-    output_path_concatenate_hpo = os.path.join(output_folder, "concatenate_HPO.csv")
-    hpo_standard_output_file(global_hpo_result, output_path_concatenate_hpo)
+    hpo_result = stream.patient_hpo if options.streaming else global_hpo_result
+
+    with metrics.stage("hpo_tables", files=len(hpo_result), profile=True):
+        if options.hpo_api:
+            # Every distinct HPO term of the cohort is looked up once
+            client = HPOAPIClient(options.hpo_api_url, options.hpo_api_cache, options.hpo_api_ttl,
+                                  options.hpo_api_workers)
+            hpo_names = client.lookup(hpo for hpos in hpo_result.values() for hpo, _ in hpos)
+            hpo_result = naming_HPO_results(hpo_result, hpo_names)
+            metrics.counting_missing_hpo(hpo_result)
+            if cohort_store is not None:
+                cohort_store.naming_hpo_terms(hpo_names)
+
+        main_generation_absence_presence_hpo(hpo_result, output_folder, options.hpo_matrix_format, hpo_propagation)
+
+        # Save full HPO data to CSV (already written in streaming mode, unless names come from the API)
+        output_path_concatenate_hpo = os.path.join(output_folder, "concatenate_HPO.csv")
+        if not options.streaming or options.hpo_api:
+            hpo_standard_output_file(hpo_result, output_path_concatenate_hpo)
     logger.info(f"The HPO concatenate file '{output_path_concatenate_hpo}' has been created.")
 
     # ------------------------------
-    # STEP 3: PROCESS VARIANT DATA
+    # STEP 3: WRITE VARIANT DATA
     # ------------------------------
 
-    logger.info("STEP 3: Extracting variant data.\n####################")
-
-    # Extract variant data from JSON files
-    threads = []
-    for filename in correct_JSON_files:
-        if filename.endswith(".json"):
-            input_path = os.path.join(input_folder, filename)
-            thread = threading.Thread(target=lambda: update_global_variant(
-                main_concatenation_variants(input_path, het_treshold, input_variants, normalization_status)))
-            threads.append(thread)
-            thread.start()
-
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
-
-    # Generate structured variant CSV file
-    output_path_concatenate_variants = os.path.join(output_folder, "concatenate_variants.csv")
-    generate_variant_csv(global_variant_result, output_path_concatenate_variants)
+    logger.info("STEP 3: Writing variant data.\n####################")
+
+    # Generate structured variant CSV file (already written in streaming mode)
+    output_path_concatenate_variants = output_path_for_format(os.path.join(output_folder, "concatenate_variants.csv"),
+                                                              options.output_format)
+    with metrics.stage("variant_table", variants=0 if options.streaming else metrics.counters["variants"],
+                       profile=True):
+        if not options.streaming and options.output_format == "csv":
+            generate_variant_csv(global_variant_result, output_path_concatenate_variants, annotation)
+        elif not options.streaming:
+            generate_variant_columnar(global_variant_result, output_path_concatenate_variants, options.output_format,
+                                      annotation)
     logger.info(f"The concatenate variant file '{output_path_concatenate_variants}' has been created.")
 
     # ------------------------------
@@ -213,7 +370,80 @@ def main(input_folder, output_folder, hpo_path, input_variants, het_treshold, no
     # ------------------------------
 
     logger.info("STEP 4: Creating clinical dataset.\n####################")
-    generation_clinical_table(global_variant_result, output_folder)
+    with metrics.stage("clinical_table", files=len(correct_JSON_files), profile=True):
+        if options.streaming:
+            generation_clinical_table_from_information(stream.patient_information, output_folder,
+                                                       options.output_format)
+        else:
+            generation_clinical_table_from_information(global_variant_result.patient_information(), output_folder,
+                                                       options.output_format)
+
+    if options.cohort_index:
+        with metrics.stage("cohort_index", files=len(correct_JSON_files), variants=metrics.counters["variants"]):
+            index_folder = writing_cohort_index(global_variant_result, hpo_result, output_folder, input_folder)
+        logger.info(f"The cohort index '{index_folder}' has been created.")
+
+    if cohort_store is not None:
+        with metrics.stage("cohort_db", files=len(correct_JSON_files)):
+            cohort_store.close()
+        logger.info(f"The cohort database '{options.cohort_db}' has been updated.")
+
+    metrics_path = metrics.write()
+    logger.info(f"The metrics file '{metrics_path}' has been created.")
+
+
+def running_parameter_sweep(input_folder, source_paths, output_folder, hpo_index, input_variants, configurations,
+                            metrics, options, log_file=None, variant_filter=None, annotation=None,
+                            hpo_propagation=None):
+    """
+    Runs the pipeline for every configuration of a parameter sweep, parsing each patient file once.
+
+    :param input_folder: Input folder of the run (identifiers of the samples in the cohort indexes).
+    :param source_paths: Paths of the patient files, archives and bundles (see input_sources.listing_input_sources).
+    :param output_folder: Output folder, each configuration being written to a sub-folder of it.
+    :param hpo_index: HPOIndex shared by all patients.
+    :param input_variants: List of variants used for filtering, formatted as "A3243G,A73G".
+    :param configurations: List of (het_treshold, normalization_status) tuples.
+    :param metrics: RunMetrics of the run.
+    :param options: RunOptions of the run (workers, chunk_size, catalog_streaming_size, output formats and
+                    cohort_index, the inverted indexes of each configuration being written to its sub-folder).
+    :param log_file: Log file of the run.
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+    :param hpo_propagation: Optional HPO_ontology.HPOPropagation of the presence/absence tables.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(f"Parameter sweep over {len(configurations)} configurations.\n####################")
+
+    sweep = [SweepConfiguration(output_folder, het_treshold, normalization_status)
+             for het_treshold, normalization_status in configurations]
+
+    with metrics.stage("patients", profile=True):
+        patient_inputs = iterating_patient_inputs(source_paths)
+        for patient_results in iter_patient_results(patient_inputs, hpo_index, input_variants, None, None,
+                                                    workers=options.workers, log_file=log_file,
+                                                    chunk_size=options.chunk_size, variant_filter=variant_filter,
+                                                    configurations=configurations,
+                                                    catalog_streaming_size=options.catalog_streaming_size):
+            # The file counters and timings are those of the file, whatever the configuration
+            metrics.add_patient_result(patient_results[configurations[0]])
+            for configuration in sweep:
+                configuration.add_patient_result(
+                    patient_results[(configuration.het_treshold, configuration.normalization_status)])
+
+            first_result = patient_results[configurations[0]]
+            if "error" in first_result:
+                logger.error(f"Error processing file '{first_result['filename']}': {first_result['error']}\n")
+
+    for configuration in sweep:
+        with metrics.stage(f"outputs_{os.path.basename(configuration.output_folder)}",
+                           files=len(configuration.verification_report), variants=configuration.variant_count):
+            configuration.writing_outputs(annotation, options.output_format, options.report_format,
+                                          options.hpo_matrix_format, options.cohort_index, hpo_propagation,
+                                          input_folder)
+
+    metrics_path = metrics.write()
+    logger.info(f"The metrics file '{metrics_path}' has been created.")
 
 
 # ------------------------------
@@ -230,6 +460,107 @@ if __name__ == '__main__':
     parser.add_argument('invariants', type=str)
     parser.add_argument('het_treshold', type=float)
     parser.add_argument('norm_status', type=str)
+    parser.add_argument('--hpo-cache-dir', type=str, default=None,
+                        help='Folder for the cached HPO index (default: .hpo_cache next to the HPO file)')
+    parser.add_argument('--no-hpo-cache', action='store_true',
+                        help='Always parse the HPO file and do not write the cached index')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes for the per-patient stages (default: 1)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Write the concatenated variant file patient by patient (bounded memory)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Number of files per batch sent to a worker process (default: automatic)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process new or changed files, reusing the results cached in the output folder')
+    parser.add_argument('--hpo-api', action='store_true',
+                        help='Look up HPO names through the HPO API instead of the HPO file')
+    parser.add_argument('--hpo-api-url', type=str, default=HPO_API_URL,
+                        help='Base URL of the HPO API')
+    parser.add_argument('--hpo-api-cache', type=str, default=None,
+                        help='Persistent JSON cache of the HPO API names (default: no persistent cache)')
+    parser.add_argument('--hpo-api-ttl-days', type=float, default=HPO_API_CACHE_TTL / (24 * 3600),
+                        help='Time-to-live of a cached HPO API name, in days (default: 30)')
+    parser.add_argument('--hpo-api-workers', type=int, default=8,
+                        help='Maximum number of concurrent HPO API requests (default: 8)')
+    parser.add_argument('--hpo-matrix-format', choices=PRESENCE_ABSENCE_FORMATS, default="dense",
+                        help='Presence/absence table as a dense CSV, a sparse Matrix Market file, or both')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default="csv",
+                        help='Format of the variant and clinical tables (parquet/arrow require pyarrow)')
+    parser.add_argument('--report-format', choices=REPORT_FORMATS, default="csv",
+                        help='Format of the verification report (default: csv)')
+    parser.add_argument('--annotate', action='store_true',
+                        help='Add the locus, strand, APOGEE and t-APOGEE columns to the variant table')
+    parser.add_argument('--annotation-dir', type=str, default=DEFAULT_ANNOTATION_FOLDER,
+                        help='Folder containing the annotation tables (default: Analysis_mito_cohorte/data)')
+    parser.add_argument('--loci', type=str, default=None,
+                        help='Comma-separated loci, only the variants in one of them are kept (e.g. "MT-TL1,MT-ND5")')
+    parser.add_argument('--trna-only', action='store_true',
+                        help='Only keep the variants in a tRNA locus')
+    parser.add_argument('--apogee2', type=str, default=None,
+                        help='Comma-separated APOGEE2 classes, only the variants with one of them are kept '
+                             '(e.g. "Pathogenic,VUS+")')
+    parser.add_argument('--positions', type=str, default=None,
+                        help='Comma-separated position ranges, only the variants inside one of them are kept '
+                             '(e.g. "3230-3304,8344")')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the outputs whenever JSON files are added to or changed in '
+                             'the input folder (stop with Ctrl+C)')
+    parser.add_argument('--watch-interval', type=float, default=WATCH_INTERVAL,
+                        help=f'Delay between two scans of the input folder in watch mode, in seconds '
+                             f'(default: {WATCH_INTERVAL})')
+    parser.add_argument('--sweep-het', type=str, default=None,
+                        help='Comma-separated heteroplasmy thresholds of a parameter sweep (e.g. "1,5,10"), '
+                             'each configuration being written to its own output sub-folder')
+    parser.add_argument('--sweep-norm', type=str, default=None,
+                        help='Comma-separated normalization modes of a parameter sweep (e.g. "yes,no,blood,urine")')
+    parser.add_argument('--catalog-streaming-mb', type=float, default=CATALOG_STREAMING_SIZE / 2 ** 20,
+                        help='Patient files of at least this size (MiB) are parsed incrementally, only the catalog '
+                             'variants that can reach the outputs being kept in memory (default: 16, 0 = every file)')
+    parser.add_argument('--cohort-db', type=str, default=None,
+                        help='SQLite database into which the verified patients, samples, variants and HPO terms are '
+                             'loaded, new runs adding to (or updating) its content')
+    parser.add_argument('--hpo-propagate', action='store_true',
+                        help='Count each HPO term of a patient for all its ancestors in the presence/absence table')
+    parser.add_argument('--hpo-depth', type=int, default=None,
+                        help='Collapse the propagated HPO terms to their ancestors at this depth '
+                             '(e.g. 2 for the organ systems)')
+    parser.add_argument('--hpo-subtree', type=str, action='append', default=None,
+                        help='Only keep the propagated HPO terms in the subtree of this term (repeatable, '
+                             'e.g. "HP:0000707")')
+    parser.add_argument('--cohort-index', action='store_true',
+                        help='Write the variant -> samples and HPO term -> patients inverted indexes to the '
+                             '"cohort_index" output folder, queried with pipeline/cohort_index.py')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write cProfile and tracemalloc reports of the main stages to the "profile" output folder')
 
     args = parser.parse_args()
-    main(args.input_folder, args.output_folder, args.hpo_path, args.invariants, args.het_treshold, args.norm_status)
\ No newline at end of file
+    try:
+        position_ranges = parsing_position_ranges(args.positions) if args.positions else None
+        sweep_thresholds = parsing_sweep_thresholds(args.sweep_het) if args.sweep_het else None
+        sweep_normalizations = parsing_sweep_normalizations(args.sweep_norm) if args.sweep_norm else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    options = RunOptions(
+        hpo_cache_folder=args.hpo_cache_dir, use_hpo_cache=not args.no_hpo_cache,
+        annotation_folder=args.annotation_dir,
+        workers=args.workers, chunk_size=args.chunk_size,
+        catalog_streaming_size=int(args.catalog_streaming_mb * 2 ** 20), profile=args.profile,
+        streaming=args.streaming, incremental=args.incremental, watch=args.watch,
+        watch_interval=args.watch_interval, sweep_thresholds=sweep_thresholds,
+        sweep_normalizations=sweep_normalizations,
+        hpo_api=args.hpo_api, hpo_api_url=args.hpo_api_url, hpo_api_cache=args.hpo_api_cache,
+        hpo_api_ttl=args.hpo_api_ttl_days * 24 * 3600, hpo_api_workers=args.hpo_api_workers,
+        hpo_propagate=args.hpo_propagate, hpo_depth=args.hpo_depth, hpo_subtrees=args.hpo_subtree,
+        hpo_matrix_format=args.hpo_matrix_format, output_format=args.output_format,
+        report_format=args.report_format, annotate=args.annotate, cohort_db=args.cohort_db,
+        cohort_index=args.cohort_index,
+        filter_loci=args.loci.split(",") if args.loci else None, trna_only=args.trna_only,
+        apogee2_classes=args.apogee2.split(",") if args.apogee2 else None, position_ranges=position_ranges)
+    try:
+        options.checking_modes()
+    except ValueError as e:
+        parser.error(str(e))
+
+    main(args.input_folder, args.output_folder, args.hpo_path, args.invariants, args.het_treshold, args.norm_status,
+         options)
@@ -0,0 +1,177 @@
+import hashlib  # Module for hashing the ontology file
+import json  # Built-in module for handling JSON files
+import logging  # Module for logging warnings and errors
+import os
+import pickle  # Module for the on-disk index cache
+
+# HPO index: the hp.json ontology is parsed once per run (or never, when a valid cache exists)
+# and the resulting id -> name mapping is shared by every patient.
+
+HPO_INDEX_CACHE_VERSION = 1  # Bump when the cached payload layout changes
+
+
+class HPOIndex:
+    """
+    In-memory index of the HPO ontology mapping HPO IDs (e.g. "HP_0001250") to their names.
+    """
+
+    def __init__(self, hpo_to_name, source_sha256=None):
+        """
+        :param hpo_to_name: Dictionary mapping each HPO ID to its name.
+        :param source_sha256: SHA-256 digest of the ontology file the index was built from, if known.
+        """
+        self.hpo_to_name = hpo_to_name
+        self.source_sha256 = source_sha256
+
+    def __contains__(self, hpo_id):
+        return hpo_id in self.hpo_to_name
+
+    def __getitem__(self, hpo_id):
+        return self.hpo_to_name[hpo_id]
+
+    def __len__(self):
+        return len(self.hpo_to_name)
+
+
+def build_HPO_index(hpo_file_path):
+    """
+    Parses the HPO ontology JSON file and builds the HPO index.
+
+    :param hpo_file_path: Path to the JSON file containing HPO terms.
+    :return: HPOIndex built from the ontology nodes.
+    """
+
+    # Read and parse the JSON file containing HPO term information
+    with open(hpo_file_path, "r") as file:
+        data = json.load(file)
+
+    # Dictionary to map HPO IDs to their respective names
+    hpo_to_name = {}
+
+    # Iterate through all ontology nodes to extract HPO IDs and names
+    for node in data["graphs"][0]["nodes"]:
+        hpo_id = node["id"].split("/")[-1]  # Extract HPO ID from the URL-like identifier
+        hpo_name = node.get("lbl", "Nom non disponible")  # Retrieve the label (HPO name) or a default message if missing
+        hpo_to_name[hpo_id] = hpo_name  # Store in dictionary
+
+    return HPOIndex(hpo_to_name)
+
+
+def hashing_file(file_path):
+    """
+    Computes the SHA-256 digest of a file, reading it by blocks.
+
+    :param file_path: Path to the file to hash.
+    :return: Hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def HPO_index_cache_path(hpo_file_path, cache_folder=None):
+    """
+    Returns the path of the cached index for an ontology file.
+
+    :param hpo_file_path: Path to the HPO ontology JSON file.
+    :param cache_folder: Folder holding the cache, defaults to a ".hpo_cache" folder next to the ontology.
+    :return: Path of the pickle file caching the index.
+    """
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.abspath(hpo_file_path)), ".hpo_cache")
+    return os.path.join(cache_folder, os.path.basename(hpo_file_path) + ".index.pickle")
+
+
+def load_HPO_index(hpo_file_path, cache_folder=None, use_cache=True):
+    """
+    Loads the HPO index, reusing the on-disk cache when it matches the ontology file.
+
+    The cache is keyed by the ontology mtime and SHA-256: when the mtime and size are unchanged the
+    cache is used directly, otherwise the file is hashed and the cache is only used if the hash matches.
+
+    :param hpo_file_path: Path to the HPO ontology JSON file.
+    :param cache_folder: Folder holding the cache (see HPO_index_cache_path).
+    :param use_cache: If False, always parse the ontology and do not write any cache.
+    :return: HPOIndex for the ontology.
+    """
+    if not use_cache:
+        index = build_HPO_index(hpo_file_path)
+        index.source_sha256 = hashing_file(hpo_file_path)
+        return index
+
+    cache_path = HPO_index_cache_path(hpo_file_path, cache_folder)
+    stat = os.stat(hpo_file_path)
+    file_hash = None
+
+    # Try the cached index first
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "rb") as fh:
+                payload = pickle.load(fh)
+
+            if payload.get("version") == HPO_INDEX_CACHE_VERSION:
+                if payload["mtime_ns"] == stat.st_mtime_ns and payload["size"] == stat.st_size:
+                    logging.info(f"HPO index loaded from cache '{cache_path}'.")
+                    return HPOIndex(payload["hpo_to_name"], payload["sha256"])
+
+                # The file was touched: only trust the cache if the content is the same
+                file_hash = hashing_file(hpo_file_path)
+                if payload["sha256"] == file_hash:
+                    logging.info(f"HPO index loaded from cache '{cache_path}' (unchanged content).")
+                    index = HPOIndex(payload["hpo_to_name"], file_hash)
+                    writing_HPO_index_cache(index, cache_path, file_hash, stat)
+                    return index
+
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable HPO index cache '{cache_path}': {e}")
+
+    # No valid cache: parse the ontology once and store it
+    index = build_HPO_index(hpo_file_path)
+    if file_hash is None:
+        file_hash = hashing_file(hpo_file_path)
+    index.source_sha256 = file_hash
+    writing_HPO_index_cache(index, cache_path, file_hash, stat)
+    logging.info(f"HPO index built from '{hpo_file_path}' ({len(index)} terms).")
+
+    return index
+
+
+def writing_HPO_index_cache(index, cache_path, file_hash, stat):
+    """
+    Writes the HPO index cache, a failure to write is only logged.
+
+    :param index: HPOIndex to cache.
+    :param cache_path: Path of the pickle file.
+    :param file_hash: SHA-256 digest of the ontology file.
+    :param stat: os.stat result of the ontology file.
+    """
+    payload = {
+        "version": HPO_INDEX_CACHE_VERSION,
+        "sha256": file_hash,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hpo_to_name": index.hpo_to_name,
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read a partial cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            pickle.dump(payload, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not write HPO index cache '{cache_path}': {e}")
+
+
+def get_HPO_index(hpo_source):
+    """
+    Returns an HPOIndex from either an existing index or a path to the ontology file.
+
+    :param hpo_source: HPOIndex instance or path to the HPO ontology JSON file.
+    :return: HPOIndex.
+    """
+    if isinstance(hpo_source, HPOIndex):
+        return hpo_source
+    return build_HPO_index(hpo_source)
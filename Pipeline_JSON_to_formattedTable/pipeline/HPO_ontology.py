@@ -0,0 +1,332 @@
+import json  # Module for the ontology file and the cache metadata
+import logging  # Module for logging warnings and errors
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from HPO_index import hashing_file
+
+# HPO ontology: the "is_a" hierarchy of hp.json (its "edges") is turned once into the ancestor closure of
+# every HPO term, stored as one bitset per term (bit j of row i is set when term j is term i or one of its
+# ancestors). A patient's terms are then propagated to all their ancestors by OR-ing rows, for the whole
+# cohort at once, instead of walking the graph for every patient. The bitsets are cached as a .npy file
+# next to the ontology and memory-mapped by later runs.
+
+HPO_ONTOLOGY_CACHE_VERSION = 1  # Bump when the cached closure layout changes
+
+IS_A = "is_a"
+PROPAGATION_BLOCK_SIZE = 4096  # Patients propagated at a time
+
+
+class HPOOntology:
+    """
+    HPO terms with their depth and the bitsets of their ancestor closure.
+    """
+
+    def __init__(self, terms, names, depths, closure):
+        """
+        :param terms: List of HPO IDs (e.g. "HP_0001250"), term i being row and bit i of the closure.
+        :param names: List of HPO names, one per term.
+        :param depths: Array of the depth of each term (length of the shortest "is_a" path to a root, 0 for
+                       "HP_0000001").
+        :param closure: uint8 array of shape (terms, ceil(terms / 8)), the bits of row i (np.packbits order)
+                        being term i and its ancestors.
+        """
+        self.terms = terms
+        self.names = names
+        self.depths = depths
+        self.closure = closure
+        self.term_index = {term: index for index, term in enumerate(terms)}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def ancestors(self, hpo_id):
+        """
+        Returns the ancestors of an HPO term, including the term itself.
+
+        :param hpo_id: HPO ID.
+        :return: List of HPO IDs.
+        """
+        bits = np.unpackbits(self.closure[self.term_index[hpo_id]], count=len(self.terms))
+        return [self.terms[index] for index in np.flatnonzero(bits).tolist()]
+
+    def subtree_mask(self, hpo_ids):
+        """
+        Returns the mask of the terms in the subtrees of the given terms (the terms and their descendants).
+
+        :param hpo_ids: HPO IDs of the subtree roots.
+        :return: Boolean array, one value per term.
+        :raises ValueError: If a term is not in the ontology.
+        """
+        mask = np.zeros(len(self.terms), dtype=bool)
+        for hpo_id in hpo_ids:
+            if hpo_id not in self.term_index:
+                raise ValueError(f"HPO term '{hpo_id}' not found in the ontology.")
+            index = self.term_index[hpo_id]
+            mask |= ((self.closure[:, index // 8] >> (7 - index % 8)) & 1).astype(bool)
+        return mask
+
+
+class HPOPropagation(NamedTuple):
+    """
+    Propagation of the patients' HPO terms in the presence/absence table.
+
+    With an ontology, every term counts for all its ancestors. depth collapses the terms to their ancestors
+    at this depth (more general terms being dropped), subtrees only keeps the terms inside these subtrees.
+    """
+
+    ontology: HPOOntology
+    depth: Optional[int] = None
+    subtrees: tuple = ()
+
+
+def build_HPO_ontology(hpo_file_path):
+    """
+    Parses the HPO ontology JSON file and builds the ancestor closure of its HPO terms.
+
+    :param hpo_file_path: Path to the JSON file containing the HPO ontology (nodes and edges).
+    :return: HPOOntology.
+    """
+    with open(hpo_file_path, "r") as file:
+        graph = json.load(file)["graphs"][0]
+
+    # HPO terms only (hp.json also holds terms of other ontologies)
+    names = {}
+    for node in graph["nodes"]:
+        hpo_id = node["id"].split("/")[-1]
+        if hpo_id.startswith("HP_"):
+            names[hpo_id] = node.get("lbl", "Nom non disponible")
+    terms = sorted(names)
+    term_index = {term: index for index, term in enumerate(terms)}
+
+    parents = [[] for _ in terms]
+    children = [[] for _ in terms]
+    for edge in graph.get("edges", []):
+        if edge.get("pred") != IS_A:
+            continue
+        child, parent = term_index.get(edge["sub"].split("/")[-1]), term_index.get(edge["obj"].split("/")[-1])
+        if child is not None and parent is not None and child != parent:
+            parents[child].append(parent)
+            children[parent].append(child)
+
+    # Terms in topological order (parents first), the depth being the shortest path to a root
+    depths = np.zeros(len(terms), dtype=np.int32)
+    remaining = np.array([len(term_parents) for term_parents in parents])
+    order = [index for index in range(len(terms)) if not parents[index]]
+    for index in order:  # The list grows as the terms whose parents are all visited are appended
+        for child in children[index]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                depths[child] = min(depths[parent] for parent in parents[child]) + 1
+                order.append(child)
+    if len(order) < len(terms):
+        logging.warning(f"The 'is_a' hierarchy of '{hpo_file_path}' has cycles: the ancestors of "
+                        f"{len(terms) - len(order)} HPO terms are incomplete.")
+        visited = set(order)
+        order.extend(index for index in range(len(terms)) if index not in visited)
+
+    # Ancestor closure: the row of a term is its own bit OR the rows of its parents
+    closure = np.zeros((len(terms), (len(terms) + 7) // 8), dtype=np.uint8)
+    for index in order:
+        if parents[index]:
+            np.bitwise_or.reduce(closure[parents[index]], axis=0, out=closure[index])
+        closure[index, index // 8] |= 0x80 >> (index % 8)
+
+    return HPOOntology(terms, [names[term] for term in terms], depths, closure)
+
+
+def HPO_ontology_cache_paths(hpo_file_path, cache_folder=None):
+    """
+    Returns the paths of the cached closure and of its metadata for an ontology file.
+
+    :param hpo_file_path: Path to the HPO ontology JSON file.
+    :param cache_folder: Folder holding the cache, defaults to a ".hpo_cache" folder next to the ontology.
+    """
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.abspath(hpo_file_path)), ".hpo_cache")
+    base_path = os.path.join(cache_folder, os.path.basename(hpo_file_path))
+    return base_path + ".closure.npy", base_path + ".closure.json"
+
+
+def load_HPO_ontology(hpo_file_path, cache_folder=None, use_cache=True):
+    """
+    Loads the HPO ontology, memory-mapping the cached closure when it matches the ontology file.
+
+    As for the HPO index, the cache is keyed by the ontology mtime, size and SHA-256.
+
+    :param hpo_file_path: Path to the HPO ontology JSON file.
+    :param cache_folder: Folder holding the cache (see HPO_ontology_cache_paths).
+    :param use_cache: If False, always parse the ontology and do not write any cache.
+    :return: HPOOntology.
+    """
+    if not use_cache:
+        return build_HPO_ontology(hpo_file_path)
+
+    closure_path, metadata_path = HPO_ontology_cache_paths(hpo_file_path, cache_folder)
+    stat = os.stat(hpo_file_path)
+    file_hash = None
+
+    # Try the cached closure first
+    if os.path.isfile(metadata_path):
+        try:
+            with open(metadata_path) as fh:
+                metadata = json.load(fh)
+
+            if metadata.get("version") == HPO_ONTOLOGY_CACHE_VERSION:
+                unchanged = metadata["mtime_ns"] == stat.st_mtime_ns and metadata["size"] == stat.st_size
+                if not unchanged:
+                    # The file was touched: only trust the cache if the content is the same
+                    file_hash = hashing_file(hpo_file_path)
+                if unchanged or metadata["sha256"] == file_hash:
+                    closure = np.load(closure_path, mmap_mode="r")
+                    if closure.shape == (len(metadata["terms"]), (len(metadata["terms"]) + 7) // 8):
+                        logging.info(f"HPO ontology closure loaded from cache '{closure_path}'.")
+                        return HPOOntology(metadata["terms"], metadata["names"],
+                                           np.array(metadata["depths"], dtype=np.int32), closure)
+
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable HPO ontology cache '{closure_path}': {e}")
+
+    # No valid cache: build the closure once and store it
+    ontology = build_HPO_ontology(hpo_file_path)
+    writing_HPO_ontology_cache(ontology, closure_path, metadata_path,
+                               file_hash or hashing_file(hpo_file_path), stat)
+    logging.info(f"HPO ontology closure built from '{hpo_file_path}' ({len(ontology)} terms).")
+
+    return ontology
+
+
+def writing_HPO_ontology_cache(ontology, closure_path, metadata_path, file_hash, stat):
+    """
+    Writes the HPO ontology cache, a failure to write is only logged.
+
+    The closure is written before its metadata, which is what makes the cache valid.
+
+    :param ontology: HPOOntology to cache.
+    :param closure_path: Path of the .npy closure file.
+    :param metadata_path: Path of the JSON metadata file.
+    :param file_hash: SHA-256 digest of the ontology file.
+    :param stat: os.stat result of the ontology file.
+    """
+    metadata = {
+        "version": HPO_ONTOLOGY_CACHE_VERSION,
+        "sha256": file_hash,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "terms": ontology.terms,
+        "names": ontology.names,
+        "depths": ontology.depths.tolist(),
+    }
+    try:
+        os.makedirs(os.path.dirname(closure_path), exist_ok=True)
+        # Write to temporary files first so concurrent runs never read a partial cache
+        tmp_closure_path = f"{closure_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_closure_path, ontology.closure)
+        os.replace(tmp_closure_path, closure_path)
+
+        tmp_metadata_path = f"{metadata_path}.{os.getpid()}.tmp"
+        with open(tmp_metadata_path, "w") as fh:
+            json.dump(metadata, fh)
+        os.replace(tmp_metadata_path, metadata_path)
+    except OSError as e:
+        logging.warning(f"Could not write HPO ontology cache '{closure_path}': {e}")
+
+
+def propagating_presence_absence_matrix(global_hpo, propagation, sparse=False):
+    """
+    Builds the presence/absence matrix of the HPO terms, each patient's terms being propagated to all their
+    ancestors (and collapsed to a depth or restricted to subtrees, see HPOPropagation).
+
+    The rows of the patient terms are OR-ed per patient on the packed closure, restricted to the ancestors
+    of the terms of the cohort. Terms missing from the ontology keep their own column (if they have a name).
+    The columns are sorted by depth, then by HPO ID.
+
+    :param global_hpo: Dictionary containing patient HPO data, structured as
+                        {"patient_id": [(hpo_terms, hpo_name), ...]}.
+    :param propagation: HPOPropagation.
+    :param sparse: If True, the matrix is returned as the (row, column) pairs of its present terms, without
+                   building the whole boolean matrix.
+    :return: Tuple (patient_ids, HPO names of the columns, boolean matrix of shape (patients, columns)), or
+             with sparse, tuple (patient_ids, HPO names of the columns, rows, columns) of the present terms in
+             row-major order.
+    """
+    ontology = propagation.ontology
+    patient_ids = list(global_hpo.keys())
+
+    # (patient, term) pairs of the ontology terms, and the named terms outside of it
+    pair_rows, pair_terms = [], []
+    other_index, other_rows, other_columns = {}, [], []
+    for row, hpos in enumerate(global_hpo.values()):
+        for hpo_id, hpo_name in hpos:
+            index = ontology.term_index.get(hpo_id.replace(":", "_"))  # "HP:" IDs of the HPO API
+            if index is not None:
+                pair_rows.append(row)
+                pair_terms.append(index)
+            elif hpo_name != "":
+                other_rows.append(row)
+                other_columns.append(other_index.setdefault(hpo_name, len(other_index)))
+
+    pair_rows = np.asarray(pair_rows, dtype=np.intp)
+    pair_terms = np.asarray(pair_terms, dtype=np.intp)
+
+    # Columns: the ancestors of the cohort's terms, kept by the depth and subtree criteria
+    cohort_terms = np.unique(pair_terms)
+    if len(cohort_terms):
+        reached = np.bitwise_or.reduce(ontology.closure[cohort_terms], axis=0)
+    else:
+        reached = np.zeros(ontology.closure.shape[1], dtype=np.uint8)
+    kept = np.unpackbits(reached, count=len(ontology)).astype(bool)
+    if propagation.depth is not None:
+        kept &= ontology.depths == propagation.depth
+    if propagation.subtrees:
+        kept &= ontology.subtree_mask(propagation.subtrees)
+    columns = np.flatnonzero(kept)
+    columns = columns[np.lexsort((columns, ontology.depths[columns]))]
+
+    # Closure of the cohort's terms restricted to the columns, OR-ed per patient
+    matrix = None if sparse else np.zeros((len(patient_ids), len(columns) + len(other_index)), dtype=bool)
+    present_rows, present_columns = [], []  # Present (row, column) pairs of every block (sparse)
+    if len(pair_rows) and len(columns):
+        # Packed rows padded to 64-bit words, OR-ed 64 columns at a time
+        term_bits = np.unpackbits(ontology.closure[cohort_terms], axis=1, count=len(ontology))[:, columns]
+        term_closure = np.zeros((len(cohort_terms), -(-len(columns) // 64) * 8), dtype=np.uint8)
+        term_closure[:, :(len(columns) + 7) // 8] = np.packbits(term_bits, axis=1)
+        term_closure = term_closure.view(np.uint64)
+        pair_closure_rows = np.searchsorted(cohort_terms, pair_terms)
+        patient_rows, starts = np.unique(pair_rows, return_index=True)  # The pairs are in patient order
+        starts = np.append(starts, len(pair_rows))
+
+        # By blocks of patients, so that the gathered closure rows stay small
+        for block in range(0, len(patient_rows), PROPAGATION_BLOCK_SIZE):
+            block_starts = starts[block:block + PROPAGATION_BLOCK_SIZE + 1]
+            patient_bits = np.bitwise_or.reduceat(term_closure[pair_closure_rows[block_starts[0]:block_starts[-1]]],
+                                                  block_starts[:-1] - block_starts[0], axis=0)
+            block_matrix = np.unpackbits(patient_bits.view(np.uint8), axis=1, count=len(columns)).astype(bool)
+            if sparse:
+                block_rows, block_columns = np.nonzero(block_matrix)
+                present_rows.append(patient_rows[block:block + PROPAGATION_BLOCK_SIZE][block_rows])
+                present_columns.append(block_columns)
+            else:
+                matrix[patient_rows[block:block + PROPAGATION_BLOCK_SIZE], :len(columns)] = block_matrix
+
+    other_rows = np.asarray(other_rows, dtype=np.intp)
+    other_columns = len(columns) + np.asarray(other_columns, dtype=np.intp)
+    if not other_index or propagation.depth is not None or propagation.subtrees:
+        # Terms outside of the ontology have no depth nor subtree
+        other_index = {}
+        other_rows, other_columns = other_rows[:0], other_columns[:0]
+    names = [ontology.names[index] for index in columns.tolist()] + list(other_index)
+
+    if sparse:
+        # Distinct pairs in row-major order, as np.nonzero of the dense matrix
+        column_count = max(len(names), 1)
+        codes = np.unique(np.concatenate(present_rows + [other_rows]).astype(np.int64) * column_count
+                          + np.concatenate(present_columns + [other_columns]))
+        rows, pair_columns = np.divmod(codes, column_count)
+        return patient_ids, names, rows, pair_columns
+
+    matrix = matrix[:, :len(names)]
+    matrix[other_rows, other_columns] = True
+    return patient_ids, names, matrix
@@ -1,7 +1,18 @@
 # Import necessary modules
 from JSON_verification import load_json  # Custom function to load JSON data
+from concurrent.futures import ThreadPoolExecutor  # Bounded pool for concurrent API requests
+import json  # Module for the persistent lookup cache
 import logging  # Module for logging warnings and errors
+import os
+import time
 import requests  # Module for making HTTP requests to APIs
+from requests.adapters import HTTPAdapter
+
+# Base URL of the HPO API
+HPO_API_URL = "https://clinicaltables.nlm.nih.gov/api/hpo/v3/search"
+
+# Default time-to-live of a cached HPO name (30 days)
+HPO_API_CACHE_TTL = 30 * 24 * 3600
 
 
 def extracting_HPO(patient_data):
@@ -21,24 +32,52 @@ def extracting_HPO(patient_data):
     return patient_id, hpo_info
 
 
-def asking_HPO_names(patient_id, hpo_info):
+class HPOAPIClient:
     """
-    Queries an external HPO API to retrieve HPO term names based on HPO IDs.
+    Looks up HPO names through the HPO API for a whole cohort.
 
-    :param patient_id: The unique ID of the patient.
-    :param hpo_info: Dictionary containing HPO term IDs for the patient.
-    :return: Dictionary in the format { "patient_id": [(hpo_id, hpo_name), ...] }.
+    Terms are deduplicated, fetched concurrently over a pooled HTTP session with a bounded number of
+    requests in flight, and kept in an optional persistent JSON cache whose entries expire after a TTL.
     """
 
-    # Base URL of the HPO API
-    api_url = "https://clinicaltables.nlm.nih.gov/api/hpo/v3/search"
-
-    # Initialize the final output dictionary
-    final_output_hpo = {patient_id: []}
-
-    # Iterate through each HPO term ID in the patient's data
-    for hpo in hpo_info.keys():
-        # Construct query parameters for the API request
+    def __init__(self, api_url=HPO_API_URL, cache_path=None, ttl=HPO_API_CACHE_TTL, max_workers=8, timeout=10):
+        """
+        :param api_url: Base URL of the HPO API (can point to a local stub server).
+        :param cache_path: Path to the persistent JSON cache, None to only cache in memory.
+        :param ttl: Time-to-live of a cached name, in seconds.
+        :param max_workers: Maximum number of concurrent requests.
+        :param timeout: Timeout of one request, in seconds.
+        """
+        self.api_url = api_url
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        # One pooled session shared by every request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # { hpo_id: [hpo_name, fetch_timestamp] }
+        self.cache = {}
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "r") as fh:
+                    self.cache = json.load(fh)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Ignoring unreadable HPO API cache '{cache_path}': {e}")
+
+    def fetching_HPO_name(self, hpo):
+        """
+        Requests the name of one HPO term from the API.
+
+        :param hpo: HPO term ID (e.g. "HP:0001250").
+        :return: The HPO name, "" if the API does not know the term, None if the request failed (or its
+                 response is not a search result).
+        """
+        # Query parameters of the API request
         query_params = {
             "terms": hpo,  # The HPO term ID to search for
             "df": "name",  # Retrieve the name of the HPO term
@@ -46,25 +85,103 @@ def asking_HPO_names(patient_id, hpo_info):
             "cf": "id"  # Configure response format to include ID
         }
 
-        # Construct the full API request URL
-        query_url = api_url + "?" + requests.compat.urlencode(query_params)
+        try:
+            response = self.session.get(self.api_url, params=query_params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"\nThe HPO '{hpo}' could not be requested from the API: {e}\n")
+            return None
+
+        # Check if the API returned results: [count, [ids], extra fields, [[name], ...]]
+        try:
+            if len(data[1]) > 0:
+                return data[3][0][0]
+        except (IndexError, KeyError, TypeError) as e:
+            logging.warning(f"\nThe HPO '{hpo}' got an unexpected response from the API: {e!r}\n")
+            return None
+
+        # Log a warning if no name was found for the HPO ID
+        logging.warning(f"\nThe HPO '{hpo}' could not be found via the API.\n")
+        return ""
+
+    def lookup(self, hpo_ids):
+        """
+        Returns the names of a set of HPO terms, requesting only the terms missing from the cache.
+
+        :param hpo_ids: Iterable of HPO term IDs (duplicates are looked up once).
+        :return: Dictionary { hpo_id: hpo_name }, "" for terms without a name.
+        """
+        now = time.time()
+        unique_ids = set(hpo_ids)
+        names = {}
+        missing = []
+
+        for hpo in unique_ids:
+            cached = self.cache.get(hpo)
+            if cached is not None and now - cached[1] < self.ttl:
+                names[hpo] = cached[0]
+            else:
+                missing.append(hpo)
+
+        if missing:
+            logging.info(f"HPO API: {len(unique_ids) - len(missing)} cached term(s), {len(missing)} to request.")
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for hpo, name in zip(missing, executor.map(self.fetching_HPO_name, missing)):
+                    if name is None:
+                        # Failed requests are not cached, they are retried on the next lookup
+                        names[hpo] = ""
+                        continue
+                    names[hpo] = name
+                    self.cache[hpo] = [name, now]
+
+            self.save()
+
+        return names
+
+    def save(self):
+        """
+        Writes the persistent cache, if any.
+        """
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as fh:
+                json.dump(self.cache, fh)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write HPO API cache '{self.cache_path}': {e}")
+
+
+def naming_HPO_results(hpo_result, hpo_names):
+    """
+    Fills the HPO names of extracted patient HPO terms.
+
+    :param hpo_result: Dictionary { "patient_id": [(hpo_id, hpo_name), ...] } with names to fill.
+    :param hpo_names: Dictionary { hpo_id: hpo_name } as returned by HPOAPIClient.lookup.
+    :return: Dictionary { "patient_id": [(hpo_id, hpo_name), ...] }.
+    """
+    return {patient_id: [(hpo, hpo_names.get(hpo, "")) for hpo, _ in hpos]
+            for patient_id, hpos in hpo_result.items()}
 
-        # Send the API request
-        response = requests.get(query_url)
 
-        # Parse the response as JSON
-        data = response.json()
+def asking_HPO_names(patient_id, hpo_info, client=None):
+    """
+    Queries an external HPO API to retrieve HPO term names based on HPO IDs.
+
+    :param patient_id: The unique ID of the patient.
+    :param hpo_info: Dictionary containing HPO term IDs for the patient.
+    :param client: HPOAPIClient shared by the cohort, a client without persistent cache is created if None.
+    :return: Dictionary in the format { "patient_id": [(hpo_id, hpo_name), ...] }.
+    """
+    if client is None:
+        client = HPOAPIClient()
 
-        # Check if the API returned results
-        if len(data[1]) > 0:
-            # Append the HPO ID and its corresponding name to the output dictionary
-            final_output_hpo[patient_id].append((hpo, data[3][0][0]))
-        else:
-            # Log a warning if no name was found for the HPO ID
-            logging.warning(f"\nThe HPO '{hpo}' could not be found via the API.\n")
-            final_output_hpo[patient_id].append((hpo, ""))  # Store an empty string if no name is found
+    hpo_names = client.lookup(hpo_info.keys())
 
-    return final_output_hpo  # Return the final structured dictionary
+    return {patient_id: [(hpo, hpo_names[hpo]) for hpo in hpo_info.keys()]}
 
 
 def HPO_requesting_process(input_path):
@@ -81,13 +198,38 @@ def HPO_requesting_process(input_path):
     # Load the patient data JSON file
     file_data = load_json(input_path)
 
-    # Extract patient ID and HPO terms
-    patient_id, hpo_info = extracting_HPO(file_data)
-
     # Query the API to retrieve HPO names for the patient's HPO terms
-    hpo_output = asking_HPO_names(patient_id, hpo_info)
+    hpo_output = requesting_HPO_from_data(file_data)
 
     # Log that the process was successfully completed
     logging.info(f"The HPO file '{input_filename}' has been processed successfully.")
 
     return hpo_output  # Return the structured HPO data
+
+
+def requesting_HPO_from_data(file_data, client=None):
+    """
+    Retrieves HPO names via API requests for already loaded patient data.
+
+    :param file_data: Patient data as returned by load_json.
+    :param client: HPOAPIClient shared by the cohort (optional).
+    :return: Dictionary containing the structured HPO information.
+    """
+
+    # Extract patient ID and HPO terms
+    patient_id, hpo_info = extracting_HPO(file_data)
+
+    # Query the API to retrieve HPO names for the patient's HPO terms
+    return asking_HPO_names(patient_id, hpo_info, client)
+
+
+def extracting_unnamed_HPO(file_data):
+    """
+    Extracts the patient HPO terms without their names, which are looked up later for the whole cohort.
+
+    :param file_data: Patient data as returned by load_json.
+    :return: Dictionary in the format { "patient_id": [(hpo_id, ""), ...] }.
+    """
+    patient_id, hpo_info = extracting_HPO(file_data)
+
+    return {patient_id: [(hpo, "") for hpo in hpo_info.keys()]}
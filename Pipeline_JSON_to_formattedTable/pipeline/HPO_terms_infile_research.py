@@ -1,6 +1,6 @@
 # Importing necessary modules
 from JSON_verification import load_json  # Custom function to load JSON data
-import json  # Built-in module for handling JSON files
+from HPO_index import get_HPO_index  # Shared index of the HPO ontology
 import logging  # Module for logging warnings and errors
 
 
@@ -22,27 +22,17 @@ def extracting_HPO(patient_data):
 
 def intern_HPO_research(hpo_file_path, hpo_info, patient_id):
     """
-    Searches for HPO term names corresponding to their IDs in a provided HPO JSON file.
+    Searches for HPO term names corresponding to their IDs in the HPO ontology.
 
-    :param hpo_file_path: Path to the JSON file containing HPO terms.
+    :param hpo_file_path: HPOIndex built once per run, or path to the JSON file containing HPO terms.
     :param hpo_info: List of HPO term IDs associated with a patient.
     :param patient_id: The unique ID of the patient.
     :return: Dictionary mapping each HPO ID to its corresponding name.
     """
-    
-    # Read and parse the JSON file containing HPO term information
-    with open(hpo_file_path, "r") as file:
-        data = json.load(file)
-
-    # Dictionary to map HPO IDs to their respective names
-    hpo_to_name = {}
-
-    # Iterate through all ontology nodes to extract HPO IDs and names
-    for node in data["graphs"][0]["nodes"]:
-        hpo_id = node["id"].split("/")[-1]  # Extract HPO ID from the URL-like identifier
-        hpo_name = node.get("lbl", "Nom non disponible")  # Retrieve the label (HPO name) or a default message if missing
-        hpo_to_name[hpo_id] = hpo_name  # Store in dictionary
-    
+
+    # Dictionary mapping HPO IDs to their respective names (parsed only if a path was given)
+    hpo_to_name = get_HPO_index(hpo_file_path).hpo_to_name
+
     # Initialize dictionary to store patient-specific HPO terms and their names
     dict_patient_hpo = {}
 
@@ -62,13 +52,25 @@ def main_research_HPO(input_path, hpo_file_path):
     Main function to retrieve HPO information for a given patient and structure it in a dictionary.
 
     :param input_path: Path to the patient's JSON file.
-    :param hpo_file_path: Path to the HPO reference JSON file.
+    :param hpo_file_path: HPOIndex or path to the HPO reference JSON file.
     :return: Dictionary in the format { "patient_id": [(hpo_id, hpo_name), ...] }.
     """
 
     # Load the JSON file containing patient data
     file_data = load_json(input_path)
 
+    return research_HPO_from_data(file_data, hpo_file_path)
+
+
+def research_HPO_from_data(file_data, hpo_file_path):
+    """
+    Retrieve HPO information from already loaded patient data.
+
+    :param file_data: Patient data as returned by load_json.
+    :param hpo_file_path: HPOIndex or path to the HPO reference JSON file.
+    :return: Dictionary in the format { "patient_id": [(hpo_id, hpo_name), ...] }.
+    """
+
     # Extract patient ID and HPO terms from the loaded data
     patient_id, hpo_info = extracting_HPO(file_data)
 
@@ -1,5 +1,8 @@
 import csv  # Module for handling CSV file operations
 
+# Header of the concatenated HPO file
+HPO_HEADER = ["patient_id", "HPO_terms", "HPO_name"]
+
 
 def hpo_standard_output_file(global_hpo_info, output_path):
     """
@@ -14,13 +17,25 @@ def hpo_standard_output_file(global_hpo_info, output_path):
         writer = csv.writer(fh_out, delimiter=";")  # Use semicolon as delimiter
 
         # Write the CSV header row
-        writer.writerow(["patient_id", "HPO_terms", "HPO_name"])
+        writer.writerow(HPO_HEADER)
 
-        # Iterate over each patient in the provided HPO dictionary
-        for patient_id, list_hpo in global_hpo_info.items():
-            # Iterate over each HPO term-name pair for the patient
-            for hpo_terms, hpo_names in list_hpo:
-                # Write the patient ID, HPO term, and corresponding name to the CSV file
-                writer.writerow([patient_id, hpo_terms, hpo_names])
+        # Write the HPO terms of every patient
+        writing_hpo_rows(writer, global_hpo_info)
 
     return  # Function completes without returning any values
+
+
+def writing_hpo_rows(writer, hpo_info):
+    """
+    Writes the HPO rows of one or several patients with an open CSV writer.
+
+    :param writer: csv.writer of the concatenated HPO file.
+    :param hpo_info: Dictionary structured as { "patient_id": [(hpo_terms, hpo_names), ...] }.
+    """
+
+    # Iterate over each patient in the provided HPO dictionary
+    for patient_id, list_hpo in hpo_info.items():
+        # Iterate over each HPO term-name pair for the patient
+        for hpo_terms, hpo_names in list_hpo:
+            # Write the patient ID, HPO term, and corresponding name to the CSV file
+            writer.writerow([patient_id, hpo_terms, hpo_names])
@@ -1,24 +1,58 @@
+import csv  # Module for writing the verification report
+import gzip  # Module for reading gzipped patient files
 import json  # Module for handling JSON files
 import logging  # Module for logging errors and warnings
+import os
+
+from variant_key import M3243_KEY, compile_variant_keys, variant_key
 
 #JSON Validation: Ensures that a JSON file is correctly formatted and contains all necessary information.
-#Input: JSON file path  
-#Output: Filename (if valid) or False (if validation fails)
+#Input: Patient record loaded from a JSON file (see load_json)
+#Output: (True, "") if valid, (False, reason of the failure) otherwise (see verify_patient_record)
+
+def opening_json_file(input_file):
+    """
+    Open a patient JSON file for reading, gzipped files (".json.gz") being decompressed on the fly.
+
+    :param input_file: Path to the JSON file.
+    :return: Text file handle.
+    """
+    if input_file.endswith(".gz"):
+        return gzip.open(input_file, "rt")
+    return open(input_file, "r")
+
 
 def load_json(input_file):
     """
     Load JSON data from a clinical patient JSON file.
 
-    :param input_file: Path to the JSON file.
+    :param input_file: Path to the JSON file (".json" or ".json.gz").
     :return: JSON data as a dictionary if successful, else False.
     """
     try:
-        with open(input_file, "r") as fh:
+        with opening_json_file(input_file) as fh:
             return json.load(fh)  # Load and return JSON data
     except FileNotFoundError:
         logging.error(f"Error: File '{input_file}' not found.")
         return False
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, gzip.BadGzipFile, EOFError):
+        logging.error(f"Error: File '{input_file}' is not a valid JSON.")
+        return False
+
+
+def load_json_content(content, input_file):
+    """
+    Load JSON data from the content of a patient JSON read from an archive or a bundle.
+
+    :param content: JSON document (bytes, gzipped if input_file ends with ".gz").
+    :param input_file: Path of the record (see input_sources), used in the messages.
+    :return: JSON data as a dictionary if successful, else False.
+    """
+    try:
+        if input_file.endswith(".gz"):
+            content = gzip.decompress(content)
+        return json.loads(content)
+    except (ValueError, gzip.BadGzipFile, EOFError):  # ValueError covers JSONDecodeError and UnicodeDecodeError
         logging.error(f"Error: File '{input_file}' is not a valid JSON.")
         return False
 
@@ -42,6 +76,10 @@ def verify_clinical_info(clinical_info):
     return True
 
 
+# Nucleotides allowed in the reference and alternative sequences
+VALID_NUCLEOTIDES = frozenset({"A", "T", "C", "G", "N"})
+
+
 def verify_sample_info(sample_info):
     """
     Verify the sample information section of the JSON file.
@@ -56,108 +94,175 @@ def verify_sample_info(sample_info):
             # Ensure "age_at_sampling" is a valid integer
             try:
                 int(value)
-            except ValueError:
+            except (TypeError, ValueError):
                 logging.warning(f"Invalid value for {key}: {value}")
                 return False
 
     return True
 
 
-def verify_variants(variants):
+def verify_HPO(HPO_info):
     """
-    Validate the variant information section.
+    Validate the presence of at least one HPO term in the JSON file.
 
-    :param variants: List of variants extracted from the JSON file.
-    :return: True if valid, otherwise False.
+    :param HPO_info: Dictionary containing HPO terms.
+    :return: True if at least one HPO term is present, otherwise False.
+    """
+    return bool(HPO_info.get("hpo", False))
+
+
+def checking_catalog_variant(variant):
+    """
+    Validate the fields of one variant of the "Catalog" section.
+
+    :param variant: Variant dictionary (a missing field raises KeyError).
+    :return: Tuple (position, heteroplasmy rate, "") with the converted values if the variant is valid,
+             otherwise (None, None, reason of the failure).
     """
+    position, reference, alternative, heteroplasmy = variant["pos"], variant["ref"], variant["alt"], variant["heteroplasmy_rate"]
+    variant_row = [variant["chr"], position, reference, alternative, heteroplasmy]
+
+    # Validate that position is an integer
+    try:
+        position = int(position)
+    except (TypeError, ValueError):
+        return None, None, f"invalid position for variant {variant_row}"
+
+    # Validate that reference and alternative sequences contain only valid nucleotides
+    if not VALID_NUCLEOTIDES.issuperset(reference):
+        return None, None, f"invalid reference nucleotide for variant {variant_row}"
+
+    if not VALID_NUCLEOTIDES.issuperset(alternative):
+        return None, None, f"invalid alternative nucleotide for variant {variant_row}"
+
+    # Validate heteroplasmy rate
+    try:
+        heteroplasmy_value = float(heteroplasmy)
+    except (TypeError, ValueError):
+        return None, None, f"invalid heteroplasmy rate for variant {variant_row}"
+
+    if not heteroplasmy:
+        return None, None, f"missing heteroplasmy rate for variant {variant_row}"
+
+    return position, heteroplasmy_value, ""
+
+
+def verify_catalog(variants, requested_variants, het_threshold, catalog_size=None):
+    """
+    Validate the variant catalog and the presence of the requested variants in a single pass,
+    stopping at the first failure.
+
+    :param variants: List of variant dictionaries from the "Catalog" section.
+    :param requested_variants: Mapping { variant key: label } of the requested variants (see variant_key.compile_variant_keys).
+    :param het_threshold: Minimum heteroplasmy rate required for the requested variants.
+    :param catalog_size: Number of variants of the file when variants only holds part of them (see catalog_stream).
+    :return: Tuple (True, "") if valid, otherwise (False, reason).
+    """
+    found = set()  # Requested variants seen in the catalog
+    presence_m3243 = False
+    het_threshold = float(het_threshold)
+
     for variant in variants:
-        position, reference, alternative, heteroplasmy = variant[1], variant[2], variant[3], variant[4]
+        position, heteroplasmy_value, reason = checking_catalog_variant(variant)
+        if reason:
+            logging.error(f"{reason[0].upper()}{reason[1:]}")
+            return False, reason
 
-        # Validate that position is an integer
-        try:
-            int(position)
-        except ValueError:
-            logging.error(f"Invalid position for variant: {variant}")
-            return False
+        # Check the requested variants with the key index
+        key = variant_key(position, variant["ref"], variant["alt"])
 
-        # Validate that reference and alternative sequences contain only valid nucleotides
-        for nuc in reference:
-            if nuc not in {"A", "T", "C", "G", "N"}:
-                logging.error(f"Invalid reference nucleotide for variant: {variant}")
-                return False
+        if key in requested_variants:
+            found.add(key)
 
-        for nuc in alternative:
-            if nuc not in {"A", "T", "C", "G", "N"}:
-                logging.error(f"Invalid alternative nucleotide for variant: {variant}")
-                return False
+            if heteroplasmy_value < het_threshold:
+                var_lbl = requested_variants[key]
+                logging.error(f"The variant '{var_lbl}' has less than {het_threshold}% heteroplasmy.")
+                return False, f"variant {var_lbl} below {het_threshold}% heteroplasmy"
 
-        # Validate heteroplasmy rate
-        try:
-            float(heteroplasmy)
-        except ValueError:
-            logging.error(f"Invalid heteroplasmy rate for variant: {variant}")
-            return False
+        if key == M3243_KEY:
+            presence_m3243 = True
 
-        if not heteroplasmy:
-            logging.error(f"Missing heteroplasmy rate for variant: {variant}")
-            return False
+    missing = sorted(label for key, label in requested_variants.items() if key not in found)
+    if missing:
+        logging.error(f"Mutation {missing[0]} not found.")
+        return False, f"variant(s) {','.join(missing)} not found"
 
-    return True
+    if presence_m3243 and (len(variants) if catalog_size is None else catalog_size) == 1:
+        logging.warning("Only mutation A3243G detected.")
 
+    return True, ""
 
-def verify_presence_of_input_variants(variants, input_variants, het_threshold):
+
+def verify_patient_record(file_data, input_file, input_variants, het_threshold):
     """
-    Validate the presence of specified input variants in the JSON data.
+    Validate a loaded patient JSON, stopping at the first failed check.
 
-    :param variants: List of variants extracted from the JSON.
-    :param input_variants: Comma-separated string of expected variants (e.g., "A3243G,G11778A").
+    :param file_data: Patient data as returned by load_json.
+    :param input_file: Path of the JSON file the data was loaded from.
+    :param input_variants: Comma-separated string of expected variants.
     :param het_threshold: Minimum heteroplasmy rate required.
-    :return: True if all specified variants are present and meet the threshold, otherwise False.
+    :return: Tuple (True, "") if valid, otherwise (False, reason of the failure).
     """
-    input_variants = input_variants.replace(" ", "").split(",")  # Normalize input variants
+    if not file_data:
+        return False, "file could not be loaded as JSON"  # JSON loading failed
 
-    for input_variant in input_variants:
-        presence_input_var = False
-        presence_m3243 = False
+    # Validate clinical information
+    if not verify_clinical_info(file_data.get("Clinical", {})):
+        return False, "invalid clinical information"
 
-        for variant in variants:
-            position, ref, alt, heteroplasmy = variant[1], variant[2], variant[3], variant[4]
-            var_lbl = ref + str(int(position)) + alt  # Construct variant label (e.g., "A3243G")
+    # Validate sample information
+    if not verify_sample_info(file_data.get("Sample", {})):
+        return False, "invalid sample information"
 
-            # Check if the input variant is found in the JSON data
-            if input_variant == var_lbl:
-                presence_input_var = True
+    # Validate HPO information (missing terms are only reported)
+    if not verify_HPO(file_data.get("Ontology", {})):
+        logging.warning(f"Missing HPO terms in: {input_file}")
 
-                if not heteroplasmy:
-                    logging.error(f"No heteroplasmy rate for variant: {input_variant}")
-                    return False
+    # Validate variant information and input variants presence
+    try:
+        # Records parsed incrementally only hold the catalog variants that can reach the outputs
+        return verify_catalog(file_data.get("Catalog", []), compile_variant_keys(input_variants), het_threshold,
+                              getattr(file_data, "catalog_size", None))
+    except KeyError as e:
+        logging.error(f"Missing field {e} in a variant of: {input_file}")
+        return False, f"missing field {e} in a variant"
 
-                if float(heteroplasmy) < float(het_threshold):
-                    logging.error(f"The variant '{input_variant}' has less than {het_threshold}% heteroplasmy.")
-                    return False
 
-            # Special handling for "A3243G" variant
-            if var_lbl == "A3243G":
-                presence_m3243 = True
+# Entry points of the former verification stage, kept for compatibility as thin wrappers over
+# verify_catalog and verify_patient_record
 
-        if not presence_input_var:
-            logging.error(f"Mutation {input_variant} not found.")
-            return False
+# Fields of a variant row [chr, pos, ref, alt, heteroplasmy_rate] (see variants_unique_format)
+VARIANT_ROW_FIELDS = ("chr", "pos", "ref", "alt", "heteroplasmy_rate")
 
-        if presence_m3243 and len(variants) == 1:
-            logging.warning("Only mutation A3243G detected.")
+
+def verify_variants(variants):
+    """
+    Validate the variant information section.
+
+    :param variants: List of variant rows [chr, pos, ref, alt, heteroplasmy_rate] extracted from the JSON file.
+    :return: True if valid, otherwise False.
+    """
+    for variant in variants:
+        _, _, reason = checking_catalog_variant(dict(zip(VARIANT_ROW_FIELDS, variant)))
+        if reason:
+            logging.error(f"{reason[0].upper()}{reason[1:]}")
+            return False
 
     return True
 
 
-def verify_HPO(HPO_info):
+def verify_presence_of_input_variants(variants, input_variants, het_threshold):
     """
-    Validate the presence of at least one HPO term in the JSON file.
+    Validate the presence of specified input variants in the JSON data.
 
-    :param HPO_info: Dictionary containing HPO terms.
-    :return: True if at least one HPO term is present, otherwise False.
+    :param variants: List of variant rows [chr, pos, ref, alt, heteroplasmy_rate] extracted from the JSON.
+    :param input_variants: Comma-separated string of expected variants (e.g., "A3243G,G11778A").
+    :param het_threshold: Minimum heteroplasmy rate required.
+    :return: True if all specified variants are present and meet the threshold, otherwise False.
     """
-    return bool(HPO_info.get("hpo", False))
+    passed, _ = verify_catalog([dict(zip(VARIANT_ROW_FIELDS, variant)) for variant in variants],
+                               compile_variant_keys(input_variants), het_threshold)
+    return passed
 
 
 def verification_JSON(input_file, input_variants, het_threshold):
@@ -170,39 +275,49 @@ def verification_JSON(input_file, input_variants, het_threshold):
     :return: Filename (if valid) or False (if validation fails).
     """
     logging.info(f"Loading: {input_file}")
-    file_data = load_json(input_file)
+    return verification_patient_data(load_json(input_file), input_file, input_variants, het_threshold)
 
-    if not file_data:
-        return False  # JSON loading failed
 
-    # Validate clinical information
-    clinical_info = file_data.get("Clinical", {})
-    clinical_test = verify_clinical_info(clinical_info)
+def verification_patient_data(file_data, input_file, input_variants, het_threshold):
+    """
+    Perform a comprehensive validation of an already loaded patient JSON.
 
-    # Validate sample information
-    sample_info = file_data.get("Sample", {})
-    sample_test = verify_sample_info(sample_info)
+    :param file_data: Patient data as returned by load_json.
+    :param input_file: Path of the JSON file the data was loaded from.
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_threshold: Minimum heteroplasmy rate required.
+    :return: Filename (if valid) or False (if validation fails).
+    """
+    passed, _ = verify_patient_record(file_data, input_file, input_variants, het_threshold)
 
-    # Validate HPO information
-    HPO_info = file_data.get("Ontology", {})
-    HPO_test = verify_HPO(HPO_info)
+    if not passed:
+        return False  # At least one validation failed
 
-    if not HPO_test:
-        logging.warning(f"Missing HPO terms in: {input_file}")
+    return input_file.split("/")[-1]  # Return the filename if validation is successful
 
-    # Validate variant information
-    variants = file_data.get("Catalog", [])
-    variant_array = [
-        [variant["chr"], variant["pos"], variant["ref"], variant["alt"], variant["heteroplasmy_rate"]]
-        for variant in variants
-    ]
-    variant_test = verify_variants(variant_array)
 
-    # Validate input variants presence
-    input_variants_test = verify_presence_of_input_variants(variant_array, input_variants, het_threshold)
+# Formats of the verification report
+REPORT_FORMATS = ("csv", "json")
 
-    # Check overall validation results
-    if any(not test for test in [clinical_test, sample_test, variant_test, input_variants_test]):
-        return False  # At least one validation failed
 
-    return input_file.split("/")[-1]  # Return the filename if validation is successful
+def writing_verification_report(report_rows, output_folder, report_format="csv"):
+    """
+    Write the machine-readable verification report: one entry per tested file with its status
+    ("passed", "failed" or "error") and the reason of the failure.
+
+    :param report_rows: List of dictionaries {"filename", "status", "reason"}.
+    :param output_folder: Folder where verification_report.csv (or .json) is written.
+    :param report_format: "csv" or "json".
+    :return: Path of the written report.
+    """
+    output_path = os.path.join(output_folder, f"verification_report.{report_format}")
+
+    with open(output_path, "w", newline="") as fh_out:
+        if report_format == "json":
+            json.dump(report_rows, fh_out, indent=1)
+        else:
+            writer = csv.DictWriter(fh_out, fieldnames=["filename", "status", "reason"], delimiter=";")
+            writer.writeheader()
+            writer.writerows(report_rows)
+
+    return output_path
@@ -0,0 +1,285 @@
+import gzip
+import io
+import json  # Module for decoding the JSON values one by one
+import logging  # Module for logging errors and warnings
+import os
+import re
+
+from JSON_verification import checking_catalog_variant, opening_json_file
+from variant_key import ALLELE_BITS, M3243_KEY, compile_variant_keys, variant_key
+
+# Incremental parsing of large patient files: instead of decoding the whole JSON tree, the file is read by
+# chunks and the "Catalog" entries are decoded one by one. Each entry is checked as it is read and only the
+# variants that can reach the outputs are kept: those above the heteroplasmy threshold (and accepted by the
+# variant filter), the requested variants and A3243G. The entries dropped are valid variants that the
+# verification would only count, so the reduced record gives the same verification, HPO and variant results
+# as the full one, with a memory use that does not depend on the size of the catalog.
+
+CATALOG_STREAMING_SIZE = 16 * 2 ** 20  # Files of at least this size (bytes) are parsed incrementally
+CHUNK_SIZE = 2 ** 20  # Characters read at a time
+
+WHITESPACE_CHARACTERS = " \t\n\r"
+WHITESPACE = re.compile(f"[{WHITESPACE_CHARACTERS}]*")
+
+
+class StreamedPatientRecord(dict):
+    """
+    Patient record parsed incrementally: the JSON sections, with a reduced "Catalog".
+    """
+
+    catalog_size = None  # Number of variants of the "Catalog" section of the file
+
+
+class IncrementalJSONReader:
+    """
+    Reads a JSON document by chunks, value by value.
+    """
+
+    def __init__(self, fh, chunk_size=CHUNK_SIZE):
+        """
+        :param fh: Text file handle.
+        :param chunk_size: Number of characters read at a time.
+        """
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0  # Position of the next character to parse in the buffer
+        self.eof = False
+
+    def reading_chunk(self, size=None):
+        """
+        Appends the next characters of the file to the unparsed part of the buffer.
+
+        :param size: Number of characters to read (default: chunk_size).
+        :return: False at the end of the file.
+        """
+        chunk = self.fh.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peeking(self):
+        """
+        Skips the whitespace and returns the next character ("" at the end of the file).
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.reading_chunk():
+                return ""
+
+    def expecting(self, characters):
+        """
+        Consumes the next character, which must be one of the given characters.
+
+        :return: The character consumed.
+        """
+        character = self.peeking()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f"Expecting one of '{characters}'", self.buffer, self.pos)
+        self.pos += 1
+        return character
+
+    def decoding_value(self):
+        """
+        Decodes the next JSON value.
+        """
+        self.peeking()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number ending with the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Reads at least as much as already buffered, so a large value is decoded a few times only
+            self.reading_chunk(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def iterating_array(self):
+        """
+        Yields the values of the next JSON array one by one.
+        """
+        self.expecting("[")
+        if self.peeking() == "]":
+            self.pos += 1
+            return
+
+        scan_once, skipping_whitespace = self.decoder.scan_once, WHITESPACE.match
+        while True:
+            # Fast path: the value and its separator are in the buffer
+            buffer, pos = self.buffer, self.pos
+            if pos < len(buffer) and buffer[pos] in WHITESPACE_CHARACTERS:
+                pos = skipping_whitespace(buffer, pos).end()
+            try:
+                value, end = scan_once(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                end = len(buffer)  # Incomplete (or invalid) value
+            if end < len(buffer) and buffer[end] in WHITESPACE_CHARACTERS:
+                end = skipping_whitespace(buffer, end).end()
+            if end < len(buffer):
+                if buffer[end] == ",":
+                    self.pos = end + 1
+                    yield value
+                    continue
+                if buffer[end] == "]":
+                    self.pos = end + 1
+                    yield value
+                    return
+
+            # Otherwise the value is decoded again, reading the next chunks as needed
+            value = self.decoding_value()
+            separator = self.expecting(",]")
+            yield value
+            if separator == "]":
+                return
+
+    def ending(self):
+        """
+        Checks that nothing but whitespace follows the document.
+        """
+        if self.peeking():
+            raise json.JSONDecodeError("Extra data", self.buffer, self.pos)
+
+
+def filtering_catalog(variants, requested_variants, het_treshold, variant_filter=None):
+    """
+    Keeps the catalog variants that can reach the outputs, checking each one as it is read.
+
+    Once a variant fails the checks, it is kept (the verification stops on it) and the next ones are dropped.
+
+    :param variants: Iterable of variant dictionaries.
+    :param requested_variants: Mapping { variant key: label } of the requested variants.
+    :param het_treshold: Heteroplasmy threshold of the variant table.
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :return: Tuple (kept variants, number of variants read).
+    """
+    kept = []
+    catalog_size = 0
+    checking = True
+    het_treshold = int(het_treshold)  # As in variants_unique_format.structuring_sample_information
+
+    # Positions of the requested variants and of A3243G: the key of the other variants is not needed
+    if any(isinstance(key, str) for key in requested_variants):
+        requested_positions = None  # Variants without integer key (see variant_key), every key is computed
+    else:
+        requested_positions = {key >> (2 * ALLELE_BITS) for key in (*requested_variants, M3243_KEY)}
+
+    for variant in variants:
+        catalog_size += 1
+        if not checking:
+            continue
+
+        try:
+            position, heteroplasmy_value, reason = checking_catalog_variant(variant)
+        except (KeyError, TypeError, AttributeError):
+            reason = "malformed variant"  # Reported by the verification
+        if reason:
+            kept.append(variant)
+            checking = False
+            continue
+
+        if requested_positions is None or position in requested_positions:
+            key = variant_key(position, variant["ref"], variant["alt"])
+            if key in requested_variants or key == M3243_KEY:
+                kept.append(variant)
+                continue
+        if heteroplasmy_value > het_treshold and (
+                variant_filter is None or variant_filter.accepting(variant["pos"], variant["ref"], variant["alt"])):
+            kept.append(variant)
+
+    return kept, catalog_size
+
+
+def parsing_patient_record(reader, requested_variants, het_treshold, variant_filter=None):
+    """
+    Parses a patient JSON document, reducing its "Catalog" section with filtering_catalog.
+
+    :param reader: IncrementalJSONReader of the document.
+    :param requested_variants: Mapping { variant key: label } of the requested variants.
+    :param het_treshold: Heteroplasmy threshold of the variant table.
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :return: StreamedPatientRecord (or the decoded value if the document is not an object).
+    """
+    if reader.peeking() != "{":
+        value = reader.decoding_value()
+        reader.ending()
+        return value
+
+    record = StreamedPatientRecord()
+    reader.expecting("{")
+    separator = "," if reader.peeking() != "}" else reader.expecting("}")
+
+    while separator == ",":
+        key = reader.decoding_value()
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", reader.buffer, reader.pos)
+        reader.expecting(":")
+
+        if key == "Catalog" and reader.peeking() == "[":
+            record[key], record.catalog_size = filtering_catalog(reader.iterating_array(), requested_variants,
+                                                                 het_treshold, variant_filter)
+        else:
+            record[key] = reader.decoding_value()
+        separator = reader.expecting(",}")
+
+    reader.ending()
+    return record
+
+
+def load_streamed_patient_record(input_file, input_variants, het_treshold, variant_filter=None, content=None):
+    """
+    Load a patient JSON file incrementally, keeping only the catalog variants that can reach the outputs.
+
+    :param input_file: Path to the JSON file (".json" or ".json.gz").
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Heteroplasmy threshold of the variant table (the lowest one in a parameter sweep).
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param content: Content of the record when it was read from an archive or a bundle (see input_sources),
+                    input_file being then only used in the messages.
+    :return: StreamedPatientRecord if successful, else False (as JSON_verification.load_json).
+    """
+    try:
+        if content is None:
+            fh = opening_json_file(input_file)
+        else:
+            fh = io.BytesIO(content)
+            if input_file.endswith(".gz"):
+                fh = gzip.GzipFile(fileobj=fh)
+            fh = io.TextIOWrapper(fh, encoding="utf-8")
+
+        with fh:
+            return parsing_patient_record(IncrementalJSONReader(fh), compile_variant_keys(input_variants),
+                                          het_treshold, variant_filter)
+    except FileNotFoundError:
+        logging.error(f"Error: File '{input_file}' not found.")
+        return False
+    except (ValueError, gzip.BadGzipFile, EOFError):  # ValueError covers JSONDecodeError and UnicodeDecodeError
+        logging.error(f"Error: File '{input_file}' is not a valid JSON.")
+        return False
+
+
+def streaming_catalog(input_file, catalog_streaming_size=CATALOG_STREAMING_SIZE, content=None):
+    """
+    Tells whether a patient file is large enough to be parsed incrementally.
+
+    :param input_file: Path to the JSON file.
+    :param catalog_streaming_size: Size threshold in bytes (None = never, 0 = always), compared with the size
+                                   of the file (compressed for a gzipped file).
+    :param content: Content of the record when it was read from an archive or a bundle.
+    """
+    if catalog_streaming_size is None:
+        return False
+    if content is not None:
+        return len(content) >= catalog_streaming_size
+    try:
+        return os.path.getsize(input_file) >= catalog_streaming_size
+    except OSError:
+        return False  # Reported by load_json
@@ -0,0 +1,296 @@
+import argparse
+import json  # Module for the index metadata
+import logging  # Module for logging warnings and errors
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from cohort_store import sample_identifier
+
+# Cohort index: persistent inverted indexes of the cohort, written to the "cohort_index" folder of the output
+# folder and memory-mapped by the query command, so carrier, co-occurrence and phenotype lookups read a few
+# pages of sorted arrays instead of the output CSV files (or the patient JSON files).
+#
+# Samples (patient files with variants) and patients are numbered in the arrays below:
+#   - variant -> samples: the variants are sorted by position, the samples carrying variant i (with their
+#     heteroplasmy rates) being variant_samples[variant_offsets[i]:variant_offsets[i + 1]], in increasing order;
+#   - HPO term -> patients: the terms are sorted by id, the patients having term i being
+#     hpo_patients[hpo_offsets[i]:hpo_offsets[i + 1]], in increasing order.
+# Since every list is sorted, a co-occurrence is the intersection of sorted arrays.
+
+COHORT_INDEX_VERSION = 2  # Bump when the arrays below change
+COHORT_INDEX_FOLDER = "cohort_index"
+
+COHORT_INDEX_ARRAYS = ("samples", "sample_patient", "patients",
+                       "variant_positions", "variant_labels", "variant_offsets", "variant_samples",
+                       "variant_heteroplasmy",
+                       "hpo_ids", "hpo_names", "hpo_offsets", "hpo_patients")
+
+LABEL_POSITION = re.compile(r"[0-9]+")  # Position in a variant label such as "A3243G"
+
+
+def grouping_offsets(group_index, group_count):
+    """
+    Returns the offsets of the groups of a sorted group index: group i is offsets[i]:offsets[i + 1].
+    """
+    offsets = np.zeros(group_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group_index, minlength=group_count), out=offsets[1:])
+    return offsets
+
+
+def building_cohort_index(variant_table, hpo_result, input_folder):
+    """
+    Builds the inverted indexes of a cohort.
+
+    :param variant_table: VariantTable of the verified files.
+    :param hpo_result: Dictionary { patient_id: [(hpo_id, hpo_name), ...] } of the cohort.
+    :param input_folder: Input folder of the run, the sample identifiers being relative to it
+                         (see cohort_store.sample_identifier).
+    :return: Dictionary { array name: NumPy array } (see COHORT_INDEX_ARRAYS).
+    """
+    # Samples and patients (a patient without variants may still have HPO terms)
+    samples = np.array([sample_identifier(file_name, input_folder) for file_name in variant_table.file_names],
+                       dtype=str)
+    sample_patient_ids = [patient_row[0] for patient_row in variant_table.patient_rows]
+    patients, sample_patient = np.unique(np.array(sample_patient_ids + list(hpo_result), dtype=str),
+                                         return_inverse=True)
+    sample_patient = sample_patient[:len(samples)].astype(np.uint32)
+
+    # Variant -> samples: variant codes (position, ref code, alt code) sorted by position
+    columns = variant_table.columns()
+    allele_count = max(len(variant_table.decoding["allele"]), 1)
+    codes = (columns["pos"].astype(np.int64) * allele_count + columns["ref"]) * allele_count + columns["alt"]
+    variant_codes, variant_index = np.unique(codes, return_inverse=True)
+
+    # The rows are in sample order, so a stable sort keeps the samples of each variant sorted
+    order = np.argsort(variant_index, kind="stable")
+    alleles = variant_table.decoding["allele"]
+    positions, allele_codes = np.divmod(variant_codes, allele_count * allele_count)
+    variant_labels = np.array([f"{alleles[code // allele_count]}{position}{alleles[code % allele_count]}"
+                               for position, code in zip(positions.tolist(), allele_codes.tolist())], dtype=str)
+
+    # HPO term -> patients, the identifiers stored as in the HPO file ("HP_0001250") whatever their source
+    pairs = [(hpo_id.replace(":", "_"), hpo_name, patient_id) for patient_id, hpos in hpo_result.items()
+             for hpo_id, hpo_name in hpos]
+    hpo_names_by_id = {hpo_id: hpo_name for hpo_id, hpo_name, _ in pairs}
+    hpo_ids, hpo_index = np.unique(np.array([hpo_id for hpo_id, _, _ in pairs], dtype=str), return_inverse=True)
+    hpo_patient = np.searchsorted(patients, np.array([patient_id for _, _, patient_id in pairs], dtype=str))
+    hpo_order = np.lexsort((hpo_patient, hpo_index))
+
+    return {
+        "samples": samples,
+        "sample_patient": sample_patient,
+        "patients": patients,
+        "variant_positions": positions.astype(np.int32),
+        "variant_labels": variant_labels,
+        "variant_offsets": grouping_offsets(variant_index, len(variant_codes)),
+        "variant_samples": columns["patient_index"][order].astype(np.uint32),
+        "variant_heteroplasmy": columns["heteroplasmy_rate"][order],
+        "hpo_ids": hpo_ids,
+        "hpo_names": np.array([hpo_names_by_id[hpo_id] for hpo_id in hpo_ids.tolist()], dtype=str),
+        "hpo_offsets": grouping_offsets(hpo_index, len(hpo_ids)),
+        "hpo_patients": hpo_patient[hpo_order].astype(np.uint32),
+    }
+
+
+def writing_cohort_index(variant_table, hpo_result, output_folder, input_folder):
+    """
+    Builds the inverted indexes of a cohort and writes them to the "cohort_index" folder of the output folder.
+
+    The arrays are written before the metadata file, which is what makes the index valid.
+
+    :param variant_table: VariantTable of the verified files.
+    :param hpo_result: Dictionary { patient_id: [(hpo_id, hpo_name), ...] } of the cohort.
+    :param output_folder: Output folder of the run.
+    :param input_folder: Input folder of the run (see building_cohort_index).
+    :return: Path of the index folder.
+    """
+    index_folder = os.path.join(output_folder, COHORT_INDEX_FOLDER)
+    os.makedirs(index_folder, exist_ok=True)
+    metadata_path = os.path.join(index_folder, "cohort_index.json")
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    arrays = building_cohort_index(variant_table, hpo_result, input_folder)
+    for name, values in arrays.items():
+        np.save(os.path.join(index_folder, f"{name}.npy"), values)
+
+    metadata = {"version": COHORT_INDEX_VERSION, "samples": len(arrays["samples"]),
+                "patients": len(arrays["patients"]), "variants": len(arrays["variant_labels"]),
+                "variant_rows": len(arrays["variant_samples"]), "hpo_terms": len(arrays["hpo_ids"])}
+    with open(metadata_path, "w") as fh:
+        json.dump(metadata, fh, indent=2)
+
+    logging.info(f"Cohort index: {metadata['variants']} variants in {metadata['samples']} samples, "
+                 f"{metadata['hpo_terms']} HPO terms in {metadata['patients']} patients.")
+    return index_folder
+
+
+class CohortIndex:
+    """
+    Inverted indexes of a cohort, memory-mapped from an index folder (see writing_cohort_index).
+
+    Usage:
+        index = load_cohort_index("output/cohort_index")
+        samples, heteroplasmy = index.carriers("T14709C", min_het=20)
+        patients = index.phenotype_patients(["HP_0001250"])
+    """
+
+    def __init__(self, arrays):
+        """
+        :param arrays: Dictionary { array name: NumPy array } (see COHORT_INDEX_ARRAYS).
+        """
+        for name in COHORT_INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def variant_number(self, label):
+        """
+        Returns the number of a variant in the index, or None if no sample carries it.
+
+        :param label: Variant label, e.g. "A3243G".
+        """
+        match = LABEL_POSITION.search(label)
+        if match is None:
+            return None
+        position = int(match.group())
+        start = np.searchsorted(self.variant_positions, position, side="left")
+        end = np.searchsorted(self.variant_positions, position, side="right")
+        for number in range(start, end):
+            if self.variant_labels[number] == label:
+                return number
+        return None
+
+    def carriers(self, label, min_het=None):
+        """
+        Returns the samples carrying a variant.
+
+        :param label: Variant label, e.g. "A3243G".
+        :param min_het: Only the samples with a heteroplasmy rate of at least this value are returned.
+        :return: Tuple (sorted sample numbers, heteroplasmy rates).
+        """
+        number = self.variant_number(label)
+        if number is None:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float64)
+
+        start, end = self.variant_offsets[number], self.variant_offsets[number + 1]
+        samples, heteroplasmy = self.variant_samples[start:end], self.variant_heteroplasmy[start:end]
+        if min_het is not None:
+            kept = heteroplasmy >= min_het
+            samples, heteroplasmy = samples[kept], heteroplasmy[kept]
+        return samples, heteroplasmy
+
+    def co_carriers(self, labels, min_het=None):
+        """
+        Returns the samples carrying every given variant.
+
+        :param labels: Variant labels.
+        :param min_het: Minimum heteroplasmy rate of each variant.
+        :return: Sorted sample numbers.
+        """
+        samples = None
+        for label in labels:
+            carrying = self.carriers(label, min_het)[0]
+            samples = carrying if samples is None else np.intersect1d(samples, carrying)
+            if not len(samples):
+                break
+        return samples if samples is not None else np.empty(0, dtype=np.uint32)
+
+    def phenotype_patients(self, hpo_ids):
+        """
+        Returns the patients having every given HPO term.
+
+        :param hpo_ids: HPO IDs ("HP_0001250" or "HP:0001250").
+        :return: Sorted patient numbers.
+        """
+        patients = None
+        for hpo_id in hpo_ids:
+            hpo_id = hpo_id.replace(":", "_")
+            number = np.searchsorted(self.hpo_ids, hpo_id)
+            if number < len(self.hpo_ids) and self.hpo_ids[number] == hpo_id:
+                having = self.hpo_patients[self.hpo_offsets[number]:self.hpo_offsets[number + 1]]
+            else:
+                having = np.empty(0, dtype=np.uint32)
+            patients = having if patients is None else np.intersect1d(patients, having)
+            if not len(patients):
+                break
+        return patients if patients is not None else np.empty(0, dtype=np.uint32)
+
+    def sample_patients(self, samples):
+        """
+        Returns the sorted patient numbers of sample numbers.
+        """
+        return np.unique(self.sample_patient[samples])
+
+
+def load_cohort_index(index_folder):
+    """
+    Loads a cohort index, memory-mapping its arrays.
+
+    :param index_folder: Index folder (the "cohort_index" folder of an output folder, or the output folder).
+    :return: CohortIndex.
+    :raises ValueError: If the folder holds no valid index.
+    """
+    if not os.path.isfile(os.path.join(index_folder, "cohort_index.json")):
+        index_folder = os.path.join(index_folder, COHORT_INDEX_FOLDER)
+
+    try:
+        with open(os.path.join(index_folder, "cohort_index.json")) as fh:
+            metadata = json.load(fh)
+        if metadata.get("version") != COHORT_INDEX_VERSION:
+            raise ValueError(f"version {metadata.get('version')}, expected {COHORT_INDEX_VERSION}")
+        return CohortIndex({name: np.load(os.path.join(index_folder, f"{name}.npy"), mmap_mode="r")
+                            for name in COHORT_INDEX_ARRAYS})
+    except (OSError, ValueError) as e:
+        raise ValueError(f"No valid cohort index in '{index_folder}': {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the cohort index of an output folder.')
+    parser.add_argument('index_folder', type=str, help='Output folder of a run, or its "cohort_index" folder')
+    queries = parser.add_subparsers(dest='query', required=True)
+
+    carriers_parser = queries.add_parser('carriers', help='Samples carrying a variant, with their heteroplasmy')
+    carriers_parser.add_argument('variant', type=str, help='Variant label, e.g. "T14709C"')
+    carriers_parser.add_argument('--min-het', type=float, default=None, help='Minimum heteroplasmy rate')
+
+    cooccurrence_parser = queries.add_parser('cooccurrence', help='Samples carrying every given variant')
+    cooccurrence_parser.add_argument('variants', type=str, nargs='+', help='Variant labels')
+    cooccurrence_parser.add_argument('--min-het', type=float, default=None,
+                                     help='Minimum heteroplasmy rate of each variant')
+
+    phenotype_parser = queries.add_parser('phenotype', help='Patients having every given HPO term')
+    phenotype_parser.add_argument('hpo_ids', type=str, nargs='+', help='HPO IDs, e.g. "HP_0001250"')
+    phenotype_parser.add_argument('--variant', type=str, action='append', default=[],
+                                  help='Only the patients with a sample carrying this variant (repeatable)')
+    phenotype_parser.add_argument('--min-het', type=float, default=None,
+                                  help='Minimum heteroplasmy rate of the --variant variants')
+
+    args = parser.parse_args()
+    try:
+        index = load_cohort_index(args.index_folder)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    if args.query == 'carriers':
+        samples, heteroplasmy = index.carriers(args.variant, args.min_het)
+        lines = [f"{index.samples[sample]};{index.patients[index.sample_patient[sample]]};{het}"
+                 for sample, het in zip(samples.tolist(), heteroplasmy.tolist())]
+        header, count = "sample_id;patient_id;heteroplasmy", f"{len(samples)} samples"
+    elif args.query == 'cooccurrence':
+        samples = index.co_carriers(args.variants, args.min_het)
+        lines = [f"{index.samples[sample]};{index.patients[index.sample_patient[sample]]}" for sample in samples.tolist()]
+        header, count = "sample_id;patient_id", f"{len(samples)} samples"
+    else:
+        patients = index.phenotype_patients(args.hpo_ids)
+        if args.variant:
+            patients = np.intersect1d(patients, index.sample_patients(index.co_carriers(args.variant, args.min_het)))
+        lines = [str(index.patients[patient]) for patient in patients.tolist()]
+        header, count = "patient_id", f"{len(patients)} patients"
+    elapsed = time.perf_counter() - start
+
+    print("\n".join([header] + lines))
+    print(f"{count} ({elapsed * 1000:.2f} ms)", file=sys.stderr)
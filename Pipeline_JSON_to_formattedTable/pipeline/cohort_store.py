@@ -0,0 +1,260 @@
+import logging  # Module for logging the loads
+import os
+import sqlite3
+import time
+
+from variant_key import variant_key
+
+# Cohort store: the verified patients of a run are bulk-loaded into an embedded SQLite database, indexed
+# for the usual questions (carriers of a variant above a heteroplasmy rate, patients of a tissue or with
+# an HPO term) so they no longer mean reloading and scanning the output CSV files. Loads are upserts:
+# a sample (patient file) loaded again replaces its previous rows, so new batches are added to an existing
+# database without rebuilding it. A run is loaded in a single transaction, committed when the store is closed.
+# When the database has no variants yet, the search indexes are built once at the end of the load, which
+# is faster than keeping them up to date row by row.
+
+SCHEMA_VERSION = 2  # Bump when the tables below change
+BATCH_SIZE = 1000  # Samples written at a time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    sex TEXT,
+    age_of_onset INTEGER
+);
+CREATE TABLE IF NOT EXISTS samples (
+    sample_id TEXT PRIMARY KEY,          -- Path relative to the input folder, see sample_identifier
+    file_name TEXT,                      -- File name without its ".json" (or ".json.gz") extension
+    patient_id TEXT NOT NULL,
+    age_at_sampling INTEGER,
+    tissue TEXT,
+    type TEXT,
+    haplogroup TEXT,
+    m3243_het REAL,
+    m3243_het_normalized REAL,
+    source TEXT,                         -- Input path of the sample
+    loaded_at TEXT
+);
+CREATE TABLE IF NOT EXISTS variants (
+    sample_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    chr TEXT,
+    pos INTEGER,
+    ref TEXT,
+    alt TEXT,
+    variant_key INTEGER,                 -- See variant_key.variant_key (the label for unusual alleles)
+    variant TEXT,                        -- Label, e.g. "T14709C"
+    heteroplasmy REAL
+);
+CREATE TABLE IF NOT EXISTS hpo_terms (
+    patient_id TEXT NOT NULL,
+    hpo_id TEXT NOT NULL,
+    hpo_name TEXT,
+    PRIMARY KEY (patient_id, hpo_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS variants_sample ON variants (sample_id);
+"""
+
+# Search indexes (the sample index above is needed by the upserts)
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS variants_label_heteroplasmy ON variants (variant, heteroplasmy)",
+    "CREATE INDEX IF NOT EXISTS variants_pos ON variants (pos)",
+    "CREATE INDEX IF NOT EXISTS variants_patient ON variants (patient_id)",
+    "CREATE INDEX IF NOT EXISTS samples_patient ON samples (patient_id)",
+    "CREATE INDEX IF NOT EXISTS samples_tissue ON samples (tissue)",
+    "CREATE INDEX IF NOT EXISTS hpo_terms_hpo ON hpo_terms (hpo_id)",
+)
+
+UPSERT_PATIENT = """
+INSERT INTO patients (patient_id, sex, age_of_onset) VALUES (?, ?, ?)
+ON CONFLICT (patient_id) DO UPDATE SET sex = excluded.sex, age_of_onset = excluded.age_of_onset
+"""
+
+UPSERT_SAMPLE = """
+INSERT INTO samples (sample_id, file_name, patient_id, age_at_sampling, tissue, type, haplogroup, m3243_het,
+                     m3243_het_normalized, source, loaded_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (sample_id) DO UPDATE SET
+    file_name = excluded.file_name, patient_id = excluded.patient_id, age_at_sampling = excluded.age_at_sampling,
+    tissue = excluded.tissue, type = excluded.type, haplogroup = excluded.haplogroup, m3243_het = excluded.m3243_het,
+    m3243_het_normalized = excluded.m3243_het_normalized, source = excluded.source, loaded_at = excluded.loaded_at
+"""
+
+INSERT_VARIANT = """
+INSERT INTO variants (sample_id, patient_id, chr, pos, ref, alt, variant_key, variant, heteroplasmy)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def removing_extension(path):
+    """
+    Returns a patient file path without its ".json" (or ".json.gz") extension.
+
+    The key of the file in the variant tables (its path without ".json", "<path>.gz" for a gzipped file) gives
+    the same result.
+    """
+    for extension in (".json.gz", ".json", ".gz"):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def sample_name(input_path):
+    """
+    Returns the file name of a patient file without its ".json" (or ".json.gz") extension.
+    """
+    return removing_extension(os.path.basename(input_path))
+
+
+def sample_identifier(input_path, input_folder):
+    """
+    Returns the sample identifier of a patient file: its path relative to the input folder without the
+    ".json" (or ".json.gz") extension, the containers included (e.g. "batch_2.tar/blood/P0001" for a file
+    read from an archive), so files of the same name in different containers or subfolders stay distinct.
+
+    :param input_path: Path of the patient file, or its key in the variant tables.
+    :param input_folder: Input folder of the run (or the single archive or bundle given instead, whose
+                         name is then part of the identifier).
+    :return: Sample identifier.
+    """
+    root = input_folder if os.path.isdir(input_folder) else os.path.dirname(input_folder)
+    return removing_extension(os.path.relpath(input_path, root).replace(os.sep, "/"))
+
+
+class CohortStore:
+    """
+    SQLite database of the verified patients, their samples, variants and HPO terms.
+
+    Usage:
+        store = CohortStore(db_path, input_folder)
+        for patient_result in patient_results:
+            store.add_patient_result(patient_result)
+        store.close()
+    """
+
+    def __init__(self, db_path, input_folder, batch_size=BATCH_SIZE):
+        """
+        :param db_path: Path of the database, created if missing.
+        :param input_folder: Input folder of the run, the sample identifiers being relative to it.
+        :param batch_size: Number of samples buffered before they are written.
+        :raises ValueError: If the file is not a cohort database of this schema version.
+        """
+        self.db_path = db_path
+        self.input_folder = input_folder
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(db_path)
+        try:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            self.connection.close()
+            raise ValueError(f"'{db_path}' is not a SQLite database: {e}")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError(f"Cohort database '{db_path}' has schema version {version}, expected {SCHEMA_VERSION}.")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.execute("BEGIN")
+
+        # First load: the search indexes are built by close
+        self.deferring_indexes = self.connection.execute("SELECT 1 FROM variants LIMIT 1").fetchone() is None
+        if self.deferring_indexes:
+            for statement in INDEXES:
+                self.connection.execute(f"DROP INDEX IF EXISTS {statement.split()[5]}")
+        else:
+            for statement in INDEXES:
+                self.connection.execute(statement)
+
+        self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.pending = []  # Per-patient results not written yet
+        self.sample_count = 0
+        self.variant_count = 0
+        self.variant_keys = {}  # { (pos, ref, alt): (variant key, label) }, the cohort sharing most variants
+
+    def add_patient_result(self, patient_result):
+        """
+        Adds the result of a verified patient file (see patient_record.process_patient_record).
+
+        :param patient_result: Per-patient result dictionary.
+        """
+        self.pending.append(patient_result)
+        if len(self.pending) >= self.batch_size:
+            self.flushing()
+
+    def flushing(self):
+        """
+        Writes the buffered samples: their previous rows are replaced by the new ones.
+        """
+        patients, samples, sample_ids, variants, hpo_terms = {}, [], [], [], {}
+
+        for patient_result in self.pending:
+            # The patient and sample columns come with the result, also for a sample without (kept) variants
+            for input_path, information in patient_result["patient"].items():
+                sample_id = sample_identifier(input_path, self.input_folder)
+                sample_ids.append((sample_id,))
+                patients[information[0]] = tuple(information[:3])
+                m3243 = tuple(information[7:9]) if len(information) >= 9 else (None, None)
+                samples.append((sample_id, sample_name(input_path), information[0], *information[3:7], *m3243,
+                                input_path, self.loaded_at))
+
+            for input_path, sample_variants in patient_result["variants"].items():
+                sample_id = sample_identifier(input_path, self.input_folder)
+                patient_id = patient_result["patient"][input_path][0]
+                for row in sample_variants.variant_rows():
+                    variant = (row[1], row[2], row[3])
+                    keys = self.variant_keys.get(variant)
+                    if keys is None:
+                        keys = self.variant_keys[variant] = (variant_key(*variant), f"{row[2]}{row[1]}{row[3]}")
+                    variants.append((sample_id, patient_id, row[0], row[1], row[2], row[3], *keys, row[4]))
+
+            # A patient's HPO terms are those of its last sample, as in the HPO tables
+            hpo_terms.update(patient_result["hpo"])
+            for patient_id in patient_result["hpo"]:
+                patients.setdefault(patient_id, (patient_id, None, None))
+
+        cursor = self.connection.cursor()
+        cursor.executemany(UPSERT_PATIENT, patients.values())
+        cursor.executemany(UPSERT_SAMPLE, samples)
+        cursor.executemany("DELETE FROM variants WHERE sample_id = ?", sample_ids)
+        cursor.executemany(INSERT_VARIANT, variants)
+        cursor.executemany("DELETE FROM hpo_terms WHERE patient_id = ?", [(patient_id,) for patient_id in hpo_terms])
+        cursor.executemany("INSERT OR REPLACE INTO hpo_terms (patient_id, hpo_id, hpo_name) VALUES (?, ?, ?)",
+                           [(patient_id, hpo_id, hpo_name) for patient_id, hpos in hpo_terms.items()
+                            for hpo_id, hpo_name in hpos])
+
+        self.sample_count += len(self.pending)
+        self.variant_count += len(variants)
+        self.pending = []
+
+    def naming_hpo_terms(self, hpo_names):
+        """
+        Sets the names of HPO terms loaded without them (HPO names looked up through the API).
+
+        :param hpo_names: Dictionary { hpo_id: hpo_name }.
+        """
+        self.flushing()
+        self.connection.executemany("UPDATE hpo_terms SET hpo_name = ? WHERE hpo_id = ?",
+                                    [(hpo_name, hpo_id) for hpo_id, hpo_name in hpo_names.items()])
+
+    def close(self):
+        """
+        Writes the buffered samples, commits the load and closes the database.
+        """
+        self.flushing()
+        if self.deferring_indexes:
+            for statement in INDEXES:
+                self.connection.execute(statement)
+        self.connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('last_load', ?)",
+                                (self.loaded_at,))
+        self.connection.commit()
+        self.connection.execute("PRAGMA optimize")  # Refreshes the statistics used by the query planner
+        self.connection.close()
+
+        logging.info(f"{self.sample_count} samples and {self.variant_count} variants loaded into the cohort "
+                     f"database '{self.db_path}'.")
@@ -0,0 +1,233 @@
+import logging  # Module for logging errors and warnings
+
+from variant_generation_csv import variant_header
+
+# Columnar output: the variant and clinical tables written as typed Parquet or Arrow (Feather v2) files
+# instead of semicolon/tab text, so downstream loads (e.g. arrow::read_parquet in R) do not re-parse text.
+# Requires the optional 'pyarrow' package, imported only when one of these formats is requested.
+
+OUTPUT_FORMATS = ("csv", "parquet", "arrow")
+
+# File extension of each columnar format
+FORMAT_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Column types of the variant table ("category" columns are dictionary-encoded strings)
+VARIANT_COLUMN_TYPES = {
+    "chr": "category", "pos": "int32", "ref": "category", "alt": "category", "heteroplasmy_rate": "float64",
+    "patient_id": "string", "sex": "category", "age_of_onset": "int32", "age_at_sampling": "int32",
+    "tissue": "category", "type": "category", "haplogroup": "category",
+    "m3243_het": "float64", "m3243_het_normalized": "float64",
+    # Annotation columns (see variant_annotation)
+    "locus": "category", "strand": "category", "apogee1_score": "float64", "apogee1": "category",
+    "apogee2_score": "float64", "apogee2_probability": "float64", "apogee2": "category",
+    "t_apogee_score": "float64", "t_apogee_unbiased_score": "float64",
+}
+
+# Header of the clinical table (see generation_clinical_table.generation_clinical_table_csv)
+CLINICAL_HEADER = ["patient_id", "sex", "age_of_onset", "age_at_sampling", "tissue", "type", "haplogroup",
+                   "m3243_het", "m3243_het_normalized"]
+
+
+def importing_pyarrow():
+    """
+    Imports pyarrow, with an explicit message if the optional dependency is missing.
+
+    :return: The pyarrow module.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError("The 'parquet' and 'arrow' output formats require the 'pyarrow' package "
+                          "(pip install pyarrow).") from e
+    return pyarrow
+
+
+def converting_value(value, kind):
+    """
+    Converts one table value to the Python type of its column, empty values becoming nulls.
+
+    :param value: Raw value (string or number).
+    :param kind: Column type ("int32", "float64", "string" or "category").
+    :return: Converted value, or None for empty / unconvertible values.
+    """
+    if value is None or value == "":
+        return None
+
+    if kind == "int32":
+        try:
+            return int(value)
+        except ValueError:
+            return int(float(value))
+    if kind == "float64":
+        return float(value)
+
+    return str(value)
+
+
+def converting_clinical_column(values, kind):
+    """
+    Converts a clinical table column. Patients with several samples have comma-joined values
+    (e.g. "blood,urine"), so a numeric column falls back to strings if any value is not a number.
+
+    :param values: Column values.
+    :param kind: Preferred column type.
+    :return: Tuple (converted values, effective column type).
+    """
+    if kind in ("int32", "float64"):
+        try:
+            return [converting_value(value, kind) for value in values], kind
+        except ValueError:
+            kind = "string"
+    return [converting_value(value, kind) for value in values], kind
+
+
+def output_path_for_format(output_path, output_format):
+    """
+    Replaces the .csv extension of an output path by the extension of a columnar format.
+
+    :param output_path: Path of the CSV output.
+    :param output_format: "csv", "parquet" or "arrow".
+    :return: Path of the output in the requested format.
+    """
+    if output_format == "csv":
+        return output_path
+    return output_path.rsplit(".csv", 1)[0] + FORMAT_EXTENSIONS[output_format]
+
+
+class ColumnarTableWriter:
+    """
+    Writes rows to a Parquet or Arrow file by record batches, with a fixed typed schema.
+
+    Dictionary-encoded ("category") columns share one growing dictionary across batches, so the file
+    stays a single categorical column for readers.
+    """
+
+    def __init__(self, output_path, output_format, column_types, batch_size=65536):
+        """
+        :param output_path: Path of the output file.
+        :param output_format: "parquet" or "arrow".
+        :param column_types: Ordered dictionary { column_name: column type }.
+        :param batch_size: Number of rows buffered before a record batch is written.
+        """
+        self.pa = importing_pyarrow()
+        self.output_path = output_path
+        self.output_format = output_format
+        self.column_types = column_types
+        self.batch_size = batch_size
+
+        self.buffer = []  # Rows waiting to be written
+        self.dictionaries = {name: {} for name, kind in column_types.items() if kind == "category"}
+        self.schema = self.pa.schema([(name, self.arrow_type(kind)) for name, kind in column_types.items()])
+        self.writer = None
+
+    def arrow_type(self, kind):
+        pa = self.pa
+        return {
+            "int32": pa.int32(),
+            "float64": pa.float64(),
+            "string": pa.string(),
+            "category": pa.dictionary(pa.int32(), pa.string()),
+        }[kind]
+
+    def __enter__(self):
+        if self.output_format == "parquet":
+            self.writer = self.pa.parquet.ParquetWriter(self.output_path, self.schema)
+        else:
+            options = self.pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = self.pa.ipc.new_file(self.output_path, self.schema, options=options)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        self.writer.close()
+
+    def write_rows(self, rows):
+        """
+        Buffers rows and writes a record batch every batch_size rows.
+
+        :param rows: Iterable of rows, in the column order of column_types (missing trailing values are null).
+        """
+        for row in rows:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows as one record batch.
+        """
+        if not self.buffer:
+            return
+
+        pa = self.pa
+        arrays = []
+        for column, (name, kind) in enumerate(self.column_types.items()):
+            values = [converting_value(row[column] if column < len(row) else None, kind) for row in self.buffer]
+
+            if kind == "category":
+                # Codes in the dictionary shared by every batch of the file
+                dictionary = self.dictionaries[name]
+                codes = [None if value is None else dictionary.setdefault(value, len(dictionary)) for value in values]
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()),
+                                                             pa.array(list(dictionary), pa.string())))
+            else:
+                arrays.append(pa.array(values, self.arrow_type(kind)))
+
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self.buffer = []
+
+
+def generate_variant_columnar(variant_dictionnary, output_path, output_format, annotation=None):
+    """
+    Generates a Parquet or Arrow file containing variant data.
+
+    :param variant_dictionnary: Dictionary { patient: [variant rows] } (see generate_variant_csv).
+    :param output_path: Path where the file will be created.
+    :param output_format: "parquet" or "arrow".
+    :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+    """
+    column_types = {name: VARIANT_COLUMN_TYPES[name] for name in variant_header(annotation)}
+
+    with ColumnarTableWriter(output_path, output_format, column_types) as writer:
+        for values in variant_dictionnary.values():
+            writer.write_rows(values if annotation is None else annotation.annotating_rows(values))
+
+
+def generation_clinical_table_columnar(one_patient_by_row_dict, output_path, output_format):
+    """
+    Generates a Parquet or Arrow clinical table, one row per patient.
+
+    :param one_patient_by_row_dict: Dictionary where the key is the patient ID and the value is a list of aggregated data.
+    :param output_path: Path where the file will be created.
+    :param output_format: "parquet" or "arrow".
+    """
+    pa = importing_pyarrow()
+
+    rows = list(one_patient_by_row_dict.values())
+    arrays = []
+    fields = []
+
+    for column, name in enumerate(CLINICAL_HEADER):
+        raw_values = [row[column] if column < len(row) else None for row in rows]
+        values, kind = converting_clinical_column(raw_values, VARIANT_COLUMN_TYPES[name])
+
+        if kind != VARIANT_COLUMN_TYPES[name]:
+            logging.info(f"Clinical column '{name}' written as text (patients with several samples).")
+
+        if kind == "category":
+            array = pa.array(values, pa.string()).dictionary_encode()
+        else:
+            array = pa.array(values, {"int32": pa.int32(), "float64": pa.float64(), "string": pa.string()}[kind])
+
+        arrays.append(array)
+        fields.append((name, array.type))
+
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    if output_format == "parquet":
+        pa.parquet.write_table(table, output_path)
+    else:
+        with pa.ipc.new_file(output_path, table.schema) as writer:
+            writer.write_table(table)
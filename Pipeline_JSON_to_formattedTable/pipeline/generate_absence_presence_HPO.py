@@ -1,11 +1,96 @@
 import csv
+import os
+
+import numpy as np
+
+from HPO_ontology import propagating_presence_absence_matrix
+
+# Output formats of the presence/absence table
+PRESENCE_ABSENCE_FORMATS = ("dense", "sparse", "both")
+
+
+# Function to build the present (patient, HPO) pairs of the presence/absence HPO matrix
+def building_presence_absence_pairs(global_hpo, propagation=None):
+    """
+    This function builds the coordinates of the present HPO terms of each patient, without the matrix itself.
+
+    Every HPO name gets a column index in a vocabulary (in order of first appearance), so the pairs are
+    collected in one pass over the patients' HPO terms.
+
+    :param global_hpo: Dictionary containing patient HPO data, structured as
+                        {"patient_id": [(hpo_terms, hpo_name), ...]}.
+    :param propagation: Optional HPO_ontology.HPOPropagation, the patients' terms being propagated to their
+                        ancestors (see HPO_ontology.propagating_presence_absence_matrix).
+
+    :return: A tuple consisting of:
+        - patient_ids: List of patient IDs, one per matrix row.
+        - unique_symptome_list: List of all unique HPO names found across all patients, one per matrix column.
+        - rows, columns: NumPy arrays of the distinct (row, column) pairs of the present symptoms, in row-major
+          order.
+    """
+
+    if propagation is not None:
+        return propagating_presence_absence_matrix(global_hpo, propagation, sparse=True)
+
+    patient_ids = list(global_hpo.keys())
+    symptome_index = {}  # Vocabulary: HPO name -> column index
+
+    rows = []  # Row index of each (patient, HPO name) pair
+    columns = []  # Column index of each (patient, HPO name) pair
+
+    for row, hpos in enumerate(global_hpo.values()):
+        for hpo_combination in hpos:
+            hpo_name = hpo_combination[1]  # Extract the HPO name
+
+            # Terms without a name are not part of the table
+            if hpo_name == "":
+                continue
+
+            column = symptome_index.setdefault(hpo_name, len(symptome_index))
+            rows.append(row)
+            columns.append(column)
+
+    # A patient may have several terms of the same name: the pairs are made distinct
+    column_count = max(len(symptome_index), 1)
+    codes = np.unique(np.asarray(rows, dtype=np.int64) * column_count + np.asarray(columns, dtype=np.int64))
+    rows, columns = np.divmod(codes, column_count)
+
+    return patient_ids, list(symptome_index), rows, columns
+
+
+# Function to build the presence/absence HPO matrix
+def building_presence_absence_matrix(global_hpo, propagation=None):
+    """
+    This function builds a boolean matrix of presence/absence of HPO terms for each patient.
+
+    :param global_hpo: Dictionary containing patient HPO data, structured as
+                        {"patient_id": [(hpo_terms, hpo_name), ...]}.
+    :param propagation: Optional HPO_ontology.HPOPropagation, the patients' terms being propagated to their
+                        ancestors (see HPO_ontology.propagating_presence_absence_matrix).
+
+    :return: A tuple consisting of:
+        - patient_ids: List of patient IDs, one per matrix row.
+        - unique_symptome_list: List of all unique HPO names found across all patients, one per matrix column.
+        - presence_absence_matrix: NumPy boolean array of shape (patients, symptoms).
+    """
+
+    if propagation is not None:
+        return propagating_presence_absence_matrix(global_hpo, propagation)
+
+    patient_ids, unique_symptome_list, rows, columns = building_presence_absence_pairs(global_hpo)
+
+    presence_absence_matrix = np.zeros((len(patient_ids), len(unique_symptome_list)), dtype=bool)
+    presence_absence_matrix[rows, columns] = True
+
+    return patient_ids, unique_symptome_list, presence_absence_matrix
+
 
 # Function to generate the absence/presence HPO table
 def generate_absence_presence_HPO(global_hpo):
     """
-    This function generates a table of presence/absence of HPO terms for each patient. 
+    This function generates a table of presence/absence of HPO terms for each patient.
 
-    :param global_hpo: Dictionary containing patient HPO data, structured as 
+    :param global_hpo: Dictionary containing patient HPO data, structured as
                         {"patient_id": [(hpo_terms, hpo_name), ...]}.
 
     :return: A tuple consisting of:
@@ -13,45 +98,65 @@ def generate_absence_presence_HPO(global_hpo):
         - presence_absence_complete: Dictionary containing the presence (1) or absence (0) of each symptom for each patient.
     """
 
-    unique_symptome_list = [] # List to store unique HPO names across all patients
-    patient_data = {} # Dictionary to store the HPO names for each patient
+    patient_ids, unique_symptome_list, presence_absence_matrix = building_presence_absence_matrix(global_hpo)
 
-    # Structure: {"patient_id" : [(hpo_terms, hpo_name), ]}
+    presence_absence_complete = dict(zip(patient_ids, presence_absence_matrix.astype(np.uint8).tolist()))
 
-    presence_absence_complete = {} # Dictionary to store presence (1) or absence (0) of HPO terms for each patient
+    return unique_symptome_list, presence_absence_complete
 
-    # Loop through all the patients and their associated HPO data
-    for patient, hpos in global_hpo.items():
 
-        hpo_names_for_one_patient = [] # List to store HPO names for the current patient
+# Function to write the presence/absence matrix as a dense CSV file
+def writing_presence_absence_csv(patient_ids, unique_symptome_list, presence_absence_matrix, output_path):
+    """
+    This function writes the presence/absence matrix to a CSV file, one row per patient.
 
-        # Loop through all the HPO combinations for the patient
-        for hpo_combination in hpos:
+    :param patient_ids: List of patient IDs, one per matrix row.
+    :param unique_symptome_list: List of all unique HPO names, one per matrix column.
+    :param presence_absence_matrix: Boolean array of shape (patients, symptoms).
+    :param output_path: Path of the output CSV file.
+    """
+
+    # Open the output CSV file for writing
+    with open(output_path, "w") as fh_out:
+        # Create a CSV writer object, using ";" as delimiter
+        writer = csv.writer(fh_out, delimiter=";")
 
-            hpo_name = hpo_combination[1] # Extract the HPO name
+        # Write the header row to the CSV file (patient_id followed by all unique symptoms)
+        writer.writerow(["patient_id"] + unique_symptome_list)
 
-            # Add the HPO name to the patient's list
-            hpo_names_for_one_patient.append(hpo_name)
-            
-            # Add the HPO name to the list of unique symptoms if it's not already there and not an empty string
-            if hpo_name not in unique_symptome_list and hpo_name != "":
-                unique_symptome_list.append(hpo_name)
+        # Write the patient data rows, each row containing the patient ID and their presence/absence data
+        for patient, values in zip(patient_ids, presence_absence_matrix.astype(np.uint8)):
+            writer.writerow([patient, *values.tolist()])
 
-        # Store the list of HPO names for the current patient
-        patient_data[patient] = hpo_names_for_one_patient
 
-    # 2. Create a dictionary of presence (1) or absence (0) of each HPO term for each patient
-    for patient, values in patient_data.items():
+# Function to write the presence/absence matrix in the sparse Matrix Market format
+def writing_presence_absence_mtx(patient_ids, unique_symptome_list, rows, columns, output_folder):
+    """
+    This function writes the presence/absence matrix as a Matrix Market coordinate "pattern" file, which only
+    stores the present (patient, symptom) pairs, plus the row (patient) and column (HPO name) labels.
+
+    Files written in output_folder:
+        - presence_absence_hpos.mtx: 1-based (row, column) pairs of the present symptoms.
+        - presence_absence_hpos_patients.txt: One patient ID per line, in row order.
+        - presence_absence_hpos_terms.txt: One HPO name per line, in column order.
+
+    :param patient_ids: List of patient IDs, one per matrix row.
+    :param unique_symptome_list: List of all unique HPO names, one per matrix column.
+    :param rows: Array of the 0-based rows of the present symptoms.
+    :param columns: Array of the 0-based columns of the present symptoms.
+    :param output_folder: Path to the folder where the output files will be saved.
+    """
 
-        # Initialize an empty list for each patient's presence/absence data
-        presence_absence_complete[patient] = []
+    with open(os.path.join(output_folder, "presence_absence_hpos.mtx"), "w") as fh_out:
+        fh_out.write("%%MatrixMarket matrix coordinate pattern general\n")
+        fh_out.write(f"{len(patient_ids)} {len(unique_symptome_list)} {len(rows)}\n")
+        np.savetxt(fh_out, np.column_stack((rows + 1, columns + 1)), fmt="%d")
 
-        # For each unique HPO name, check if it is present in the patient's data
-        for symptome in unique_symptome_list:
-            # Append 1 if the symptom is present, 0 if it is absent
-            presence_absence_complete[patient].append([0 if symptome not in values else 1][0])
+    with open(os.path.join(output_folder, "presence_absence_hpos_patients.txt"), "w") as fh_out:
+        fh_out.writelines(f"{patient}\n" for patient in patient_ids)
 
-    return unique_symptome_list, presence_absence_complete
+    with open(os.path.join(output_folder, "presence_absence_hpos_terms.txt"), "w") as fh_out:
+        fh_out.writelines(f"{symptome}\n" for symptome in unique_symptome_list)
 
 
 # Function to structure and write the presence/absence data into a CSV file
@@ -62,18 +167,18 @@ def structuring_presence_absence_hpo(unique_symptome_list, presence_absence_comp
     :param unique_symptome_list: List of all unique HPO names found across all patients.
     :param presence_absence_complete: Dictionary containing the presence (1) or absence (0) of each symptom for each patient.
     :param output_folder: Path to the folder where the output CSV file will be saved.
-    
+
     :return: A list representing the structured presence/absence data.
     """
 
     # Define the output path for the CSV file
-    output_path = output_folder + "presence_absence_hpos.csv"
+    output_path = os.path.join(output_folder, "presence_absence_hpos.csv")
     for_clinical_presence_absence = [] # List to store the final structured data for all patients
 
     # Open the output CSV file for writing
     with open(output_path, "w") as fh_out:
         # Create a CSV writer object, using ";" as delimiter
-        writer = csv.writer(fh_out, delimiter= ";") 
+        writer = csv.writer(fh_out, delimiter= ";")
 
 
         # Write the header row to the CSV file (patient_id followed by all unique symptoms)
@@ -83,26 +188,42 @@ def structuring_presence_absence_hpo(unique_symptome_list, presence_absence_comp
 
         # Write the patient data rows, each row containing the patient ID and their presence/absence data
         for patient, values in presence_absence_complete.items():
-            writer.writerow([patient, *values]) 
+            writer.writerow([patient, *values])
             for_clinical_presence_absence.append([patient,*values])
-    
+
     return for_clinical_presence_absence
 
 # Main function to generate and structure the presence/absence HPO data and write it to CSV
-def main_generation_absence_presence_hpo(global_hpo_result, output_folder):
+def main_generation_absence_presence_hpo(global_hpo_result, output_folder, output_format="dense", propagation=None):
     """
-    This function orchestrates the generation and structuring of the presence/absence HPO data.
+    This function orchestrates the generation and writing of the presence/absence HPO data.
 
     :param global_hpo_result: Dictionary containing HPO data for each patient.
-    :param output_folder: Path to the folder where the output CSV file will be saved.
+    :param output_folder: Path to the folder where the output files will be saved.
+    :param output_format: "dense" writes presence_absence_hpos.csv, "sparse" writes the Matrix Market
+                          files (see writing_presence_absence_mtx), "both" writes all of them.
+    :param propagation: Optional HPO_ontology.HPOPropagation applied to the patients' terms.
 
-    :return: A list of the structured presence/absence data for all patients.
+    :return: A tuple (patient_ids, unique_symptome_list, presence_absence_matrix), the matrix being None for
+             the "sparse" format (only its present pairs are built, see building_presence_absence_pairs).
     """
 
-    # Generate the unique HPO names and the presence/absence data
-    unique_symptome_list, presence_absence_complete = generate_absence_presence_HPO(global_hpo_result)
+    if output_format == "sparse":
+        # The dense matrix is never built: memory grows with the present terms, not patients x terms
+        patient_ids, unique_symptome_list, rows, columns = building_presence_absence_pairs(global_hpo_result,
+                                                                                            propagation)
+        writing_presence_absence_mtx(patient_ids, unique_symptome_list, rows, columns, output_folder)
+        return patient_ids, unique_symptome_list, None
+
+    # Build the presence/absence matrix on the indexed HPO name vocabulary
+    patient_ids, unique_symptome_list, presence_absence_matrix = building_presence_absence_matrix(
+        global_hpo_result, propagation)
+
+    output_path = os.path.join(output_folder, "presence_absence_hpos.csv")
+    writing_presence_absence_csv(patient_ids, unique_symptome_list, presence_absence_matrix, output_path)
+
+    if output_format == "both":
+        rows, columns = np.nonzero(presence_absence_matrix)
+        writing_presence_absence_mtx(patient_ids, unique_symptome_list, rows, columns, output_folder)
 
-    # Structure the data and write it to a CSV file
-    for_clinical_presence_absence =  structuring_presence_absence_hpo(unique_symptome_list, presence_absence_complete, output_folder)
-    
-    return for_clinical_presence_absence
\ No newline at end of file
+    return patient_ids, unique_symptome_list, presence_absence_matrix
@@ -1,3 +1,8 @@
+import os
+
+from columnar_output import generation_clinical_table_columnar, output_path_for_format
+
+
 def filtering_global_variant(global_variant_result):
     """
     Filters the global variant result to keep only unique patient information, removing specific variant details.
@@ -32,26 +37,32 @@ def verification_list_info(unique_patient_information, filenames):
     :param filenames: List of filenames (patients) to check and combine data from.
     :return: A list containing combined data, where differing values are joined by commas.
     """
+    filenames = set(filenames)
 
-    # Initialize the variable to store the normal (expected) size of the list
-    normal_size = None
+    return combining_patient_information(
+        [values for key, values in unique_patient_information.items() if key in filenames]
+    )
 
-    # Check if all lists are of the same size
-    for key, values in unique_patient_information.items():
 
-        if key in filenames:  # Only consider files that are in the filenames list
-            if normal_size is None:
-                normal_size = len(values) # Set the normal size to the first valid file's size
-            elif normal_size != len(values):
-                raise ValueError("All lists must have the same size.") # Raise error if sizes differ
+def combining_patient_information(patient_infos):
+    """
+    Combines the data lists of several samples of one patient column by column: identical values are kept
+    once, differing values are joined by commas (in sample order).
+
+    :param patient_infos: List of patient_info lists, one per sample.
+    :return: A list containing combined data, where differing values are joined by commas.
+    """
+
+    # Check if all lists are of the same size
+    normal_size = len(patient_infos[0])
+    if any(len(values) != normal_size for values in patient_infos):
+        raise ValueError("All lists must have the same size.") # Raise error if sizes differ
 
     # Initialize an empty list to store the combined values
     combined_list = []
 
-    # Iterate through each index position in the list
-    for i in range(normal_size):  # Depending on the number of samples for one individual, then
-        # Gather elements for the same index from all filenames
-        elements = [valeur[i] for key, valeur in unique_patient_information.items() if key in filenames]
+    # Gather elements for the same index from all samples
+    for elements in zip(*patient_infos):
 
         # If all elements at the index are the same, append the single value to the combined list
         if all(elements[0] == elem for elem in elements):
@@ -68,48 +79,27 @@ def getting_one_row_by_patient(unique_patient_information):
     concatenating details side-by-side if necessary. 
 
     This function ensures that each patient appears as a single row in the final table,
-    even if they have multiple samples.
+    even if they have multiple samples. Samples are grouped by patient_id in a single pass,
+    and patients are kept in order of first appearance.
 
     :param unique_patient_information: Dictionary of unique patient data (file_name -> patient_info).
     :return: A dictionary where the key is the patient ID and the value is a list of aggregated patient data.
     """
-    # Retrieve patients with identical ids, add others directly
-    # For these patients with identical ids
-    # Check if the info differs step by step and then add them to a new dict
 
-    one_patient_by_row = {} # final dictionary
-    multiple_sample = set() # For multiple sample for one patient
-    patient_list = set() # Full patient_id list to set difference
-
-    # Filtering for multiple sample with same patient_id which are added to double_sample.
+    # Group the samples by patient_id: { patient_id: [patient_info, ...] }
+    samples_by_patient = {}
     for patient_info in unique_patient_information.values():
-        patient_id = patient_info[0]
-
-        if patient_id not in patient_list:
-            patient_list.add(patient_id)
-        else:
-            multiple_sample.add(patient_id)
+        samples_by_patient.setdefault(patient_info[0], []).append(patient_info)
 
-    # If the list contains at least one name, then go through each patient whose patient_id is present multiple times.
-    if multiple_sample:
-        for patient in multiple_sample:
-             # Creating for each patient, the list of files that belong to it.
-            filename_of_one_patient = [filename for filename, info in unique_patient_information.items() if patient in info]
-
-            # Go through the information of each file and check the information, if they differ separate them by ",".
-            combined_list = verification_list_info(unique_patient_information, filename_of_one_patient)
-
-            # Adding info to the final dictionary.
-            one_patient_by_row[patient] = combined_list
-
-    # Adding unique patient
-    one_sample_list = patient_list.difference(multiple_sample)
+    one_patient_by_row = {} # final dictionary
 
-    for patient_id in one_sample_list:
-        # retrieve the list:
-        for filename, variant_info in unique_patient_information.items():
-            if patient_id == variant_info[0]:
-                one_patient_by_row[patient_id] = unique_patient_information[filename]
+    for patient_id, patient_infos in samples_by_patient.items():
+        if len(patient_infos) == 1:
+            # Unique sample: added directly
+            one_patient_by_row[patient_id] = patient_infos[0]
+        else:
+            # Multiple samples: if the information differs, separate the values by ","
+            one_patient_by_row[patient_id] = combining_patient_information(patient_infos)
 
     return one_patient_by_row
 
@@ -125,7 +115,7 @@ def generation_clinical_table_csv(one_patient_by_row_dict, output_folder):
     """
 
     # Define the output path for the CSV file
-    output_path = output_folder + "resume_clinical_table.csv"
+    output_path = os.path.join(output_folder, "resume_clinical_table.csv")
 
     # Open the output file for writing
     with open(output_path, "w") as fh_out:
@@ -152,7 +142,7 @@ def generation_clinical_table_csv(one_patient_by_row_dict, output_folder):
 
     return
 
-def generation_clinical_table(global_variant_result, output_folder):
+def generation_clinical_table(global_variant_result, output_folder, output_format="csv"):
     """
     Coordinates the creation of a clinical table by calling necessary functions to process data and 
     generate the corresponding CSV file.
@@ -162,13 +152,32 @@ def generation_clinical_table(global_variant_result, output_folder):
 
     :param global_variant_result: Dictionary containing global variant data for each patient.
     :param output_folder: Folder path where the output CSV file will be saved.
+    :param output_format: "csv", or "parquet"/"arrow" for a typed columnar table.
     """
 
     # Filter global variant result to keep only unique patient information
     unique_patient_information = filtering_global_variant(global_variant_result)
 
+    generation_clinical_table_from_information(unique_patient_information, output_folder, output_format)
+
+
+def generation_clinical_table_from_information(unique_patient_information, output_folder, output_format="csv"):
+    """
+    Creates the clinical table from the per-file patient information (see filtering_global_variant).
+
+    Used by the streaming mode, which only keeps this per-file information instead of every variant row.
+
+    :param unique_patient_information: Dictionary with unique patient data (file_name -> patient_info).
+    :param output_folder: Folder path where the output CSV file will be saved.
+    :param output_format: "csv", or "parquet"/"arrow" for a typed columnar table.
+    """
+
     # Aggregate data into one row per patient
     one_patient_by_row  = getting_one_row_by_patient(unique_patient_information)
 
-    # Generate and save the clinical table as a CSV
-    generation_clinical_table_csv(one_patient_by_row, output_folder)
+    # Generate and save the clinical table as a CSV (or a columnar file)
+    if output_format == "csv":
+        generation_clinical_table_csv(one_patient_by_row, output_folder)
+    else:
+        output_path = output_path_for_format(os.path.join(output_folder, "resume_clinical_table.csv"), output_format)
+        generation_clinical_table_columnar(one_patient_by_row, output_path, output_format)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""
+Batch normalization of m.3243A>G heteroplasmy.
+
+The blood age correction and the urine logit/sex model of variants_unique_format are applied to whole
+columns (NumPy arrays) in one vectorized pass. The same engine is used by the pipeline and to
+re-normalize an existing concatenate_variants.csv without re-reading the patient JSON files:
+
+    python3 Pipeline_JSON_to_formattedTable/pipeline/heteroplasmy_normalization.py \
+        concatenate_variants.csv concatenate_variants_renormalized.csv yes
+"""
+
+import argparse
+import csv
+import logging
+
+import numpy as np
+
+# Blood model: het / BLOOD_DECAY ** (age + BLOOD_AGE_OFFSET)
+BLOOD_DECAY = 0.977
+BLOOD_AGE_OFFSET = 12
+
+# Urine model: expit(logit(het) / URINE_LOGIT_SCALE + sex adjustment)
+URINE_LOGIT_SCALE = 0.791
+URINE_FEMALE_ADJUSTMENT = 0.608
+URINE_MALE_ADJUSTMENT = -0.625
+
+# Normalization modes
+NORMALIZATION_STATUSES = ("yes", "no", "blood", "urine")
+
+
+def blood_m3243_normalization_batch(m3243_het, age):
+    """
+    Normalize blood m3243 heteroplasmy (0-1 scale) based on age, clipped at 1.
+
+    :param m3243_het: Array of heteroplasmy values (0-1).
+    :param age: Array of ages at sampling.
+    :return: Array of normalized values (0-1).
+    """
+    return np.minimum(1, m3243_het / (BLOOD_DECAY ** (age + BLOOD_AGE_OFFSET)))
+
+
+def urine_m3243_normalization_batch(variant_het, sex):
+    """
+    Normalize urine m3243 heteroplasmy (0-1 scale) based on sex, clipped at 1.
+    The 0% and 100% edge cases are returned unchanged.
+
+    :param variant_het: Array of heteroplasmy values (0-1).
+    :param sex: Array of sexes ("F" for female, anything else is treated as male).
+    :return: Array of normalized values (0-1).
+    """
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        logit_urine_het = np.log(variant_het / (1 - variant_het))
+        adjustment = np.where(sex == "F", URINE_FEMALE_ADJUSTMENT, URINE_MALE_ADJUSTMENT)
+
+        het_normalized = np.exp((logit_urine_het / URINE_LOGIT_SCALE) + adjustment)
+        normalized = np.minimum(1, het_normalized / (1 + het_normalized))
+
+    # exp overflow (het very close to 1) gives inf / inf
+    normalized = np.where(np.isposinf(het_normalized), 1.0, normalized)
+
+    # Edge cases: 0% or 100% heteroplasmy
+    return np.where((variant_het == 0) | (variant_het == 1), variant_het, normalized)
+
+
+def rounding_batch(values, decimals=2):
+    """
+    Rounds an array like Python's round(): np.round scales by 10**decimals first, which can move a value
+    that is just below a tie (e.g. 2.835 is stored as 2.83499...) onto it. The few near-tie values are
+    rounded with round(), the others with np.round.
+
+    :param values: Array of floats.
+    :param decimals: Number of decimals.
+    :return: Array of rounded values.
+    """
+    rounded = np.round(values, decimals)
+
+    scaled = values * 10 ** decimals
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(value, decimals) for value in values[near_tie].tolist()]
+
+    return rounded
+
+
+def normalize_heteroplasmy_batch(heteroplasmy, age, sex, tissue, normalization_status):
+    """
+    Normalize heteroplasmy levels (0-100 scale) based on tissue type, in one vectorized pass.
+
+    Same rules as variants_unique_format.normalize_heteroplasmy: with "yes" blood samples get the blood
+    model and urine samples the urine model, "blood" / "urine" force one model, otherwise the values are
+    returned unchanged. Results are rounded to 2 decimals.
+
+    :param heteroplasmy: Array-like of heteroplasmy values (0-100).
+    :param age: Array-like of ages at sampling (truncated to whole years, as int() does in normalize_heteroplasmy).
+    :param sex: Array-like of sexes.
+    :param tissue: Array-like of homogenized tissue names (see returning_homogenized_tissue).
+    :param normalization_status: "yes", "no", "blood" or "urine".
+    :return: Array of normalized heteroplasmy values (0-100).
+    """
+    het = np.asarray(heteroplasmy, dtype=float) / 100  # Convert to 0-1 scale
+    age = np.trunc(np.asarray(age, dtype=float))
+    sex = np.asarray(sex, dtype=object)
+    tissue = np.asarray(tissue, dtype=object)
+
+    if normalization_status == "yes":
+        normalized = np.where(tissue == "blood", blood_m3243_normalization_batch(het, age),
+                              np.where(tissue == "urine", urine_m3243_normalization_batch(het, sex), het))
+    elif normalization_status == "blood":
+        normalized = blood_m3243_normalization_batch(het, age)
+    elif normalization_status == "urine":
+        normalized = urine_m3243_normalization_batch(het, sex)
+    else:
+        normalized = het
+
+    return rounding_batch(normalized * 100, 2)
+
+
+def m3243_normalized_batch(m3243_het, age, sex, tissue, normalization_status):
+    """
+    Compute the m3243_het_normalized column as the pipeline does: only blood and urine samples are
+    normalized (and never with "no"), other samples keep their raw heteroplasmy.
+
+    :param m3243_het: Array-like of m3243 heteroplasmy values (0-100).
+    :param age: Array-like of ages at sampling.
+    :param sex: Array-like of sexes.
+    :param tissue: Array-like of homogenized tissue names.
+    :param normalization_status: "yes", "no", "blood" or "urine".
+    :return: Array of m3243_het_normalized values (0-100).
+    """
+    raw = np.asarray(m3243_het, dtype=float)
+    tissue = np.asarray(tissue, dtype=object)
+
+    if normalization_status == "no":
+        return raw
+
+    normalized = normalize_heteroplasmy_batch(raw, age, sex, tissue, normalization_status)
+    return np.where((tissue == "blood") | (tissue == "urine"), normalized, raw)
+
+
+def renormalize_variant_csv(input_path, output_path, normalization_status):
+    """
+    Re-normalize the m3243_het_normalized column of an existing concatenate_variants.csv.
+
+    Rows without m3243 heteroplasmy (A3243G not researched) are written unchanged.
+
+    :param input_path: Path of the concatenate_variants.csv to re-normalize.
+    :param output_path: Path of the re-normalized file.
+    :param normalization_status: "yes", "no", "blood" or "urine".
+    :return: Number of re-normalized rows.
+    """
+    with open(input_path, "r", newline="") as fh_in:
+        reader = csv.reader(fh_in, delimiter=";")
+        header = next(reader)
+        rows = list(reader)
+
+    column = {name: index for index, name in enumerate(header)}
+    m3243_index = column["m3243_het"]
+
+    # Only the rows carrying an m3243 value are normalized
+    selected = [row for row in rows if len(row) > m3243_index and row[m3243_index] != ""]
+
+    if selected:
+        normalized = m3243_normalized_batch(
+            [row[m3243_index] for row in selected],
+            [row[column["age_at_sampling"]] for row in selected],
+            [row[column["sex"]] for row in selected],
+            [row[column["tissue"]] for row in selected],
+            normalization_status,
+        )
+        for row, value in zip(selected, normalized.tolist()):
+            row[column["m3243_het_normalized"]] = value
+
+    with open(output_path, "w", newline="") as fh_out:
+        writer = csv.writer(fh_out, delimiter=";")
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    logging.info(f"{len(selected)} variant rows re-normalized ('{normalization_status}') into '{output_path}'.")
+
+    return len(selected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Re-normalize the m3243 heteroplasmy of a concatenate_variants.csv.')
+    parser.add_argument('input_path', type=str)
+    parser.add_argument('output_path', type=str)
+    parser.add_argument('norm_status', choices=NORMALIZATION_STATUSES)
+
+    args = parser.parse_args()
+    count = renormalize_variant_csv(args.input_path, args.output_path, args.norm_status)
+    print(f"{count} variant rows re-normalized into '{args.output_path}'.")
@@ -0,0 +1,195 @@
+import argparse
+import gzip  # Module for the gzipped files and bundles
+import json  # Module for re-encoding the records of a bundle
+import logging  # Module for logging errors and warnings
+import os
+import re
+import tarfile
+from typing import NamedTuple, Optional
+import zipfile
+
+# Input sources: the patient records are read straight from the input folder, whatever their container:
+# - "<name>.json" and "<name>.json.gz" files, read by the workers;
+# - tar archives (".tar", ".tar.gz", ".tgz") and zip archives (".zip") of ".json" or ".json.gz" files;
+# - NDJSON bundles (".ndjson", ".jsonl", optionally gzipped), one patient record per line.
+# The archives and bundles are read sequentially by the main process, without unpacking them to disk:
+# every record is handed to the workers as a PatientInput holding its content. Records read from a
+# container get the path "<container path>/<file name>", so the verification report shows their file name.
+#
+# A bundle line is either a bare patient record or, as written by packing_ndjson_bundle, a record wrapped
+# with the name of its file: {"filename":"<name>.json","record":{...}}.
+
+PATIENT_FILE_SUFFIXES = (".json", ".json.gz")
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".zip")
+BUNDLE_SUFFIXES = (".ndjson", ".ndjson.gz", ".jsonl", ".jsonl.gz")
+INPUT_SUFFIXES = PATIENT_FILE_SUFFIXES + ARCHIVE_SUFFIXES + BUNDLE_SUFFIXES
+
+# Start of a bundle line written by packing_ndjson_bundle, the record following it
+BUNDLE_RECORD_PREFIX = re.compile(rb'\{"filename":("(?:[^"\\]|\\.)*"),"record":')
+
+
+class PatientInput(NamedTuple):
+    """
+    Patient record to process: a file path, with its content when it was read from an archive or a bundle.
+    """
+
+    input_path: str
+    content: Optional[bytes] = None
+
+
+def listing_input_sources(input_folder):
+    """
+    Lists the input sources of the input folder, sorted by name.
+
+    :param input_folder: Folder of the patient files, archives and bundles (or a single archive or bundle).
+    :return: List of paths.
+    """
+    if os.path.isfile(input_folder):
+        return [input_folder]
+    return [os.path.join(input_folder, filename) for filename in sorted(os.listdir(input_folder))
+            if filename.endswith(INPUT_SUFFIXES)]
+
+
+def containing_records(source_path):
+    """
+    Tells whether an input source is an archive or a bundle (True) or a single patient file (False).
+    """
+    return source_path.endswith(ARCHIVE_SUFFIXES + BUNDLE_SUFFIXES)
+
+
+def iterating_tar_archive(archive_path):
+    """
+    Yields the patient records of a tar archive (optionally compressed), in archive order.
+    """
+    # Stream mode: the archive is read once from start to end, whatever its compression
+    with tarfile.open(archive_path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(PATIENT_FILE_SUFFIXES):
+                yield PatientInput(f"{archive_path}/{member.name}", archive.extractfile(member).read())
+
+
+def iterating_zip_archive(archive_path):
+    """
+    Yields the patient records of a zip archive, in archive order.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            if not member.is_dir() and member.filename.endswith(PATIENT_FILE_SUFFIXES):
+                yield PatientInput(f"{archive_path}/{member.filename}", archive.read(member))
+
+
+def iterating_ndjson_bundle(bundle_path):
+    """
+    Yields the patient records of an NDJSON bundle (optionally gzipped), in line order.
+
+    Records wrapped by packing_ndjson_bundle keep the name of their file, bare records are named after
+    their line number ("000001.json").
+    """
+    opening = gzip.open if bundle_path.endswith(".gz") else open
+    with opening(bundle_path, "rb") as fh:
+        for line_number, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+
+            match = BUNDLE_RECORD_PREFIX.match(line)
+            if match is not None and line.endswith(b"}"):
+                filename = json.loads(match.group(1))
+                yield PatientInput(f"{bundle_path}/{filename}", line[match.end():-1])
+            else:
+                yield PatientInput(f"{bundle_path}/{line_number:06d}.json", line)
+
+
+def iterating_patient_inputs(source_paths):
+    """
+    Yields the patient records of the input sources, in order.
+
+    The patient files are yielded as paths (read by the workers), the records of the archives and bundles
+    with their content. An archive or bundle that cannot be read (or only in part) gets a record without
+    valid content, reported as not a valid JSON.
+
+    :param source_paths: Paths of the input sources (see listing_input_sources).
+    :return: Generator of PatientInput.
+    """
+    for source_path in source_paths:
+        if not containing_records(source_path):
+            yield PatientInput(source_path)
+            continue
+
+        if source_path.endswith(BUNDLE_SUFFIXES):
+            records = iterating_ndjson_bundle(source_path)
+        elif source_path.endswith(".zip"):
+            records = iterating_zip_archive(source_path)
+        else:
+            records = iterating_tar_archive(source_path)
+
+        try:
+            yield from records
+        except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+            logging.error(f"Error reading input source '{source_path}': {e}")
+            yield PatientInput(source_path, b"")
+
+
+def reading_patient_input(patient_input):
+    """
+    Returns the content of a patient record, decompressed.
+
+    :param patient_input: PatientInput.
+    :return: Content of the JSON document (bytes).
+    """
+    content = patient_input.content
+    if content is None:
+        with open(patient_input.input_path, "rb") as fh:
+            content = fh.read()
+    if patient_input.input_path.endswith(".gz"):
+        content = gzip.decompress(content)
+    return content
+
+
+def packing_ndjson_bundle(input_folder, output_path, compresslevel=6):
+    """
+    Packs the patient records of a folder (files, archives or bundles) into one NDJSON bundle.
+
+    Every record is written on one line with the name of its file, re-encoded without whitespace. A file
+    that is not a valid JSON is written as is (line breaks replaced by spaces), so that it is reported the
+    same way when the bundle is processed.
+
+    :param input_folder: Folder of the patient files, archives and bundles.
+    :param output_path: Path of the bundle, gzipped if it ends with ".gz".
+    :param compresslevel: gzip compression level (1-9).
+    :return: Number of records written.
+    """
+    opening = (lambda path: gzip.open(path, "wb", compresslevel=compresslevel)) if output_path.endswith(".gz") \
+        else (lambda path: open(path, "wb"))
+
+    count = 0
+    with opening(output_path) as fh_out:
+        for patient_input in iterating_patient_inputs(listing_input_sources(input_folder)):
+            filename = patient_input.input_path.split("/")[-1]
+            if filename.endswith(".gz"):
+                filename = filename[:-len(".gz")]
+
+            content = b""
+            try:
+                content = reading_patient_input(patient_input)
+                record = json.dumps(json.loads(content), ensure_ascii=False, separators=(",", ":")).encode()
+            except (ValueError, OSError, EOFError) as e:
+                logging.warning(f"'{patient_input.input_path}' is not a valid JSON, packed as is: {e}")
+                record = re.sub(rb"[\r\n]", b" ", content)
+
+            fh_out.write(b'{"filename":' + json.dumps(filename).encode() + b',"record":' + record + b"}\n")
+            count += 1
+
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pack a folder of patient JSON files into one NDJSON bundle.')
+    parser.add_argument('input_folder', type=str)
+    parser.add_argument('output_path', type=str, help='Bundle path, gzipped if it ends with ".gz"')
+    parser.add_argument('--compresslevel', type=int, default=6, choices=range(1, 10),
+                        help='gzip compression level (default: 6)')
+
+    args = parser.parse_args()
+    count = packing_ndjson_bundle(args.input_folder, args.output_path, args.compresslevel)
+    print(f"{count} patient records packed into '{args.output_path}'.")
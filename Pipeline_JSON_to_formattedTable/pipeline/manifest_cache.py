@@ -0,0 +1,188 @@
+import hashlib  # Module for building cache keys
+import json  # Built-in module for handling JSON files
+import logging  # Module for logging errors and warnings
+import os
+import pickle  # Module for the per-patient result cache
+
+# Incremental re-runs: a manifest in the output folder records, for every input file, its size and
+# mtime and the parameters it was processed with. The per-patient results are cached next to it so
+# only new or changed files are re-verified and re-extracted; the outputs are rebuilt from the cache.
+
+MANIFEST_VERSION = 3  # Bump when the manifest or cached result layout changes
+MANIFEST_FILENAME = "manifest.json"
+CACHE_FOLDERNAME = ".patient_cache"
+
+
+def parameters_key(input_variants, het_treshold, normalization_status, hpo_sha256, variant_filter_digest=None):
+    """
+    Builds the key identifying the parameters a patient file was processed with.
+
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+    :param hpo_sha256: SHA-256 digest of the HPO ontology file.
+    :param variant_filter_digest: Digest of the variant filter mask (see variant_filter.VariantFilter), if any.
+    :return: Hexadecimal key of the parameters.
+    """
+    parameters = {
+        "input_variants": input_variants,
+        "het_treshold": het_treshold,
+        "norm_status": normalization_status,
+        "hpo_sha256": hpo_sha256,
+    }
+    # Only added with a filter, so that the runs without filter keep their cache
+    if variant_filter_digest is not None:
+        parameters["variant_filter"] = variant_filter_digest
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+class PatientManifest:
+    """
+    Manifest of the input files processed in an output folder, with their cached results.
+    """
+
+    def __init__(self, output_folder, parameters):
+        """
+        :param output_folder: Output folder holding the manifest and the cache.
+        :param parameters: Key of the run parameters (see parameters_key).
+        """
+        self.manifest_path = os.path.join(output_folder, MANIFEST_FILENAME)
+        self.cache_folder = os.path.join(output_folder, CACHE_FOLDERNAME)
+        self.parameters = parameters
+        self.entries = {}  # { input_path: {"mtime_ns", "size", "parameters", "result_file"} }
+
+        if os.path.isfile(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r") as fh:
+                    manifest = json.load(fh)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    self.entries = manifest["files"]
+            except (OSError, json.JSONDecodeError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable manifest '{self.manifest_path}': {e}")
+
+    def result_file(self, input_path):
+        """
+        Returns the cache file of an input file.
+
+        :param input_path: Path to the patient JSON file.
+        :return: Path of the pickle caching the patient result.
+        """
+        name = hashlib.sha1(os.path.abspath(input_path).encode()).hexdigest()
+        return os.path.join(self.cache_folder, name + ".pickle")
+
+    def is_fresh(self, input_path, stat=None):
+        """
+        Checks whether the cached result of an input file is still valid.
+
+        :param input_path: Path to the patient JSON file.
+        :param stat: os.stat result of the file, computed if not given.
+        :return: True if the file and the parameters are unchanged since it was cached.
+        """
+        entry = self.entries.get(input_path)
+        if entry is None:
+            return False
+
+        stat = stat or os.stat(input_path)
+        return (entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+                and entry["parameters"] == self.parameters and os.path.isfile(entry["result_file"]))
+
+    def load_result(self, input_path):
+        """
+        Loads the cached result of an input file.
+
+        :param input_path: Path to the patient JSON file.
+        :return: Per-patient result dictionary, or None if the cache cannot be read.
+        """
+        try:
+            with open(self.entries[input_path]["result_file"], "rb") as fh:
+                return pickle.load(fh)
+        except (OSError, KeyError, pickle.UnpicklingError, EOFError) as e:
+            logging.warning(f"Could not read cached result of '{input_path}': {e}")
+            return None
+
+    def store_result(self, input_path, stat, result):
+        """
+        Caches the result of an input file and records it in the manifest.
+
+        :param input_path: Path to the patient JSON file.
+        :param stat: os.stat result of the file taken before it was processed.
+        :param result: Per-patient result dictionary.
+        """
+        result_file = self.result_file(input_path)
+        os.makedirs(self.cache_folder, exist_ok=True)
+        with open(result_file, "wb") as fh:
+            pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.entries[input_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "parameters": self.parameters,
+            "result_file": result_file,
+        }
+
+    def prune(self, input_paths):
+        """
+        Removes the entries (and cached results) of files that are no longer in the input folder.
+
+        :param input_paths: Paths of the current input files.
+        """
+        current = set(input_paths)
+        for input_path in [path for path in self.entries if path not in current]:
+            entry = self.entries.pop(input_path)
+            try:
+                os.remove(entry["result_file"])
+            except OSError:
+                pass
+
+    def save(self):
+        """
+        Writes the manifest to the output folder.
+        """
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, fh, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def iter_incremental_results(input_paths, manifest, process_results):
+    """
+    Yields the result of every input file in order, from the cache when it is fresh and from
+    process_results otherwise. New results are stored in the cache as they arrive.
+
+    :param input_paths: List of patient JSON file paths.
+    :param manifest: PatientManifest of the output folder.
+    :param process_results: Function taking the list of paths to (re)process and returning
+                            an iterator of their results, in the same order.
+    :return: Generator of per-patient result dictionaries, in the order of input_paths.
+    """
+    stats = {input_path: os.stat(input_path) for input_path in input_paths}
+    manifest.prune(input_paths)
+
+    to_process = [input_path for input_path in input_paths if not manifest.is_fresh(input_path, stats[input_path])]
+    logging.info(f"Incremental run: {len(input_paths) - len(to_process)} cached file(s), "
+                 f"{len(to_process)} new or changed file(s) to process.")
+
+    new_results = iter(process_results(to_process))
+    to_process = set(to_process)
+
+    for input_path in input_paths:
+        result = None
+        if input_path not in to_process:
+            result = manifest.load_result(input_path)
+            if result is not None:
+                result["cached"] = True
+
+        if result is None:
+            if input_path in to_process:
+                result = next(new_results)
+            else:
+                # Unreadable cache: process this file on its own
+                result = next(iter(process_results([input_path])))
+
+            # Errors are not cached, the file is retried on the next run
+            if "error" not in result:
+                manifest.store_result(input_path, stats[input_path], result)
+
+        yield result
+
+    manifest.save()
@@ -0,0 +1,147 @@
+import itertools
+import logging  # Module for logging the sweep
+import os
+
+from JSON_verification import writing_verification_report
+from HPO_unique_csv import hpo_standard_output_file
+from variant_generation_csv import generate_variant_csv
+from variant_table import VariantTable
+from generate_absence_presence_HPO import main_generation_absence_presence_hpo
+from generation_clinical_table import generation_clinical_table_from_information
+from columnar_output import generate_variant_columnar, output_path_for_format
+from heteroplasmy_normalization import NORMALIZATION_STATUSES
+from cohort_index import writing_cohort_index
+
+# Parameter sweep: the pipeline is evaluated for every combination of heteroplasmy thresholds and
+# normalization modes in a single pass. Each patient file is parsed once (see
+# patient_record.process_patient_sweep) and its results are dispatched to one SweepConfiguration per
+# combination, each writing the usual output tables to its own sub-folder of the output folder.
+
+
+def parsing_sweep_thresholds(thresholds):
+    """
+    Parses a comma-separated list of heteroplasmy thresholds.
+
+    :param thresholds: String such as "1,5,10".
+    :return: List of floats, in the given order without duplicates.
+    """
+    values = []
+    for threshold in thresholds.replace(" ", "").split(","):
+        if not threshold:
+            continue
+        try:
+            value = float(threshold)
+        except ValueError:
+            raise ValueError(f"Invalid heteroplasmy threshold '{threshold}'.")
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def parsing_sweep_normalizations(normalization_statuses):
+    """
+    Parses a comma-separated list of normalization modes.
+
+    :param normalization_statuses: String such as "yes,no,blood,urine".
+    :return: List of normalization modes, in the given order without duplicates.
+    """
+    values = []
+    for status in normalization_statuses.replace(" ", "").split(","):
+        if not status:
+            continue
+        if status not in NORMALIZATION_STATUSES:
+            raise ValueError(f"Invalid normalization mode '{status}' "
+                             f"(expected one of {', '.join(NORMALIZATION_STATUSES)}).")
+        if status not in values:
+            values.append(status)
+    return values
+
+
+def sweep_configurations(thresholds, normalization_statuses):
+    """
+    Returns every (het_treshold, normalization_status) combination of the sweep.
+    """
+    return list(itertools.product(thresholds, normalization_statuses))
+
+
+def configuration_folder_name(het_treshold, normalization_status):
+    """
+    Returns the name of the output sub-folder of a configuration, e.g. "het_5_norm_blood".
+    """
+    return f"het_{het_treshold:g}_norm_{normalization_status}"
+
+
+class SweepConfiguration:
+    """
+    Results of one configuration of the sweep, gathered patient by patient, and its output tables.
+    """
+
+    def __init__(self, output_folder, het_treshold, normalization_status):
+        """
+        :param output_folder: Output folder of the sweep, the configuration writing to a sub-folder of it.
+        :param het_treshold: Heteroplasmy threshold of the configuration.
+        :param normalization_status: Normalization mode of the configuration.
+        """
+        self.het_treshold = het_treshold
+        self.normalization_status = normalization_status
+        self.output_folder = os.path.join(output_folder, configuration_folder_name(het_treshold, normalization_status))
+
+        self.hpo_result = {}  # { patient_id: [(hpo_id, hpo_name), ...] }
+        self.variant_table = VariantTable()
+        self.verification_report = []  # Status and failure reason of every tested file
+        self.variant_count = 0
+
+    def add_patient_result(self, patient_result):
+        """
+        Adds the result of one patient file for this configuration.
+
+        :param patient_result: Per-patient result (see patient_record.process_patient_record).
+        """
+        if "error" in patient_result:
+            status = "error"
+        elif patient_result["verified"]:
+            status = "passed"
+            self.hpo_result.update(patient_result["hpo"])
+            self.variant_table.add_variants(patient_result["variants"], patient_result["patient"])
+            self.variant_count += sum(len(rows) for rows in patient_result["variants"].values())
+        else:
+            status = "failed"
+
+        self.verification_report.append({"filename": patient_result["filename"], "status": status,
+                                          "reason": patient_result.get("reason", "")})
+
+    def writing_outputs(self, annotation=None, output_format="csv", report_format="csv", hpo_matrix_format="dense",
+                        cohort_index=False, hpo_propagation=None, input_folder=None):
+        """
+        Writes the output tables of the configuration, as main does for a single run.
+
+        :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+        :param output_format: Format of the variant and clinical tables: "csv", "parquet" or "arrow".
+        :param report_format: Format of the verification report: "csv" or "json".
+        :param hpo_matrix_format: Format of the presence/absence table: "dense", "sparse" or "both".
+        :param cohort_index: If True, the inverted indexes of the configuration are written (see cohort_index).
+        :param hpo_propagation: Optional HPO_ontology.HPOPropagation of the presence/absence table.
+        :param input_folder: Input folder of the run, identifying the samples of the inverted indexes.
+        """
+        os.makedirs(self.output_folder, exist_ok=True)
+
+        writing_verification_report(self.verification_report, self.output_folder, report_format)
+
+        main_generation_absence_presence_hpo(self.hpo_result, self.output_folder, hpo_matrix_format, hpo_propagation)
+        hpo_standard_output_file(self.hpo_result, os.path.join(self.output_folder, "concatenate_HPO.csv"))
+
+        output_path_concatenate_variants = output_path_for_format(
+            os.path.join(self.output_folder, "concatenate_variants.csv"), output_format)
+        if output_format == "csv":
+            generate_variant_csv(self.variant_table, output_path_concatenate_variants, annotation)
+        else:
+            generate_variant_columnar(self.variant_table, output_path_concatenate_variants, output_format, annotation)
+
+        generation_clinical_table_from_information(self.variant_table.patient_information(), self.output_folder,
+                                                   output_format)
+        if cohort_index:
+            writing_cohort_index(self.variant_table, self.hpo_result, self.output_folder, input_folder)
+
+        passed = sum(1 for row in self.verification_report if row["status"] == "passed")
+        logging.info(f"Sweep configuration het_treshold={self.het_treshold:g}, norm_status={self.normalization_status}: "
+                     f"{passed} correct JSON files, {self.variant_count} variants written to '{self.output_folder}'.")
@@ -0,0 +1,202 @@
+import logging  # Module for logging errors and warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from patient_record import process_patient_file, process_patient_sweep
+
+# Per-patient execution: runs the patient stages either serially or in a bounded pool of
+# worker processes. Results are always yielded in input order so the outputs are deterministic.
+
+# Shared, read-only context of a worker process (HPO index, variant filter and run parameters).
+# It is sent once per worker by the pool initializer instead of once per patient.
+worker_context = {}
+
+
+def init_worker(hpo_index, input_variants, het_treshold, normalization_status, log_file=None, variant_filter=None,
+                configurations=None, catalog_streaming_size=None):
+    """
+    Initializes a worker process with the context shared by all patients.
+
+    :param hpo_index: HPOIndex shared by all patients.
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+    :param log_file: Log file of the run, configured in the worker if it has no logging setup.
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param configurations: Optional list of (het_treshold, normalization_status) tuples of a parameter sweep,
+                           which replace het_treshold and normalization_status.
+    :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+    """
+    worker_context.update({
+        "hpo_index": hpo_index,
+        "input_variants": input_variants,
+        "het_treshold": het_treshold,
+        "normalization_status": normalization_status,
+        "variant_filter": variant_filter,
+        "configurations": configurations,
+        "catalog_streaming_size": catalog_streaming_size,
+    })
+
+    # Workers started with "spawn" do not inherit the logging configuration of the main process
+    if log_file and not logging.getLogger().handlers:
+        logging.basicConfig(filename=log_file, level=logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def run_patient_task(input_path):
+    """
+    Processes one patient file with the worker context, errors are returned instead of raised.
+
+    :param input_path: Path to the patient JSON file, or input_sources.PatientInput of a record read from an
+                       archive or a bundle.
+    :return: Dictionary { "filename", "verified", "reason", "hpo", "variants" } plus "error" if processing failed
+             (in a parameter sweep, a dictionary { configuration: result }, see process_patient_sweep).
+    """
+    configurations = worker_context["configurations"]
+    input_path, content = (input_path, None) if isinstance(input_path, str) else input_path
+    try:
+        if configurations:
+            return process_patient_sweep(input_path, worker_context["hpo_index"], worker_context["input_variants"],
+                                         configurations, worker_context["variant_filter"],
+                                         worker_context["catalog_streaming_size"], content)
+        return process_patient_file(
+            input_path, worker_context["hpo_index"], worker_context["input_variants"],
+            worker_context["het_treshold"], worker_context["normalization_status"], worker_context["variant_filter"],
+            worker_context["catalog_streaming_size"], content
+        )
+    except Exception as e:
+        error_result = {"filename": input_path.split("/")[-1], "verified": False, "reason": str(e), "hpo": {},
+                        "variants": {}, "patient": {}, "error": str(e)}
+        if configurations:
+            return {configuration: dict(error_result) for configuration in configurations}
+        return error_result
+
+
+def run_patient_batch(input_paths):
+    """
+    Processes a batch of patient files with the worker context.
+
+    :param input_paths: List of patient JSON file paths (or PatientInput).
+    :return: List of per-patient result dictionaries, in the order of input_paths.
+    """
+    return [run_patient_task(input_path) for input_path in input_paths]
+
+
+class PatientExecutor:
+    """
+    Runs the per-patient stages serially or in a pool of worker processes kept for the executor's lifetime,
+    so that several calls (e.g. the cycles of the watch mode) reuse the same workers and their context.
+
+    Usage:
+        with PatientExecutor(hpo_index, input_variants, het_treshold, normalization_status, workers=4) as executor:
+            for patient_result in executor.results(input_paths):
+                ...
+    """
+
+    def __init__(self, hpo_index, input_variants, het_treshold, normalization_status, workers=1, log_file=None,
+                 chunk_size=None, variant_filter=None, configurations=None, catalog_streaming_size=None):
+        """
+        :param hpo_index: HPOIndex shared by all patients.
+        :param input_variants: Comma-separated string of expected variants.
+        :param het_treshold: Minimum heteroplasmy threshold.
+        :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+        :param workers: Number of worker processes, 1 runs everything in the current process.
+        :param log_file: Log file of the run, used to configure logging in spawned workers.
+        :param chunk_size: Number of files per batch sent to a worker (default: adapted to each call).
+        :param variant_filter: Optional VariantFilter applied to the variants.
+        :param configurations: Optional list of (het_treshold, normalization_status) tuples: every file is then
+                               processed once for all of them (see patient_record.process_patient_sweep).
+        :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+        """
+        self.context = (hpo_index, input_variants, het_treshold, normalization_status, log_file, variant_filter,
+                        configurations, catalog_streaming_size)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.executor = None  # Started by the first call with a pool, the context being sent once per worker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stops the worker processes, if any.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def results(self, input_paths):
+        """
+        Yields the result of every patient file, in the order of input_paths.
+
+        With a pool, files are sent by batches of chunk_size and at most two batches per worker are in
+        flight, so the number of results held in memory is bounded whatever the cohort size.
+
+        :param input_paths: List (or iterator) of patient JSON file paths, or of input_sources.PatientInput for
+                            the records read from archives and bundles.
+        :return: Generator of per-patient result dictionaries (see run_patient_task).
+        """
+        workers = self.workers
+        if workers <= 1:
+            init_worker(*self.context)
+            for input_path in input_paths:
+                yield run_patient_task(input_path)
+            return
+
+        # Several files per task to amortize the inter-process communication
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            # Records read from archives and bundles come from an iterator of unknown length
+            cohort_size = len(input_paths) if hasattr(input_paths, "__len__") else workers * 8 * 16
+            chunk_size = min(64, max(1, cohort_size // (workers * 8)))
+
+        # Batches are taken from the input as they are submitted, so an iterator is only read ahead by the
+        # batches in flight
+        input_paths = iter(input_paths)
+        batches = iter(lambda: list(islice(input_paths, chunk_size)), [])
+        max_pending = workers * 2
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=self.context)
+        pending = deque()
+
+        for batch in batches:
+            pending.append(self.executor.submit(run_patient_batch, batch))
+
+            # Wait for the oldest batch before submitting more: bounds memory and keeps the input order
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_patient_results(input_paths, hpo_index, input_variants, het_treshold, normalization_status,
+                         workers=1, log_file=None, chunk_size=None, variant_filter=None, configurations=None,
+                         catalog_streaming_size=None):
+    """
+    Yields the result of every patient file, in the order of input_paths, with a PatientExecutor used for
+    this call only.
+
+    :param input_paths: List (or iterator) of patient JSON file paths, or of input_sources.PatientInput for
+                        the records read from archives and bundles.
+    :param hpo_index: HPOIndex shared by all patients.
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+    :param workers: Number of worker processes, 1 runs everything in the current process.
+    :param log_file: Log file of the run, used to configure logging in spawned workers.
+    :param chunk_size: Number of files per batch sent to a worker (default: adapted to the cohort size).
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param configurations: Optional list of (het_treshold, normalization_status) tuples: every file is then
+                           processed once for all of them (see patient_record.process_patient_sweep).
+    :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+    :return: Generator of per-patient result dictionaries (see run_patient_task).
+    """
+    with PatientExecutor(hpo_index, input_variants, het_treshold, normalization_status, workers, log_file,
+                         chunk_size, variant_filter, configurations, catalog_streaming_size) as executor:
+        yield from executor.results(input_paths)
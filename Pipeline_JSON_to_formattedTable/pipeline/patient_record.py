@@ -0,0 +1,169 @@
+import logging  # Module for logging errors and warnings
+import time  # Module for the per-file timings
+
+from JSON_verification import load_json, load_json_content, verify_patient_record
+from catalog_stream import load_streamed_patient_record, streaming_catalog
+from HPO_terms_infile_research import research_HPO_from_data
+from HPO_terms_API_request import extracting_unnamed_HPO
+from variants_unique_format import concatenation_sample_from_data
+
+# Patient record loader: every patient JSON is parsed exactly once and the
+# in-memory record is handed to verification, HPO extraction and variant structuring.
+
+
+def load_patient_record(input_path, input_variants=None, het_treshold=None, variant_filter=None,
+                        catalog_streaming_size=None, content=None):
+    """
+    Parse a patient JSON file once into an in-memory patient record.
+
+    Files of at least catalog_streaming_size bytes are parsed incrementally: only the catalog variants
+    that can reach the outputs are kept (see catalog_stream).
+
+    :param input_path: Path to the patient JSON file.
+    :param input_variants: Comma-separated string of expected variants (needed for incremental parsing).
+    :param het_treshold: Minimum heteroplasmy threshold (needed for incremental parsing).
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+    :param content: Content of the record when it was read from an archive or a bundle (see input_sources).
+    :return: JSON data as a dictionary if successful, else False.
+    """
+    logging.info(f"Loading: {input_path}")
+    if het_treshold is not None and streaming_catalog(input_path, catalog_streaming_size, content):
+        return load_streamed_patient_record(input_path, input_variants, het_treshold, variant_filter, content)
+    if content is not None:
+        return load_json_content(content, input_path)
+    return load_json(input_path)
+
+
+def process_patient_record(input_path, file_data, hpo_index, input_variants, het_treshold, normalization_status,
+                           variant_filter=None):
+    """
+    Run verification, HPO extraction and variant structuring on one loaded patient record.
+
+    :param input_path: Path of the JSON file the record was loaded from.
+    :param file_data: Patient record as returned by load_patient_record.
+    :param hpo_index: HPOIndex shared by all patients (or path to the HPO reference file). If None, the HPO
+                      terms are returned without names, to be looked up once for the cohort through the API.
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :return: Dictionary { "filename", "verified", "reason", "hpo", "variants", "patient", "timings" } for the
+             patient, "variants" holding the typed variant columns of the file (variant_table.VariantColumns),
+             "patient" its patient information (the columns that follow the variant columns, see
+             variants_unique_format.structuring_sample_information) and "timings" the seconds spent in each
+             stage (see run_metrics.PATIENT_OPERATIONS).
+    """
+    filename = input_path.split("/")[-1]
+    timings = {}
+    result = {"filename": filename, "verified": False, "reason": "", "hpo": {}, "variants": {}, "patient": {},
+              "timings": timings}
+
+    # The HPO and variant stages only run on records that passed verification (stops at the first failure)
+    start = time.perf_counter()
+    passed, result["reason"] = verify_patient_record(file_data, input_path, input_variants, het_treshold)
+    timings["verification"] = time.perf_counter() - start
+    if not passed:
+        return result
+
+    result["verified"] = True
+    start = time.perf_counter()
+    if hpo_index is None:
+        result["hpo"] = extracting_unnamed_HPO(file_data)
+    else:
+        result["hpo"] = research_HPO_from_data(file_data, hpo_index)
+    timings["hpo"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result["variants"], result["patient"] = concatenation_sample_from_data(
+        input_path, file_data, het_treshold, input_variants, normalization_status, variant_filter
+    )
+    timings["variants"] = time.perf_counter() - start
+
+    return result
+
+
+def process_patient_file(input_path, hpo_index, input_variants, het_treshold, normalization_status,
+                         variant_filter=None, catalog_streaming_size=None, content=None):
+    """
+    Load a patient JSON file once and run every per-patient stage on it.
+
+    :param input_path: Path to the patient JSON file.
+    :param hpo_index: HPOIndex shared by all patients (or path to the HPO reference file).
+    :param input_variants: Comma-separated string of expected variants.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param normalization_status: Normalization mode ("yes", "no", "blood", "urine").
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+    :param content: Content of the record when it was read from an archive or a bundle (see input_sources).
+    :return: Dictionary { "filename", "verified", "reason", "hpo", "variants", "patient", "timings" } for the
+             patient (see process_patient_record).
+    """
+    start = time.perf_counter()
+    file_data = load_patient_record(input_path, input_variants, het_treshold, variant_filter, catalog_streaming_size,
+                                    content)
+    load_seconds = time.perf_counter() - start
+
+    result = process_patient_record(input_path, file_data, hpo_index, input_variants, het_treshold,
+                                    normalization_status, variant_filter)
+    result["timings"]["load"] = load_seconds
+
+    return result
+
+
+def process_patient_sweep(input_path, hpo_index, input_variants, configurations, variant_filter=None,
+                          catalog_streaming_size=None, content=None):
+    """
+    Load a patient JSON file once and run the per-patient stages for several parameter configurations.
+
+    The record is parsed once, verified once per distinct threshold and its HPO terms are extracted once;
+    only the variant structuring runs for every configuration.
+
+    :param input_path: Path to the patient JSON file.
+    :param hpo_index: HPOIndex shared by all patients (or path to the HPO reference file).
+    :param input_variants: Comma-separated string of expected variants.
+    :param configurations: List of (het_treshold, normalization_status) tuples.
+    :param variant_filter: Optional VariantFilter applied to the variants.
+    :param catalog_streaming_size: Size in bytes from which files are parsed incrementally (None = never).
+    :param content: Content of the record when it was read from an archive or a bundle (see input_sources).
+    :return: Dictionary { (het_treshold, normalization_status): per-patient result (see process_patient_record) }.
+    """
+    start = time.perf_counter()
+    # An incrementally parsed record keeps the variants of the lowest threshold, enough for every configuration
+    file_data = load_patient_record(input_path, input_variants, min(het for het, _ in configurations), variant_filter,
+                                    catalog_streaming_size, content)
+    filename = input_path.split("/")[-1]
+
+    # Timings of the whole file (every configuration), shared by the results of its configurations
+    timings = {"load": time.perf_counter() - start, "verification": 0.0}
+    verifications = {}  # { het_treshold: (passed, reason) }
+    hpo = None
+    results = {}
+
+    for het_treshold, normalization_status in configurations:
+        if het_treshold not in verifications:
+            start = time.perf_counter()
+            verifications[het_treshold] = verify_patient_record(file_data, input_path, input_variants, het_treshold)
+            timings["verification"] += time.perf_counter() - start
+        passed, reason = verifications[het_treshold]
+
+        result = {"filename": filename, "verified": passed, "reason": reason, "hpo": {}, "variants": {},
+                  "patient": {}, "timings": timings}
+        if passed:
+            if hpo is None:  # The HPO terms do not depend on the configuration
+                start = time.perf_counter()
+                if hpo_index is None:
+                    hpo = extracting_unnamed_HPO(file_data)
+                else:
+                    hpo = research_HPO_from_data(file_data, hpo_index)
+                timings["hpo"] = time.perf_counter() - start
+            result["hpo"] = hpo
+
+            start = time.perf_counter()
+            result["variants"], result["patient"] = concatenation_sample_from_data(
+                input_path, file_data, het_treshold, input_variants, normalization_status, variant_filter
+            )
+            timings["variants"] = timings.get("variants", 0.0) + time.perf_counter() - start
+        results[(het_treshold, normalization_status)] = result
+
+    return results
@@ -0,0 +1,251 @@
+import cProfile  # Module for the --profile dumps
+from contextlib import contextmanager
+import json  # Module for writing metrics.json
+import logging  # Module for logging the metrics
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource  # Peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+# Run metrics: every stage of main.py is measured (wall and CPU time, peak RSS, files/s and variants/s)
+# together with the per-file operations timed in patient_record (load, verification, HPO, variants).
+# The measures are logged in process.log and written to metrics.json in the output folder.
+
+METRICS_FILENAME = "metrics.json"
+METRICS_VERSION = 2  # Bump when the layout of metrics.json changes
+PROFILE_FOLDERNAME = "profile"  # Folder of the --profile dumps, in the output folder
+
+# Per-file operations timed by patient_record.process_patient_file, in result["timings"]
+PATIENT_OPERATIONS = ("load", "verification", "hpo", "variants")
+
+
+def cpu_seconds():
+    """
+    Returns the CPU time (user + system) of the process and of its terminated worker processes.
+    """
+    times = os.times()  # Children times are only counted once the workers have exited
+    return time.process_time() + times.children_user + times.children_system
+
+
+def peak_rss_bytes(worker_pool=False):
+    """
+    Returns the peak resident set size of the process and the largest one of its reaped worker processes,
+    in bytes.
+
+    RUSAGE_CHILDREN only counts the children that have exited and been waited for, so the worker value
+    stays 0 while a pool is running and is reported only when a pool was used.
+
+    :param worker_pool: True if the run used a pool of worker processes.
+    :return: Tuple (process peak, maximum over the reaped workers), None where it cannot be measured or
+             without a pool.
+    """
+    if resource is None:
+        return None, None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit if worker_pool else None)
+
+
+def formatting_bytes(value):
+    """Formats a number of bytes in MiB for the logs."""
+    return "n/a" if value is None else f"{value / 2 ** 20:,.1f} MiB"
+
+
+class RunMetrics:
+    """
+    Collects the metrics of a pipeline run.
+    """
+
+    def __init__(self, output_folder, profile=False, workers=1):
+        """
+        :param output_folder: Output folder of the run (metrics.json and the profile folder are written there).
+        :param profile: If True, the stages measured with profile=True are run under cProfile and tracemalloc.
+        :param workers: Number of worker processes of the run, the worker peak RSS being reported above 1.
+        """
+        self.output_folder = output_folder
+        self.profile = profile
+        self.worker_pool = workers > 1
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_seconds()
+
+        self.stages = {}  # { stage: measures }, in execution order
+        self.counters = {"files": 0, "passed": 0, "failed": 0, "errors": 0, "cached": 0, "variants": 0,
+                         "hpo_terms": 0, "missing_hpo_terms": 0}
+        self.operations = {operation: {"files": 0, "seconds": 0.0, "max_seconds": 0.0, "slowest_file": None}
+                           for operation in PATIENT_OPERATIONS}
+
+    @contextmanager
+    def stage(self, name, files=None, variants=None, profile=False):
+        """
+        Measures a stage of the run.
+
+        Throughputs are computed from the files and variants counted during the stage (see
+        add_patient_result), unless the numbers of files or variants handled by the stage are given.
+
+        :param name: Stage name.
+        :param files: Number of files handled by the stage.
+        :param variants: Number of variants handled by the stage.
+        :param profile: If True and profiling is enabled, the stage is profiled (see dumping_profile).
+        """
+        profiler = cProfile.Profile() if self.profile and profile else None
+        if profiler is not None:
+            tracemalloc.start()
+            profiler.enable()
+
+        counters_before = dict(self.counters)
+        start_wall, start_cpu = time.perf_counter(), cpu_seconds()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, cpu_seconds() - start_cpu
+
+            if profiler is not None:
+                profiler.disable()
+                self.dumping_profile(name, profiler, tracemalloc.take_snapshot())
+                tracemalloc.stop()
+
+            files = self.counters["files"] - counters_before["files"] if files is None else files
+            variants = self.counters["variants"] - counters_before["variants"] if variants is None else variants
+            peak_rss, reaped_worker_max_rss = peak_rss_bytes(self.worker_pool)
+
+            self.stages[name] = {
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(cpu, 6),
+                "peak_rss_bytes": peak_rss,
+                "reaped_worker_max_rss_bytes": reaped_worker_max_rss,
+                "files": files,
+                "variants": variants,
+                "files_per_second": round(files / wall, 3) if files and wall else None,
+                "variants_per_second": round(variants / wall, 3) if variants and wall else None,
+            }
+
+            throughput = ""
+            if files:
+                throughput += f", {files} files ({files / max(wall, 1e-9):,.1f} files/s)"
+            if variants:
+                throughput += f", {variants} variants ({variants / max(wall, 1e-9):,.1f} variants/s)"
+            logging.info(f"Metrics - stage '{name}': {wall:.3f} s wall, {cpu:.3f} s CPU, "
+                         f"peak RSS {formatting_bytes(peak_rss)}{throughput}")
+
+    def add_patient_result(self, result, hpo_named=True):
+        """
+        Counts a per-patient result and adds its per-file timings.
+
+        :param result: Per-patient result dictionary (see patient_record.process_patient_record).
+        :param hpo_named: False when the HPO names are looked up later (HPO API): the missing terms are then
+                          counted by counting_missing_hpo.
+        """
+        self.counters["files"] += 1
+
+        if "error" in result:
+            self.counters["errors"] += 1
+        elif result["verified"]:
+            self.counters["passed"] += 1
+        else:
+            self.counters["failed"] += 1
+
+        self.counters["variants"] += sum(len(rows) for rows in result["variants"].values())
+        for hpos in result["hpo"].values():
+            self.counters["hpo_terms"] += len(hpos)
+            if hpo_named:
+                self.counters["missing_hpo_terms"] += sum(1 for _, hpo_name in hpos if hpo_name == "")
+
+        # Cached results carry the timings of the run that processed them
+        if result.get("cached"):
+            self.counters["cached"] += 1
+            return
+
+        for operation, seconds in result.get("timings", {}).items():
+            measure = self.operations[operation]
+            measure["files"] += 1
+            measure["seconds"] += seconds
+            if seconds > measure["max_seconds"]:
+                measure["max_seconds"], measure["slowest_file"] = seconds, result["filename"]
+
+    def counting_missing_hpo(self, hpo_result):
+        """
+        Counts the HPO terms without a name once they are looked up.
+
+        :param hpo_result: Dictionary { patient_id: [(hpo_id, hpo_name), ...] }.
+        """
+        self.counters["missing_hpo_terms"] = sum(1 for hpos in hpo_result.values()
+                                                 for _, hpo_name in hpos if hpo_name == "")
+
+    def dumping_profile(self, name, profiler, snapshot):
+        """
+        Writes the profile of a stage in the profile folder of the output folder:
+        <stage>.prof (cProfile statistics, readable with pstats or snakeviz), <stage>_cprofile.txt
+        (functions sorted by cumulative time) and <stage>_tracemalloc.txt (top allocating lines).
+
+        :param name: Stage name.
+        :param profiler: cProfile.Profile of the stage.
+        :param snapshot: tracemalloc snapshot taken at the end of the stage.
+        """
+        profile_folder = os.path.join(self.output_folder, PROFILE_FOLDERNAME)
+        os.makedirs(profile_folder, exist_ok=True)
+
+        profiler.dump_stats(os.path.join(profile_folder, f"{name}.prof"))
+
+        with open(os.path.join(profile_folder, f"{name}_cprofile.txt"), "w") as fh_out:
+            pstats.Stats(profiler, stream=fh_out).sort_stats("cumulative").print_stats(50)
+
+        with open(os.path.join(profile_folder, f"{name}_tracemalloc.txt"), "w") as fh_out:
+            current, peak = tracemalloc.get_traced_memory()
+            fh_out.write(f"Traced memory: current {formatting_bytes(current)}, peak {formatting_bytes(peak)}\n\n")
+            for statistic in snapshot.statistics("lineno")[:30]:
+                fh_out.write(f"{statistic}\n")
+
+        logging.info(f"Profile of stage '{name}' written to '{profile_folder}'.")
+
+    def write(self):
+        """
+        Logs the run summary and writes metrics.json to the output folder.
+
+        :return: Path of metrics.json.
+        """
+        wall, cpu = time.perf_counter() - self.start_wall, cpu_seconds() - self.start_cpu
+        peak_rss, reaped_worker_max_rss = peak_rss_bytes(self.worker_pool)
+
+        operations = {}
+        for operation, measure in self.operations.items():
+            operations[operation] = dict(measure, seconds=round(measure["seconds"], 6),
+                                         max_seconds=round(measure["max_seconds"], 6),
+                                         mean_seconds=round(measure["seconds"] / measure["files"], 6)
+                                         if measure["files"] else None)
+
+        metrics = {
+            "version": METRICS_VERSION,
+            "started": self.started,
+            "total": {"wall_seconds": round(wall, 6), "cpu_seconds": round(cpu, 6), "peak_rss_bytes": peak_rss,
+                      "reaped_worker_max_rss_bytes": reaped_worker_max_rss},
+            "counters": self.counters,
+            "stages": self.stages,
+            "patient_operations": operations,
+        }
+
+        workers_rss = "" if not self.worker_pool else \
+            f" (max over reaped workers: {formatting_bytes(reaped_worker_max_rss)})"
+        logging.info(f"Metrics - run: {wall:.3f} s wall, {cpu:.3f} s CPU, peak RSS {formatting_bytes(peak_rss)}"
+                     f"{workers_rss}; {self.counters['files']} files "
+                     f"({self.counters['failed']} failed, {self.counters['errors']} errors, "
+                     f"{self.counters['cached']} cached), {self.counters['variants']} variants, "
+                     f"{self.counters['missing_hpo_terms']} missing HPO terms")
+        for operation, measure in operations.items():
+            if measure["files"]:
+                logging.info(f"Metrics - per file '{operation}': mean {measure['mean_seconds'] * 1000:.3f} ms, "
+                             f"max {measure['max_seconds'] * 1000:.3f} ms ({measure['slowest_file']})")
+
+        metrics_path = os.path.join(self.output_folder, METRICS_FILENAME)
+        with open(metrics_path, "w") as fh:
+            json.dump(metrics, fh, indent=2)
+
+        return metrics_path
@@ -0,0 +1,160 @@
+import os
+from typing import NamedTuple, Optional
+
+from HPO_terms_API_request import HPO_API_URL, HPO_API_CACHE_TTL
+from variant_annotation import DEFAULT_ANNOTATION_FOLDER
+from catalog_stream import CATALOG_STREAMING_SIZE
+from input_sources import containing_records, listing_input_sources
+from watch_folder import WATCH_INTERVAL
+
+# Run options: the optional settings of a pipeline run (main.py), grouped in one object so that main() keeps
+# the positional parameters of the original pipeline, and the modes that cannot be combined are checked in a
+# single place for the command line and for the callers of main().
+
+# Command line option of each mode, for the messages
+MODE_OPTIONS = {
+    "streaming": "--streaming",
+    "incremental": "--incremental",
+    "hpo_api": "--hpo-api",
+    "watch": "--watch",
+    "sweep": "--sweep-het/--sweep-norm",
+    "cohort_db": "--cohort-db",
+    "cohort_index": "--cohort-index",
+}
+
+# Mode -> modes it cannot be combined with
+MODE_CONFLICTS = {
+    "watch": ("streaming", "incremental", "hpo_api"),
+    "sweep": ("streaming", "incremental", "watch", "hpo_api"),
+    "cohort_db": ("watch", "sweep"),
+    "cohort_index": ("streaming", "watch"),
+}
+
+
+class RunOptions(NamedTuple):
+    """
+    Optional settings of a pipeline run (see main.main), with the defaults of the command line.
+
+    References:
+        - hpo_cache_folder: Folder for the cached HPO index (None = ".hpo_cache" next to the HPO file).
+        - use_hpo_cache: If False, the HPO ontology is always parsed and no cache is written.
+        - annotation_folder: Folder containing the annotation tables (see variant_annotation.ANNOTATION_FILES).
+
+    Execution:
+        - workers: Number of worker processes for the per-patient stages (1 = no pool).
+        - chunk_size: Number of files per batch sent to a worker process (None = adapted to the cohort size).
+        - catalog_streaming_size: Size in bytes from which patient files are parsed incrementally, only the
+          catalog variants that can reach the outputs being kept in memory (see catalog_stream).
+        - profile: If True, the cProfile statistics and tracemalloc top allocations of the main stages are
+          written to the "profile" folder of the output folder (main process only).
+
+    Modes (see MODE_CONFLICTS for the modes that cannot be combined):
+        - streaming: If True, the concatenated files are written patient by patient instead of keeping every
+          patient's rows in memory until the end (see streaming_output).
+        - incremental: If True, unchanged files are not processed again: their results are read from the
+          cache recorded in the output folder manifest (see manifest_cache).
+        - watch: If True, the pipeline keeps running: the input folder is scanned every watch_interval seconds
+          and the outputs are updated as soon as new or changed files arrive (see watch_folder).
+        - watch_interval: Delay between two scans of the input folder in watch mode, in seconds.
+        - sweep_thresholds: List of heteroplasmy thresholds of a parameter sweep (None = het_treshold only).
+        - sweep_normalizations: List of normalization modes of a parameter sweep (None = normalization_status
+          only). When a sweep is given, every file is parsed once for all the (threshold, normalization)
+          combinations, each written to its own sub-folder (see parameter_sweep).
+
+    HPO terms:
+        - hpo_api: If True, HPO names are looked up through the HPO API instead of the HPO file. Terms are
+          collected for the whole cohort and each distinct term is requested once.
+        - hpo_api_url: Base URL of the HPO API.
+        - hpo_api_cache: Path to the persistent JSON cache of HPO API names (None = no persistent cache).
+        - hpo_api_ttl: Time-to-live of a cached HPO API name, in seconds.
+        - hpo_api_workers: Maximum number of concurrent HPO API requests.
+        - hpo_propagate: If True, the presence/absence table counts each patient's HPO terms for all their
+          ancestors in the "is_a" hierarchy of the HPO file (see HPO_ontology).
+        - hpo_depth: Collapses the propagated terms to their ancestors at this depth (implies hpo_propagate).
+        - hpo_subtrees: List of HPO IDs, only the propagated terms in their subtrees are kept (implies
+          hpo_propagate).
+
+    Outputs:
+        - hpo_matrix_format: Format of the presence/absence table: "dense" (CSV), "sparse" (Matrix Market)
+          or "both".
+        - output_format: Format of the variant and clinical tables: "csv", "parquet" or "arrow".
+        - report_format: Format of the verification report: "csv" or "json".
+        - annotate: If True, the locus, strand, APOGEE and t-APOGEE columns are added to the variant table.
+        - cohort_db: Path to a SQLite cohort database into which the verified patients are loaded, added to
+          (or replacing the samples of) the patients already there (see cohort_store).
+        - cohort_index: If True, the variant -> samples and HPO term -> patients inverted indexes are written
+          to the "cohort_index" folder of the output folder (see cohort_index).
+
+    Variant filters:
+        - filter_loci: List of loci, only the variants in one of them are kept (e.g. ["MT-TL1"]).
+        - trna_only: If True, only the variants in a tRNA locus are kept.
+        - apogee2_classes: List of APOGEE2 classes, only the variants with one of them are kept
+          (e.g. ["Pathogenic"]).
+        - position_ranges: List of (start, end) position ranges, only the variants inside one of them are kept.
+    """
+
+    # References
+    hpo_cache_folder: Optional[str] = None
+    use_hpo_cache: bool = True
+    annotation_folder: str = DEFAULT_ANNOTATION_FOLDER
+
+    # Execution
+    workers: int = 1
+    chunk_size: Optional[int] = None
+    catalog_streaming_size: Optional[int] = CATALOG_STREAMING_SIZE
+    profile: bool = False
+
+    # Modes
+    streaming: bool = False
+    incremental: bool = False
+    watch: bool = False
+    watch_interval: float = WATCH_INTERVAL
+    sweep_thresholds: Optional[list] = None
+    sweep_normalizations: Optional[list] = None
+
+    # HPO terms
+    hpo_api: bool = False
+    hpo_api_url: str = HPO_API_URL
+    hpo_api_cache: Optional[str] = None
+    hpo_api_ttl: float = HPO_API_CACHE_TTL
+    hpo_api_workers: int = 8
+    hpo_propagate: bool = False
+    hpo_depth: Optional[int] = None
+    hpo_subtrees: Optional[list] = None
+
+    # Outputs
+    hpo_matrix_format: str = "dense"
+    output_format: str = "csv"
+    report_format: str = "csv"
+    annotate: bool = False
+    cohort_db: Optional[str] = None
+    cohort_index: bool = False
+
+    # Variant filters
+    filter_loci: Optional[list] = None
+    trna_only: bool = False
+    apogee2_classes: Optional[list] = None
+    position_ranges: Optional[list] = None
+
+    @property
+    def sweep(self):
+        """True for a parameter sweep."""
+        return bool(self.sweep_thresholds or self.sweep_normalizations)
+
+    def checking_modes(self, input_folder=None):
+        """
+        Checks that the requested modes can be combined.
+
+        :param input_folder: Input folder of the run, to check that the incremental and watch modes only get the
+                             JSON files of a folder (None = not checked).
+        :raises ValueError: If two modes cannot be combined, or if the input does not suit the mode.
+        """
+        for mode, conflicts in MODE_CONFLICTS.items():
+            combined = [MODE_OPTIONS[other] for other in conflicts if getattr(self, other)]
+            if getattr(self, mode) and combined:
+                raise ValueError(f"{MODE_OPTIONS[mode]} cannot be combined with {', '.join(combined)}.")
+
+        if (self.incremental or self.watch) and input_folder is not None and (
+                not os.path.isdir(input_folder) or any(map(containing_records, listing_input_sources(input_folder)))):
+            raise ValueError("The incremental and watch modes only read the JSON files of an input folder, "
+                             "not archives or bundles.")
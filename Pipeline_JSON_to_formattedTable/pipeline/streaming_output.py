@@ -0,0 +1,114 @@
+import csv  # Module for handling CSV file operations
+import os
+
+from HPO_unique_csv import HPO_HEADER, hpo_standard_output_file, writing_hpo_rows
+from variant_generation_csv import variant_header, writing_variant_rows
+from columnar_output import ColumnarTableWriter, VARIANT_COLUMN_TYPES, output_path_for_format
+from variant_table import expanding_variants
+
+# Streaming output: concatenate_variants.csv and concatenate_HPO.csv are written as soon as each patient
+# result is available, so variant rows are never accumulated for the whole cohort. Only the small per-file
+# summaries needed by the clinical table and the per-patient HPO terms needed by the presence/absence table
+# are kept. As in the in-memory mode, a patient with several samples keeps the HPO terms of its last sample:
+# when a later sample changes them, concatenate_HPO.csv is rewritten from memory once the stream is closed.
+
+
+class StreamingOutput:
+    """
+    Writes the concatenated variant and HPO files patient by patient.
+
+    Memory: besides one patient result at a time, the stream keeps the clinical table summary of every file
+    (patient_information) and the HPO terms of every patient (patient_hpo). The (hpo_id, hpo_name) pairs are
+    interned, so patient_hpo costs a tuple of references per patient (about 8 bytes per term) plus one copy
+    of each distinct term of the cohort.
+
+    Usage:
+        with StreamingOutput(output_folder) as stream:
+            for patient_result in patient_results:
+                stream.add_patient_result(patient_result)
+    """
+
+    def __init__(self, output_folder, write_hpo=True, output_format="csv", annotation=None):
+        """
+        :param output_folder: Folder where the concatenated files are written.
+        :param write_hpo: If False, concatenate_HPO.csv is not written (e.g. when the HPO names are looked up through
+                          the API once every patient has been processed).
+        :param output_format: Format of the variant table: "csv", "parquet" or "arrow".
+        :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+        """
+        self.output_format = output_format
+        self.annotation = annotation
+        self.output_path_concatenate_variants = output_path_for_format(
+            os.path.join(output_folder, "concatenate_variants.csv"), output_format)
+        self.output_path_concatenate_hpo = os.path.join(output_folder, "concatenate_HPO.csv")
+
+        # { "patient_id": ((hpo_terms, hpo_name), ...) } needed for the presence/absence table
+        self.patient_hpo = {}
+        self.hpo_terms = {}  # Interned (hpo_terms, hpo_name) pairs
+        self.hpo_changed = False  # True when a later sample changed the HPO terms of a written patient
+        # { file_name: patient_info } needed for the clinical table (the "patient" entry of the results)
+        self.patient_information = {}
+
+        self.variant_count = 0  # Number of variant rows written
+        self.write_hpo = write_hpo
+
+        self.variant_fh = None
+        self.columnar_writer = None
+        self.hpo_fh = None
+
+    def __enter__(self):
+        if self.output_format == "csv":
+            self.variant_fh = open(self.output_path_concatenate_variants, "w", newline="")
+            self.variant_writer = csv.writer(self.variant_fh, delimiter=";")
+            self.variant_writer.writerow(variant_header(self.annotation))
+        else:
+            column_types = {name: VARIANT_COLUMN_TYPES[name] for name in variant_header(self.annotation)}
+            self.columnar_writer = ColumnarTableWriter(self.output_path_concatenate_variants, self.output_format,
+                                                       column_types)
+            self.columnar_writer.__enter__()
+
+        if self.write_hpo:
+            self.hpo_fh = open(self.output_path_concatenate_hpo, "w", newline="")
+            self.hpo_writer = csv.writer(self.hpo_fh, delimiter=";")
+            self.hpo_writer.writerow(HPO_HEADER)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.output_format == "csv":
+            self.variant_fh.close()
+        else:
+            self.columnar_writer.__exit__(exc_type, exc_value, traceback)
+
+        if self.write_hpo:
+            self.hpo_fh.close()
+            # Deferred rewrite: the rows of a patient whose terms changed are replaced in place
+            if self.hpo_changed and exc_type is None:
+                hpo_standard_output_file(self.patient_hpo, self.output_path_concatenate_hpo)
+
+    def add_patient_result(self, patient_result):
+        """
+        Writes the rows of one verified patient result and keeps its summaries.
+
+        :param patient_result: Per-patient result (see patient_record.process_patient_record).
+        """
+        variants = expanding_variants(patient_result["variants"], patient_result["patient"])
+        if self.output_format == "csv":
+            writing_variant_rows(self.variant_writer, variants, self.annotation)
+        else:
+            for rows in variants.values():
+                if self.annotation is not None:
+                    rows = self.annotation.annotating_rows(rows)
+                self.columnar_writer.write_rows(rows)
+        self.variant_count += sum(len(rows) for rows in variants.values())
+        self.patient_information.update(patient_result["patient"])
+
+        # A patient with several samples keeps the HPO terms of its last sample (see update_global_hpo)
+        for patient_id, hpos in patient_result["hpo"].items():
+            hpos = tuple(self.hpo_terms.setdefault(hpo, hpo) for hpo in map(tuple, hpos))
+            if patient_id not in self.patient_hpo:
+                if self.write_hpo:
+                    writing_hpo_rows(self.hpo_writer, {patient_id: hpos})
+            elif self.patient_hpo[patient_id] != hpos:
+                self.hpo_changed = True
+            self.patient_hpo[patient_id] = hpos
@@ -0,0 +1,312 @@
+import csv  # Module for reading the annotation tables
+import json  # Module for the cache metadata
+import logging  # Module for logging warnings and errors
+import os
+
+import numpy as np
+
+from variant_generation_csv import VARIANT_HEADER
+
+# Variant annotation: the mitochondrial genome annotation tables (genomic loci, APOGEE1/2 scores of the
+# protein variants, t-APOGEE scores of the tRNA variants) are loaded once into dense arrays, the locus and
+# strand indexed by position and the scores by position x alternative allele, so annotating a variant is a
+# lookup instead of a join on "A3243G" ids. The arrays are cached as .npy files next to the tables and
+# memory-mapped by later runs.
+
+GENOME_LENGTH = 16569  # Length of the mitochondrial genome (rCRS)
+ALT_ALLELES = "ACGT"  # Alternative alleles of the single nucleotide variants, one array column each
+ALT_INDEX = {allele: index for index, allele in enumerate(ALT_ALLELES)}
+
+# Allele column of the variants that are not single nucleotide substitutions (indels, N alleles): it has no
+# score, but these variants still get the locus and strand of their position
+OTHER_ALLELE = len(ALT_ALLELES)
+
+ANNOTATION_CACHE_VERSION = 2  # Bump when the cached array layout changes
+
+# Default folder of the annotation tables
+DEFAULT_ANNOTATION_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                                         "Analysis_mito_cohorte", "data")
+
+# Annotation tables, by source name
+ANNOTATION_FILES = {
+    "loci": "genome_loci_table.csv",
+    "apogee": "apogee2_score_filtered.txt",
+    "trna": "apogee2_trna.csv",
+}
+
+# Columns added to the variant table
+ANNOTATION_HEADER = ["locus", "strand", "apogee1_score", "apogee1", "apogee2_score", "apogee2_probability",
+                     "apogee2", "t_apogee_score", "t_apogee_unbiased_score"]
+
+# The locus and strand are properties of the position, the other columns of the substitution
+POSITION_COLUMNS = ("locus", "strand")
+
+# Categorical columns are stored as uint8 codes (0 = no annotation), scores as float64 (NaN = no annotation)
+CATEGORY_COLUMNS = ("locus", "strand", "apogee1", "apogee2")
+POSITION_DTYPE = np.dtype([(name, np.uint8) for name in POSITION_COLUMNS])
+ANNOTATION_DTYPE = np.dtype([(name, np.uint8 if name in CATEGORY_COLUMNS else np.float64)
+                             for name in ANNOTATION_HEADER if name not in POSITION_COLUMNS])
+
+# Values meaning "no value" in the source tables
+MISSING_VALUES = {"", ".", "NA"}
+
+
+class VariantAnnotation:
+    """
+    Annotation of the variants of the mitochondrial genome.
+
+    positions[pos] is the locus and strand record of a position, shared by every variant at this position
+    (substitutions, indels and rows whose alternative allele is the reference). table[pos, ALT_INDEX[alt]]
+    is the score record of a single nucleotide substitution, the OTHER_ALLELE column being empty. Row 0,
+    which is not a genome position, is empty and is used for the positions outside the genome.
+    """
+
+    def __init__(self, table, positions, vocabularies):
+        """
+        :param table: Structured array of shape (GENOME_LENGTH + 1, len(ALT_ALLELES) + 1) and dtype ANNOTATION_DTYPE.
+        :param positions: Structured array of shape (GENOME_LENGTH + 1,) and dtype POSITION_DTYPE.
+        :param vocabularies: Dictionary { categorical column: [values] }, code i + 1 being values[i].
+        """
+        self.table = table
+        self.positions = positions
+        self.vocabularies = vocabularies
+        self.header = ANNOTATION_HEADER
+
+        # Decoding arrays of the categorical columns, code 0 being the empty value
+        self.decoding = {name: np.array([""] + list(values), dtype=object) for name, values in vocabularies.items()}
+
+    def indexing(self, positions, reference_alleles, alternative_alleles):
+        """
+        Computes the table indices of variants: the positions outside the genome are sent to row 0, and the
+        variants that are not single nucleotide substitutions to the OTHER_ALLELE column.
+
+        :param positions: Iterable of positions.
+        :param reference_alleles: Iterable of reference alleles.
+        :param alternative_alleles: Iterable of alternative alleles.
+        :return: Tuple (position indices, allele indices) of int arrays.
+        """
+        position_index = []
+        allele_index = []
+
+        for position, reference, alternative in zip(positions, reference_alleles, alternative_alleles):
+            position = int(position)
+            allele = ALT_INDEX.get(alternative, OTHER_ALLELE) if len(reference) == 1 else OTHER_ALLELE
+
+            if not 1 <= position <= GENOME_LENGTH:
+                position = 0
+
+            position_index.append(position)
+            allele_index.append(allele)
+
+        return np.asarray(position_index, dtype=np.intp), np.asarray(allele_index, dtype=np.intp)
+
+    def gathering(self, position_index, allele_index):
+        """
+        Gathers the annotation records of many variants at once.
+
+        :param position_index: Int array of positions (see indexing).
+        :param allele_index: Int array of alternative allele indices (see indexing).
+        :return: Tuple (structured array of locus and strand records, structured array of score records).
+        """
+        return self.positions[position_index], self.table[position_index, allele_index]
+
+    def annotating_rows(self, variant_rows):
+        """
+        Returns the variant rows with the annotation columns appended.
+
+        Rows shorter than VARIANT_HEADER (no m3243 columns) are padded with empty values so that the
+        annotation columns stay aligned with the header.
+
+        :param variant_rows: List of variant rows [chr, pos, ref, alt, het, ...].
+        :return: List of annotated rows.
+        """
+        if not variant_rows:
+            return []
+
+        position_records, allele_records = self.gathering(*self.indexing(
+            (row[1] for row in variant_rows), (row[2] for row in variant_rows), (row[3] for row in variant_rows)))
+
+        columns = []
+        for name in ANNOTATION_HEADER:
+            records = position_records if name in POSITION_COLUMNS else allele_records
+            if name in CATEGORY_COLUMNS:
+                columns.append(self.decoding[name][records[name]].tolist())
+            else:
+                columns.append(["" if np.isnan(value) else value for value in records[name].tolist()])
+
+        width = len(VARIANT_HEADER)
+        return [list(row) + [""] * (width - len(row)) + list(values)
+                for row, values in zip(variant_rows, zip(*columns))]
+
+
+def reading_table(file_path, delimiter):
+    """
+    Reads an annotation table as a list of dictionaries (a UTF-8 byte order mark is ignored).
+
+    :param file_path: Path of the table.
+    :param delimiter: Column delimiter.
+    :return: List of { column: value } rows.
+    """
+    with open(file_path, "r", newline="", encoding="utf-8-sig") as fh:
+        return list(csv.DictReader(fh, delimiter=delimiter))
+
+
+def build_variant_annotation(annotation_folder=DEFAULT_ANNOTATION_FOLDER):
+    """
+    Parses the annotation tables into the dense annotation arrays.
+
+    A variant listed several times in a table (overlapping genes) keeps its first row, and a position takes
+    the locus and strand of its first row in the loci table.
+
+    :param annotation_folder: Folder containing the ANNOTATION_FILES tables.
+    :return: VariantAnnotation.
+    """
+    table = np.zeros((GENOME_LENGTH + 1, len(ALT_ALLELES) + 1), dtype=ANNOTATION_DTYPE)
+    for name in ANNOTATION_DTYPE.names:
+        if name not in CATEGORY_COLUMNS:
+            table[name] = np.nan
+    positions = np.zeros(GENOME_LENGTH + 1, dtype=POSITION_DTYPE)
+
+    vocabularies = {name: {} for name in CATEGORY_COLUMNS}
+
+    def setting(position, allele, name, value):
+        # Sets one annotation value, categorical values being coded in their vocabulary
+        if value in MISSING_VALUES:
+            return
+        if name in CATEGORY_COLUMNS:
+            vocabulary = vocabularies[name]
+            value = vocabulary.setdefault(value, len(vocabulary) + 1)
+        if name in POSITION_COLUMNS:
+            positions[name][position] = value
+        else:
+            table[name][position, allele] = value
+
+    # Source table -> (delimiter, position column, { annotation column: source column })
+    sources = {
+        "loci": (";", "Position", {"locus": "Locus", "strand": "Strand"}),
+        "apogee": ("\t", "Start", {"apogee1_score": "APOGEE1_score", "apogee1": "APOGEE1",
+                                   "apogee2_score": "APOGEE2_score", "apogee2_probability": "APOGEE2_probability",
+                                   "apogee2": "APOGEE2"}),
+        "trna": (";", "Pos", {"t_apogee_score": "t-APOGEE score",
+                              "t_apogee_unbiased_score": "t-APOGEE unbiased score"}),
+    }
+
+    for source, (delimiter, position_column, columns) in sources.items():
+        seen = {}  # { variant, or position for the loci table: locus of its first row }
+        duplicates = 0
+
+        for row in reading_table(os.path.join(annotation_folder, ANNOTATION_FILES[source]), delimiter):
+            position, allele = int(row[position_column]), ALT_INDEX.get(row["Alt"], -1)
+            if allele < 0 or not 1 <= position <= GENOME_LENGTH:
+                continue
+
+            # Overlapping genes list the same variant twice: the first row is kept. The loci table lists
+            # every substitution of a position, only a different locus (overlapping genes) is a duplicate
+            key = position if source == "loci" else (position, allele)
+            if key in seen:
+                duplicates += source != "loci" or seen[key] != row["Locus"]
+                continue
+            seen[key] = row.get("Locus")
+
+            for name, source_column in columns.items():
+                setting(position, allele, name, row[source_column])
+
+        if duplicates:
+            logging.info(f"{duplicates} duplicated variants ignored in '{ANNOTATION_FILES[source]}'.")
+
+    return VariantAnnotation(table, positions, {name: list(vocabulary) for name, vocabulary in vocabularies.items()})
+
+
+def annotation_cache_paths(annotation_folder, cache_folder=None):
+    """
+    Returns the paths of the cached annotation arrays and of their metadata.
+
+    :param annotation_folder: Folder containing the annotation tables.
+    :param cache_folder: Folder holding the cache, defaults to a ".annotation_cache" folder in annotation_folder.
+    :return: Tuple (score array .npy path, position array .npy path, .json path).
+    """
+    if cache_folder is None:
+        cache_folder = os.path.join(annotation_folder, ".annotation_cache")
+    return (os.path.join(cache_folder, "variant_annotation.npy"),
+            os.path.join(cache_folder, "variant_annotation_positions.npy"),
+            os.path.join(cache_folder, "variant_annotation.json"))
+
+
+def annotation_sources_signature(annotation_folder):
+    """
+    Returns the modification time and size of each annotation table, which key the cache.
+    """
+    signature = {}
+    for source, file_name in ANNOTATION_FILES.items():
+        stat = os.stat(os.path.join(annotation_folder, file_name))
+        signature[source] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+
+def load_variant_annotation(annotation_folder=DEFAULT_ANNOTATION_FOLDER, cache_folder=None, use_cache=True):
+    """
+    Loads the variant annotation, memory-mapping the cached arrays when they match the tables.
+
+    :param annotation_folder: Folder containing the annotation tables.
+    :param cache_folder: Folder holding the cache (see annotation_cache_paths).
+    :param use_cache: If False, always parse the tables and do not write any cache.
+    :return: VariantAnnotation.
+    """
+    if not use_cache:
+        return build_variant_annotation(annotation_folder)
+
+    array_path, positions_path, metadata_path = annotation_cache_paths(annotation_folder, cache_folder)
+    signature = annotation_sources_signature(annotation_folder)
+
+    # Try the cached arrays first
+    if os.path.isfile(array_path) and os.path.isfile(positions_path) and os.path.isfile(metadata_path):
+        try:
+            with open(metadata_path, "r") as fh:
+                metadata = json.load(fh)
+
+            if metadata.get("version") == ANNOTATION_CACHE_VERSION and metadata["sources"] == signature:
+                table = np.load(array_path, mmap_mode="r")
+                positions = np.load(positions_path, mmap_mode="r")
+                if (table.dtype == ANNOTATION_DTYPE and table.shape == (GENOME_LENGTH + 1, len(ALT_ALLELES) + 1)
+                        and positions.dtype == POSITION_DTYPE and positions.shape == (GENOME_LENGTH + 1,)):
+                    logging.info(f"Variant annotation loaded from cache '{array_path}'.")
+                    return VariantAnnotation(table, positions, metadata["vocabularies"])
+
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable variant annotation cache '{array_path}': {e}")
+
+    # No valid cache: parse the tables once and store the arrays
+    annotation = build_variant_annotation(annotation_folder)
+    writing_variant_annotation_cache(annotation, array_path, positions_path, metadata_path, signature)
+    logging.info(f"Variant annotation built from '{annotation_folder}'.")
+
+    return annotation
+
+
+def writing_variant_annotation_cache(annotation, array_path, positions_path, metadata_path, signature):
+    """
+    Writes the annotation cache, a failure to write is only logged.
+
+    The arrays are written before their metadata, which is what makes the cache valid.
+
+    :param annotation: VariantAnnotation to cache.
+    :param array_path: Path of the score array .npy file.
+    :param positions_path: Path of the position array .npy file.
+    :param metadata_path: Path of the .json metadata file.
+    :param signature: Signature of the annotation tables (see annotation_sources_signature).
+    """
+    metadata = {"version": ANNOTATION_CACHE_VERSION, "sources": signature, "vocabularies": annotation.vocabularies}
+    try:
+        os.makedirs(os.path.dirname(array_path), exist_ok=True)
+        # Write to temporary files first so concurrent runs never read a partial cache
+        for path, array in ((array_path, annotation.table), (positions_path, annotation.positions)):
+            tmp_array_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_array_path, array)
+            os.replace(tmp_array_path, path)
+
+        tmp_metadata_path = f"{metadata_path}.{os.getpid()}.tmp"
+        with open(tmp_metadata_path, "w") as fh:
+            json.dump(metadata, fh)
+        os.replace(tmp_metadata_path, metadata_path)
+    except OSError as e:
+        logging.warning(f"Could not write variant annotation cache '{array_path}': {e}")
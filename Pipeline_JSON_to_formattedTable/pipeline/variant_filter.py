@@ -0,0 +1,153 @@
+import hashlib  # Module for the filter digest
+import os
+
+import numpy as np
+
+from variant_annotation import ALT_ALLELES, ALT_INDEX, DEFAULT_ANNOTATION_FOLDER, GENOME_LENGTH, OTHER_ALLELE
+
+# Variant filter: extraction-time filters on the locus, the APOGEE2 class or the position of the variants.
+# The criteria are compiled once into a boolean mask over position x alternative allele, and the variants
+# are tested against it in structuring_sample_information, so the rejected variants are never written.
+
+TRNA_NAMES_FILE = "tRNA_names.txt"  # Comma-separated list of the tRNA loci, in the annotation folder
+
+# The mask column OTHER_ALLELE holds the variants that are not single nucleotide substitutions (indels,
+# N alleles): they are only tested against the position criteria (positions and loci)
+
+
+class VariantFilter:
+    """
+    Compiled variant filter: mask[pos, allele] is True if the variant passes every criterion.
+    """
+
+    def __init__(self, mask, criteria):
+        """
+        :param mask: Boolean array of shape (GENOME_LENGTH + 1, len(ALT_ALLELES) + 1).
+        :param criteria: Dictionary describing the criteria (for the logs).
+        """
+        self.mask = mask
+        self.criteria = criteria
+        self.digest = hashlib.sha1(np.ascontiguousarray(mask).tobytes()).hexdigest()
+
+    def accepting(self, position, reference, alternative):
+        """
+        Tests one variant against the mask.
+
+        :param position: Variant position.
+        :param reference: Reference allele.
+        :param alternative: Alternative allele.
+        :return: True if the variant passes the filter.
+        """
+        position = int(position)
+        if not 1 <= position <= GENOME_LENGTH:
+            return False
+
+        allele = ALT_INDEX.get(alternative, OTHER_ALLELE) if len(reference) == 1 else OTHER_ALLELE
+        return bool(self.mask[position, allele])
+
+
+def reading_trna_names(annotation_folder=DEFAULT_ANNOTATION_FOLDER):
+    """
+    Reads the names of the tRNA loci.
+
+    :param annotation_folder: Folder containing tRNA_names.txt.
+    :return: List of tRNA locus names (e.g. "MT-TL1").
+    """
+    with open(os.path.join(annotation_folder, TRNA_NAMES_FILE), "r") as fh:
+        return [name.strip() for name in fh.read().split(",") if name.strip()]
+
+
+def parsing_position_ranges(position_ranges):
+    """
+    Parses position ranges such as "3230-3304,8344".
+
+    :param position_ranges: Comma-separated list of "start-end" ranges (inclusive) or single positions.
+    :return: List of (start, end) tuples.
+    """
+    ranges = []
+    for position_range in position_ranges.replace(" ", "").split(","):
+        if not position_range:
+            continue
+        start, _, end = position_range.partition("-")
+        try:
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise ValueError(f"Invalid position range '{position_range}' (expected 'start-end').")
+
+        if start > end:
+            raise ValueError(f"Invalid position range '{position_range}' (start after end).")
+        if not (1 <= start and end <= GENOME_LENGTH):
+            raise ValueError(f"Invalid position range '{position_range}' (positions are 1 to {GENOME_LENGTH}).")
+        ranges.append((start, end))
+    return ranges
+
+
+def coding_values(annotation, column, values):
+    """
+    Returns the codes of categorical annotation values, unknown values being an error.
+
+    :param annotation: VariantAnnotation.
+    :param column: Categorical column ("locus" or "apogee2").
+    :param values: Values to select.
+    :return: List of codes.
+    """
+    vocabulary = annotation.vocabularies[column]
+    unknown = [value for value in values if value not in vocabulary]
+    if unknown:
+        raise ValueError(f"Unknown {column} value(s) {', '.join(unknown)} (known: {', '.join(vocabulary)}).")
+    return [vocabulary.index(value) + 1 for value in values]
+
+
+def building_variant_filter(annotation=None, loci=None, trna_only=False, apogee2_classes=None,
+                            position_ranges=None, annotation_folder=DEFAULT_ANNOTATION_FOLDER):
+    """
+    Compiles the filter criteria into a position x allele mask. A variant must pass every given criterion.
+
+    :param annotation: VariantAnnotation, required by the loci, tRNA and APOGEE2 criteria.
+    :param loci: List of locus names to keep (e.g. ["MT-TL1", "MT-ND5"]).
+    :param trna_only: If True, only the variants in a tRNA locus (see TRNA_NAMES_FILE) are kept.
+    :param apogee2_classes: List of APOGEE2 classes to keep (e.g. ["Pathogenic", "VUS+"]); only the single
+                            nucleotide variants having one of these classes are kept.
+    :param position_ranges: List of (start, end) inclusive position ranges to keep.
+    :param annotation_folder: Folder containing tRNA_names.txt.
+    :return: VariantFilter, or None if no criterion is given.
+    """
+    criteria = {}
+    mask = np.ones((GENOME_LENGTH + 1, len(ALT_ALLELES) + 1), dtype=bool)
+    mask[0] = False  # Not a genome position
+
+    # Position criteria apply to every allele of a position
+    if position_ranges:
+        position_mask = np.zeros(GENOME_LENGTH + 1, dtype=bool)
+        for start, end in position_ranges:
+            position_mask[start:end + 1] = True
+        mask &= position_mask[:, None]
+        criteria["positions"] = [list(position_range) for position_range in position_ranges]
+
+    if loci or trna_only or apogee2_classes:
+        if annotation is None:
+            raise ValueError("The loci, tRNA and APOGEE2 filters require the variant annotation.")
+
+        # The locus is a property of the position, annotated from the same array (see variant_annotation)
+        position_locus = np.asarray(annotation.positions["locus"])
+
+        if loci:
+            mask &= np.isin(position_locus, coding_values(annotation, "locus", loci))[:, None]
+            criteria["loci"] = sorted(loci)
+
+        if trna_only:
+            trna_codes = [annotation.vocabularies["locus"].index(name) + 1
+                          for name in reading_trna_names(annotation_folder) if name in annotation.vocabularies["locus"]]
+            mask &= np.isin(position_locus, trna_codes)[:, None]
+            criteria["trna_only"] = True
+
+        # APOGEE2 classes are scored per substitution: variants without a class are rejected
+        if apogee2_classes:
+            mask &= np.isin(np.asarray(annotation.table["apogee2"]),
+                            coding_values(annotation, "apogee2", apogee2_classes))
+            criteria["apogee2"] = sorted(apogee2_classes)
+
+    if not criteria:
+        return None
+
+    return VariantFilter(mask, criteria)
@@ -1,12 +1,20 @@
 import csv  # Module for handling CSV file operations
 
-def generate_variant_csv(variant_dictionnary, output_path):
+# Header of the concatenated variant file
+VARIANT_HEADER = [
+    "chr", "pos", "ref", "alt", "heteroplasmy_rate", "patient_id", "sex", "age_of_onset",
+    "age_at_sampling", "tissue", "type", "haplogroup", "m3243_het", "m3243_het_normalized"
+]
+
+
+def generate_variant_csv(variant_dictionnary, output_path, annotation=None):
     """
     Generates a CSV file containing variant data.
 
     :param variant_dictionnary: Dictionary containing variant data, where each key represents a patient 
                                 and values are lists of variant-related information.
     :param output_path: Path where the CSV file will be created.
+    :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
     :return: None
     """
 
@@ -15,12 +23,37 @@ def generate_variant_csv(variant_dictionnary, output_path):
         writer = csv.writer(fh_out, delimiter=";")  # Initialize CSV writer with semicolon delimiter
 
         # Writing the CSV header row
-        writer.writerow([
-            "chr", "pos", "ref", "alt", "heteroplasmy_rate", "patient_id", "sex", "age_of_onset",
-            "age_at_sampling", "tissue", "type", "haplogroup", "m3243_het", "m3243_het_normalized"
-        ])
-
-        # Iterate over each patient's data in the dictionary
-        for values in variant_dictionnary.values():
-            for variant in values:  # Each variant is a tuple/list of values
-                writer.writerow(variant)  # Write each variant's details as a row in the CSV file
+        writer.writerow(variant_header(annotation))
+
+        # Write the variants of every patient
+        writing_variant_rows(writer, variant_dictionnary, annotation)
+
+
+def variant_header(annotation=None):
+    """
+    Returns the header of the concatenated variant file.
+
+    :param annotation: Optional VariantAnnotation whose columns follow the variant columns.
+    :return: List of column names.
+    """
+    if annotation is None:
+        return VARIANT_HEADER
+    return VARIANT_HEADER + annotation.header
+
+
+def writing_variant_rows(writer, variant_dictionnary, annotation=None):
+    """
+    Writes the variant rows of one or several patients with an open CSV writer.
+
+    :param writer: csv.writer of the concatenated variant file.
+    :param variant_dictionnary: Dictionary { patient: [variant rows] }, as returned for one patient
+                                by variant_table.expanding_variants or aggregated for the whole cohort.
+    :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+    """
+
+    # Iterate over each patient's data in the dictionary
+    for values in variant_dictionnary.values():
+        if annotation is not None:
+            values = annotation.annotating_rows(values)  # One gather for all the patient's variants
+        for variant in values:  # Each variant is a tuple/list of values
+            writer.writerow(variant)  # Write each variant's details as a row in the CSV file
@@ -0,0 +1,134 @@
+from functools import lru_cache
+import re
+from types import MappingProxyType
+
+# Integer variant keys: the mitochondrial genome is 16,569 bp long, so a variant (pos, ref, alt) fits in a
+# single integer, compared and hashed without rebuilding its "A3243G" label:
+#
+#     key = pos << 48 | code(ref) << 24 | code(alt)
+#
+# Alleles are written in bijective base 5 over "ACGTN" (the nucleotides accepted by JSON_verification),
+# so alleles of up to 10 bases, including the empty allele, get a unique 24-bit code.
+# Variants that do not fit (position beyond 15 bits, longer alleles, other characters) keep their label
+# string as key: keys stay unique, they are only slower to compare.
+
+NUCLEOTIDE_CODES = {"A": 1, "C": 2, "G": 3, "T": 4, "N": 5}
+NUCLEOTIDES = "ACGTN"
+
+POSITION_BITS = 15
+ALLELE_BITS = 24
+MAX_ALLELE_LENGTH = 10  # Largest code ("NNNNNNNNNN") is 12,207,030 < 2 ** 24
+
+# Requested variant label, e.g. "A3243G" (position without leading zeros, as the catalog labels are built)
+VARIANT_LABEL_PATTERN = re.compile(r"^([ACGTN]*)(0|[1-9][0-9]*)([ACGTN]*)$")
+
+
+def encoding_allele(allele):
+    """
+    Encodes an allele in bijective base 5.
+
+    :param allele: Allele sequence (e.g. "A", "AC").
+    :return: Integer code, or None if the allele cannot be encoded.
+    """
+    if len(allele) > MAX_ALLELE_LENGTH:
+        return None
+
+    code = 0
+    for nucleotide in allele:
+        digit = NUCLEOTIDE_CODES.get(nucleotide)
+        if digit is None:
+            return None
+        code = code * 5 + digit
+    return code
+
+
+def decoding_allele(code):
+    """
+    Decodes an allele encoded by encoding_allele.
+
+    :param code: Integer code.
+    :return: Allele sequence.
+    """
+    allele = []
+    while code:
+        code, digit = divmod(code - 1, 5)
+        allele.append(NUCLEOTIDES[digit])
+    return "".join(reversed(allele))
+
+
+def variant_key(position, reference, alternative):
+    """
+    Returns the key of a variant.
+
+    :param position: Variant position (int or numeric string).
+    :param reference: Reference allele.
+    :param alternative: Alternative allele.
+    :return: Integer key, or the variant label (e.g. "A40000G") if the variant cannot be packed.
+    """
+    position = int(position)
+    reference_code = encoding_allele(reference)
+    alternative_code = encoding_allele(alternative)
+
+    if reference_code is None or alternative_code is None or not 0 <= position < 1 << POSITION_BITS:
+        return f"{reference}{position}{alternative}"
+
+    return (position << (2 * ALLELE_BITS)) | (reference_code << ALLELE_BITS) | alternative_code
+
+
+def parsing_variant_label(label):
+    """
+    Returns the key of a variant label such as "A3243G".
+
+    :param label: Variant label.
+    :return: Key of the variant (see variant_key), or the label itself if it is not a valid label.
+    """
+    match = VARIANT_LABEL_PATTERN.match(label)
+    if match is None:
+        return label
+
+    reference, position, alternative = match.groups()
+    return variant_key(position, reference, alternative)
+
+
+def variant_label(key):
+    """
+    Returns the label (e.g. "A3243G") of a variant key.
+
+    :param key: Key returned by variant_key.
+    :return: Variant label.
+    """
+    if isinstance(key, str):
+        return key
+
+    mask = (1 << ALLELE_BITS) - 1
+    position = key >> (2 * ALLELE_BITS)
+    return f"{decoding_allele((key >> ALLELE_BITS) & mask)}{position}{decoding_allele(key & mask)}"
+
+
+@lru_cache(maxsize=None)
+def compile_variant_keys(input_variants):
+    """
+    Parses the requested variants once into a key index (cached per process).
+
+    :param input_variants: Comma-separated string of expected variants (e.g., "A3243G,G11778A").
+    :return: Read-only mapping { variant key: variant label }.
+    """
+    labels = [variant for variant in input_variants.replace(" ", "").split(",") if variant]
+    return MappingProxyType({parsing_variant_label(label): label for label in labels})
+
+
+def indexing_catalog(variant_catalog):
+    """
+    Builds the key index of a patient's variant catalog.
+
+    :param variant_catalog: List of variant rows [chr, pos, ref, alt, het].
+    :return: Dictionary { variant key: index of its first row in the catalog }.
+    """
+    catalog_index = {}
+    for index, variant in enumerate(variant_catalog):
+        catalog_index.setdefault(variant_key(variant[1], variant[2], variant[3]), index)
+    return catalog_index
+
+
+# Key of the m.3243A>G variant, which gets the m3243_het columns
+M3243_KEY = variant_key(3243, "A", "G")
@@ -0,0 +1,272 @@
+from array import array
+
+import numpy as np
+
+# Compact in-memory variant table: the cohort's variants are kept as typed columns and the patient
+# metadata (patient_id, sex, ages, tissue, type, haplogroup, m3243 values) is stored once per file in a
+# patient table, instead of being copied onto every variant row. The workers already return the variants
+# of each sample as typed columns, so denormalized rows are only rebuilt when the tables are written.
+
+# Codes of the source position and heteroplasmy values of a variant row
+VALUE_FLOAT = 0  # Integer position, float heteroplasmy rate (the usual case)
+VALUE_INT = 1  # Integer position, integer heteroplasmy rate
+VALUE_SOURCE = 2  # Other values, kept as they were: code VALUE_SOURCE + i is source_values[i]
+
+
+class VariantColumns:
+    """
+    Typed variant columns, without patient metadata. The workers return the variants of each sample in this
+    form (see variants_unique_format.structuring_sample_information), so the per-patient results sent between
+    processes and cached by the manifest hold one typed value per variant and column.
+
+    Columns:
+        - chr, ref, alt: uint16 codes in interned vocabularies (alleles can be multi-base, so more than
+          256 distinct values are possible)
+        - pos: int32 position
+        - heteroplasmy_rate: float64 (written back as text, float32 would alter the values)
+        - value_codes: uint32 code of the source position and heteroplasmy values
+
+    The rows are expanded with the position and heteroplasmy values of the patient files, so the written
+    tables keep their text: an integer heteroplasmy rate (e.g. 50) is coded VALUE_INT and given back as an
+    int, and the rare values that are neither int nor float (e.g. the string "45.50") are interned once in
+    source_values and coded by their index.
+    """
+
+    def __init__(self):
+        # Interned categorical strings (also shared by the patient metadata of a VariantTable)
+        self.interned = {}
+        self.vocabularies = {"chr": {}, "allele": {}}  # value -> code
+        self.decoding = {"chr": [], "allele": []}  # code -> value
+
+        # Variant columns
+        self.chr_codes = array("H")
+        self.pos = array("i")
+        self.ref_codes = array("H")
+        self.alt_codes = array("H")
+        self.heteroplasmy = array("d")
+
+        # Representation of the source values (see variant_rows)
+        self.value_codes = array("I")  # VALUE_FLOAT, VALUE_INT or VALUE_SOURCE + index in source_values
+        self.source_values = []  # Distinct (pos, heteroplasmy_rate) source values of the other rows
+        self.source_codes = {}  # { (pos, heteroplasmy_rate, types): value code }
+
+    def __len__(self):
+        return len(self.pos)
+
+    def interning(self, value):
+        """
+        Returns a shared instance of a metadata value, so equal strings are stored once.
+        """
+        if isinstance(value, str):
+            return self.interned.setdefault(value, value)
+        return value
+
+    def coding(self, vocabulary, value):
+        """
+        Returns the code of a value in one of the vocabularies, adding it if needed.
+        """
+        codes = self.vocabularies[vocabulary]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.decoding[vocabulary].append(self.interning(value))
+        return code
+
+    def value_code(self, position, heteroplasmy):
+        """
+        Returns the code of the source position and heteroplasmy values of a variant.
+        """
+        if type(position) is int:
+            if type(heteroplasmy) is float:
+                return VALUE_FLOAT
+            if type(heteroplasmy) is int:
+                return VALUE_INT
+
+        # The types are part of the key: 50 and 50.0 are equal but not written the same way
+        key = (position, heteroplasmy, type(position), type(heteroplasmy))
+        code = self.source_codes.get(key)
+        if code is None:
+            code = self.source_codes[key] = VALUE_SOURCE + len(self.source_values)
+            self.source_values.append((self.interning(position), self.interning(heteroplasmy)))
+        return code
+
+    def adding_variant(self, chromosome, position, reference, alternative, heteroplasmy):
+        """
+        Adds one variant, given with its values in the patient file.
+        """
+        self.chr_codes.append(self.coding("chr", chromosome))
+        self.pos.append(int(position))
+        self.ref_codes.append(self.coding("allele", reference))
+        self.alt_codes.append(self.coding("allele", alternative))
+        self.heteroplasmy.append(float(heteroplasmy))
+        self.value_codes.append(self.value_code(position, heteroplasmy))
+
+    def variant_rows(self, start=0, end=None, patient_row=()):
+        """
+        Rebuilds the denormalized variant rows of a range of variants.
+
+        :param start: First variant.
+        :param end: End of the range (None = last variant).
+        :param patient_row: Patient metadata appended to every row.
+        :return: List of variant rows [chr, pos, ref, alt, het, *patient metadata], with the position and
+                 heteroplasmy values of the patient file.
+        """
+        chromosomes = self.decoding["chr"]
+        alleles = self.decoding["allele"]
+        patient_row = list(patient_row)
+
+        rows = []
+        for i in range(start, len(self.pos) if end is None else end):
+            code = self.value_codes[i]
+            if code == VALUE_FLOAT:
+                position, heteroplasmy = self.pos[i], self.heteroplasmy[i]
+            elif code == VALUE_INT:
+                position, heteroplasmy = self.pos[i], int(self.heteroplasmy[i])
+            else:
+                position, heteroplasmy = self.source_values[code - VALUE_SOURCE]
+            rows.append([chromosomes[self.chr_codes[i]], position, alleles[self.ref_codes[i]],
+                         alleles[self.alt_codes[i]], heteroplasmy] + patient_row)
+        return rows
+
+
+def expanding_variants(variant_dictionnary, patient_information):
+    """
+    Rebuilds the denormalized variant rows of a per-patient result, to write them.
+
+    :param variant_dictionnary: Dictionary { file_name: VariantColumns } (the "variants" entry of a result).
+    :param patient_information: Dictionary { file_name: patient metadata } (the "patient" entry of a result).
+    :return: Dictionary { file_name: [variant rows] }.
+    """
+    return {file_name: variants.variant_rows(patient_row=patient_information[file_name])
+            for file_name, variants in variant_dictionnary.items()}
+
+
+class VariantTable(VariantColumns):
+    """
+    Cohort variant table: one patient table row per file, plus the variant columns of every file
+    (see VariantColumns) and their patient_index column (uint32 row in the patient table).
+
+    Behaves as a read-only { file_name: [variant rows] } mapping (len(), keys(), values(), items(),
+    [file_name]), so the writers of the concatenated variant file use it like the per-file dictionaries.
+
+    Usage:
+        table = VariantTable()
+        table.add_variants(patient_result["variants"], patient_result["patient"])
+        generate_variant_csv(table, output_path)
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        # Patient table
+        self.file_names = []  # File name of each patient table row
+        self.file_index = {}  # { file_name: patient table row }, for the mapping lookups
+        self.patient_rows = []  # Patient metadata tuple (variant row fields after the 5 variant fields)
+        self.offsets = array("Q", [0])  # Variants of patient i are offsets[i]:offsets[i + 1]
+
+        self.patient_index = array("I")
+
+    def add_patient(self, file_name, variants, patient_information):
+        """
+        Adds the variants of one file. A file without variants is stored too: it has a row in the clinical
+        table, but none in the variant table.
+
+        :param file_name: File name (key of the per-file variant dictionary).
+        :param variants: VariantColumns of the file, as returned by
+                         variants_unique_format.structuring_sample_information.
+        :param patient_information: Patient metadata of the file (see
+                                    variants_unique_format.structuring_sample_information).
+        """
+        index = len(self.file_names)
+        self.file_names.append(file_name)
+        self.file_index.setdefault(file_name, index)
+        self.patient_rows.append(tuple(self.interning(value) for value in patient_information))
+
+        if len(variants):
+            # The codes of the file are translated to the vocabularies of the table
+            for vocabulary, codes, table_codes in (("chr", variants.chr_codes, self.chr_codes),
+                                                   ("allele", variants.ref_codes, self.ref_codes),
+                                                   ("allele", variants.alt_codes, self.alt_codes)):
+                mapping = np.array([self.coding(vocabulary, value) for value in variants.decoding[vocabulary]],
+                                   dtype=np.uint16)
+                table_codes.frombytes(mapping[np.frombuffer(codes, dtype=np.uint16)].tobytes())
+
+            mapping = np.array([VALUE_FLOAT, VALUE_INT] + [self.value_code(position, heteroplasmy)
+                                                           for position, heteroplasmy in variants.source_values],
+                               dtype=np.uint32)
+            self.value_codes.frombytes(mapping[np.frombuffer(variants.value_codes, dtype=np.uint32)].tobytes())
+
+            self.pos.extend(variants.pos)
+            self.heteroplasmy.extend(variants.heteroplasmy)
+            self.patient_index.extend(array("I", [index]) * len(variants))
+
+        self.offsets.append(len(self.pos))
+
+    def add_variants(self, variant_dictionnary, patient_information):
+        """
+        Adds every file of a per-file variant dictionary { file_name: VariantColumns }.
+
+        :param variant_dictionnary: Dictionary { file_name: VariantColumns } (the "variants" entry of a per-patient
+                                    result).
+        :param patient_information: Dictionary { file_name: patient metadata } (the "patient" entry of a per-patient
+                                    result).
+        """
+        for file_name, variants in variant_dictionnary.items():
+            self.add_patient(file_name, variants, patient_information[file_name])
+
+    def columns(self):
+        """
+        Returns the variant columns as NumPy arrays (views on the table buffers, no copy).
+
+        :return: Dictionary { column_name: array }.
+        """
+        return {
+            "chr": np.frombuffer(self.chr_codes, dtype=np.uint16),
+            "pos": np.frombuffer(self.pos, dtype=np.int32),
+            "ref": np.frombuffer(self.ref_codes, dtype=np.uint16),
+            "alt": np.frombuffer(self.alt_codes, dtype=np.uint16),
+            "heteroplasmy_rate": np.frombuffer(self.heteroplasmy, dtype=np.float64),
+            "patient_index": np.frombuffer(self.patient_index, dtype=np.uint32),
+        }
+
+    def patient_information(self):
+        """
+        Returns the patient metadata of each file, as filtering_global_variant does for the per-file dictionary.
+
+        :return: Dictionary { file_name: patient_info }.
+        """
+        return {file_name: list(patient_row) for file_name, patient_row in zip(self.file_names, self.patient_rows)}
+
+    def expanding_rows(self, index):
+        """
+        Rebuilds the denormalized variant rows of one patient table row.
+
+        :param index: Row in the patient table.
+        :return: List of variant rows [chr, pos, ref, alt, het, *patient metadata] (see VariantColumns.variant_rows).
+        """
+        return self.variant_rows(self.offsets[index], self.offsets[index + 1], self.patient_rows[index])
+
+    # Read-only mapping interface { file_name: [variant rows] }, rows expanded on access
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def __contains__(self, file_name):
+        return file_name in self.file_index
+
+    def __getitem__(self, file_name):
+        return self.expanding_rows(self.file_index[file_name])
+
+    def __iter__(self):
+        return iter(self.file_names)
+
+    def keys(self):
+        return list(self.file_names)
+
+    def values(self):
+        for index in range(len(self.file_names)):
+            yield self.expanding_rows(index)
+
+    def items(self):
+        for index, file_name in enumerate(self.file_names):
+            yield file_name, self.expanding_rows(index)
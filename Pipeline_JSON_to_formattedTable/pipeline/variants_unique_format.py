@@ -1,33 +1,30 @@
-import json
 import math
 import logging
 
+from JSON_verification import load_json
+from heteroplasmy_normalization import (BLOOD_DECAY, BLOOD_AGE_OFFSET, URINE_LOGIT_SCALE,
+                                       URINE_FEMALE_ADJUSTMENT, URINE_MALE_ADJUSTMENT)
+from variant_key import M3243_KEY, compile_variant_keys, indexing_catalog
+from variant_table import VariantColumns
 
-def getting_variant_info(input_path):
+
+def getting_variant_info_from_data(data):
     """
-    Load variant information from a JSON file.
+    Extract variant information from already loaded patient data.
 
-    :param input_path: Path to the JSON file.
+    :param data: Patient data as returned by load_json.
     :return: Tuple containing clinical_info, onto_info, sample_info, and a list of variant data.
     """
-    try:
-        with open(input_path, "r") as fh_in:
-            data = json.load(fh_in)
-
-        # Extract relevant sections from JSON
-        clinical_info = data.get('Clinical', {})
-        onto_info = data.get('Ontology', {})
-        sample_info = data.get('Sample', {})
-        variants = data.get('Catalog', [])
+    # Extract relevant sections from JSON
+    clinical_info = data.get('Clinical', {})
+    onto_info = data.get('Ontology', {})
+    sample_info = data.get('Sample', {})
+    variants = data.get('Catalog', [])
 
-        # Extract variant information
-        variant_array = [[v['chr'], v['pos'], v['ref'], v['alt'], v['heteroplasmy_rate']] for v in variants]
+    # Extract variant information
+    variant_array = [[v['chr'], v['pos'], v['ref'], v['alt'], v['heteroplasmy_rate']] for v in variants]
 
-        return clinical_info, onto_info, sample_info, variant_array
-
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logging.error(f"Error processing file {input_path}: {e}")
-        return None, None, None, None
+    return clinical_info, onto_info, sample_info, variant_array
 
 
 def returning_homogenized_tissue(tissue):
@@ -56,23 +53,26 @@ def returning_homogenized_tissue(tissue):
     return tissue
 
 
-def returning_m3243_het(variant_catalog):
+def returning_m3243_het(variant_catalog, catalog_index=None):
     """
     Extract heteroplasmy rate for A3243G mutation.
 
     :param variant_catalog: List of variant data.
+    :param catalog_index: Key index of the catalog (see variant_key.indexing_catalog), built if not given.
     :return: Heteroplasmy rate of A3243G if found, else None.
     """
-    for variant in variant_catalog:
-        variant_lbl = f"{variant[2]}{int(variant[1])}{variant[3]}"  # e.g., "A3243G"
-        if variant_lbl == "A3243G":
-            return float(variant[4])
+    if catalog_index is None:
+        catalog_index = indexing_catalog(variant_catalog)
+
+    index = catalog_index.get(M3243_KEY)
+    if index is not None:
+        return float(variant_catalog[index][4])
     return None
 
 
 def blood_m3243_normalization(m3243_het, age):
     """Normalize blood m3243 heteroplasmy based on age."""
-    normalized_value = m3243_het / (0.977 ** (age + 12))
+    normalized_value = m3243_het / (BLOOD_DECAY ** (age + BLOOD_AGE_OFFSET))
     return min(1, normalized_value)
 
 
@@ -82,9 +82,9 @@ def urine_m3243_normalization(variant_het, sex):
         return variant_het
 
     logit_urine_het = math.log(variant_het / (1 - variant_het))
-    adjustment = 0.608 if sex == "F" else -0.625
+    adjustment = URINE_FEMALE_ADJUSTMENT if sex == "F" else URINE_MALE_ADJUSTMENT
 
-    het_normalized = math.exp((logit_urine_het / 0.791) + adjustment)
+    het_normalized = math.exp((logit_urine_het / URINE_LOGIT_SCALE) + adjustment)
     return min(1, het_normalized / (1 + het_normalized))
 
 
@@ -92,6 +92,9 @@ def normalize_heteroplasmy(variant_info, norm_info, normalization_status):
     """
     Normalize heteroplasmy level based on tissue type.
 
+    Scalar counterpart of heteroplasmy_normalization.normalize_heteroplasmy_batch (same coefficients,
+    edge cases, clipping and rounding), used for the single m3243 value of each patient.
+
     :param variant_info: List containing variant details.
     :param norm_info: List containing [sex, age_at_sampling, tissue].
     :param normalization_status: String specifying normalization type.
@@ -115,9 +118,15 @@ def normalize_heteroplasmy(variant_info, norm_info, normalization_status):
     return round(het * 100, 2)  # Default: return original heteroplasmy in 0-100 range
 
 
-def structuring_variant_information(clinical_info, sample_info, variant_catalog, het_treshold, input_variants, normalization):
+def structuring_sample_information(clinical_info, sample_info, variant_catalog, het_treshold, input_variants,
+                                   normalization, variant_filter=None):
     """
-    Structure variant table for analysis.
+    Structure the variants of a sample as typed columns, and its patient information.
+
+    The variants are not copied with the patient information: the rows of the variant table are only
+    rebuilt when they are written (see variant_table). The patient information (patient and sample columns, plus the m3243 columns) does not depend on the
+    variant filter, and is returned even when no variant is kept, so the clinical table lists every verified
+    sample.
 
     :param clinical_info: Patient's clinical information.
     :param sample_info: Sample-related metadata.
@@ -125,10 +134,13 @@ def structuring_variant_information(clinical_info, sample_info, variant_catalog,
     :param het_treshold: Minimum heteroplasmy threshold.
     :param input_variants: Variants to filter.
     :param normalization: Normalization mode.
-    :return: Formatted list of variants.
+    :param variant_filter: Optional VariantFilter (loci, APOGEE2 classes, positions): the variants it rejects
+                           are not kept.
+    :return: Tuple (variant_table.VariantColumns of the kept variants, patient information), the patient
+             information being the columns that follow the 5 variant columns of every row.
     """
     kept_elements = []
-    every_variant = []
+    every_variant = VariantColumns()
     norm_info = []  # Data for normalization
 
     # Extract required information
@@ -151,51 +163,74 @@ def structuring_variant_information(clinical_info, sample_info, variant_catalog,
         kept_elements.append(value)
 
     # Process variants
+    m3243_researched = M3243_KEY in compile_variant_keys(input_variants)
+    catalog_index = indexing_catalog(variant_catalog) if m3243_researched else {}  # { variant key: row }
+    m3243_index = catalog_index.get(M3243_KEY)
+
     m3243_normalized_value = None
-    for variant in variant_catalog:
+    het_treshold = int(het_treshold)
+    for index, variant in enumerate(variant_catalog):
         het = float(variant[4])
-        variant_lbl = f"{variant[2]}{int(variant[1])}{variant[3]}"
 
-        if het > int(het_treshold):  # Apply heteroplasmy threshold
-            every_variant.append(variant)
+        if het > het_treshold:  # Apply heteroplasmy threshold
+            # Apply the extraction-time filter (mask lookup)
+            if variant_filter is None or variant_filter.accepting(variant[1], variant[2], variant[3]):
+                every_variant.adding_variant(*variant)
 
-            if "A3243G" in input_variants and variant_lbl == "A3243G":
+            if index == m3243_index:
                 if normalization != "no" and norm_info[2] in ["blood", "urine"]:
                     m3243_normalized_value = normalize_heteroplasmy(variant, norm_info, normalization)
                 else:
                     m3243_normalized_value = float(variant[4])
 
     # Add supplementary columns if A3243G is researched
-    if "A3243G" in input_variants and m3243_normalized_value is not None:
-        kept_elements.append(returning_m3243_het(variant_catalog))
+    if m3243_researched and m3243_normalized_value is not None:
+        kept_elements.append(returning_m3243_het(variant_catalog, catalog_index))
         kept_elements.append(m3243_normalized_value)
 
-    # Final variant formatting
-    final_variant_format = [variant + kept_elements for variant in every_variant]
-
-    return final_variant_format
+    return every_variant, kept_elements
 
 
-def main_concatenation_variants(input_path, het_treshold, input_variants, normalization_status):
+def concatenation_sample_from_data(input_path, data, het_treshold, input_variants, normalization_status,
+                                   variant_filter=None):
     """
-    Main function to return patient variant information.
+    Return the variant and patient information of a loaded patient record.
 
-    :param input_path: Path to the JSON file.
+    :param input_path: Path of the JSON file the data was loaded from.
+    :param data: Patient data as returned by load_json.
     :param het_treshold: Minimum heteroplasmy threshold.
     :param input_variants: Variants of interest.
     :param normalization_status: Specifies if normalization is needed.
-    :return: Dictionary containing formatted variant data.
+    :param variant_filter: Optional VariantFilter applied to the variants (see structuring_sample_information).
+    :return: Tuple of dictionaries ({ file_name: VariantColumns }, { file_name: patient information }).
     """
+    clinical_info, _, sample_info, variant_catalog = getting_variant_info_from_data(data)
     filename = input_path.replace(".json", "")
 
-    clinical_info, onto_info, sample_info, variant_catalog = getting_variant_info(input_path)
+    sample_variants, patient_information = structuring_sample_information(
+        clinical_info, sample_info, variant_catalog, het_treshold, input_variants, normalization_status, variant_filter
+    )
 
-    if None in (clinical_info, onto_info, sample_info, variant_catalog):
-        logging.error("Error loading variant information. Check input JSON.")
-        return {}
+    return {filename: sample_variants}, {filename: patient_information}
 
-    every_variants_formatted = structuring_variant_information(
-        clinical_info, sample_info, variant_catalog, het_treshold, input_variants, normalization_status
-    )
 
-    return {filename: every_variants_formatted}
+def main_concatenation_variants(input_path, het_treshold, input_variants, normalization_status, variant_filter=None):
+    """
+    Main function to return patient variant information from a JSON file.
+
+    :param input_path: Path to the JSON file.
+    :param het_treshold: Minimum heteroplasmy threshold.
+    :param input_variants: Variants of interest.
+    :param normalization_status: Specifies if normalization is needed.
+    :param variant_filter: Optional VariantFilter applied to the variants (see structuring_sample_information).
+    :return: Tuple of dictionaries ({ file_name: VariantColumns }, { file_name: patient information }),
+             both empty if the file could not be loaded.
+    """
+    data = load_json(input_path)
+
+    if not data:
+        logging.error("Error loading variant information. Check input JSON.")
+        return {}, {}
+
+    return concatenation_sample_from_data(input_path, data, het_treshold, input_variants, normalization_status,
+                                          variant_filter)
@@ -0,0 +1,224 @@
+import csv  # Module for appending to the concatenated CSV files
+import logging  # Module for logging the watch cycles
+import os
+import time
+
+from JSON_verification import writing_verification_report
+from HPO_unique_csv import hpo_standard_output_file, writing_hpo_rows
+from variant_generation_csv import generate_variant_csv, writing_variant_rows
+from variant_table import VariantTable, expanding_variants
+from generate_absence_presence_HPO import main_generation_absence_presence_hpo
+from generation_clinical_table import generation_clinical_table_from_information
+from columnar_output import generate_variant_columnar, output_path_for_format
+from input_sources import PATIENT_FILE_SUFFIXES
+
+# Watch mode: a resident process keeps the HPO index, the variant annotation and filter and the result
+# of every patient file in memory, and polls the input folder. New or changed files are processed as they
+# arrive and the output tables are updated from the in-memory results: the rows of new files are appended
+# to the concatenated CSV files when they sort after every file already written (otherwise these files are
+# rewritten), and the per-patient tables (verification report, presence/absence, clinical) are regenerated.
+
+WATCH_INTERVAL = 1.0  # Default delay between two scans of the input folder, in seconds
+
+
+def scanning_input_folder(input_folder):
+    """
+    Lists the JSON files (".json" or ".json.gz") of the input folder with their modification time and size.
+
+    :param input_folder: Folder to scan.
+    :return: Dictionary { input_path: (mtime_ns, size) }.
+    """
+    snapshot = {}
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(PATIENT_FILE_SUFFIXES) and entry.is_file():
+                stat = entry.stat()
+                snapshot[os.path.join(input_folder, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def patient_status(patient_result):
+    """
+    Returns the verification status of a per-patient result ("passed", "failed" or "error").
+    """
+    if "error" in patient_result:
+        return "error"
+    return "passed" if patient_result["verified"] else "failed"
+
+
+class WatchedCohort:
+    """
+    In-memory results of the watched input folder and the output tables built from them.
+    """
+
+    def __init__(self, output_folder, process_results, annotation=None, output_format="csv", report_format="csv",
+                 hpo_matrix_format="dense", hpo_propagation=None):
+        """
+        :param output_folder: Output folder of the tables.
+        :param process_results: Function taking a list of input paths and returning an iterator of their
+                                per-patient results, in the same order (see patient_executor.PatientExecutor.results).
+        :param annotation: Optional VariantAnnotation whose columns are appended to every variant.
+        :param output_format: Format of the variant and clinical tables: "csv", "parquet" or "arrow".
+        :param report_format: Format of the verification report: "csv" or "json".
+        :param hpo_matrix_format: Format of the presence/absence table: "dense", "sparse" or "both".
+        :param hpo_propagation: Optional HPO_ontology.HPOPropagation of the presence/absence table.
+        """
+        self.output_folder = output_folder
+        self.process_results = process_results
+        self.annotation = annotation
+        self.output_format = output_format
+        self.report_format = report_format
+        self.hpo_matrix_format = hpo_matrix_format
+        self.hpo_propagation = hpo_propagation
+
+        self.signatures = {}  # { input_path: (mtime_ns, size) } of the processed files
+        self.results = {}  # { input_path: per-patient result }
+        self.variant_table = VariantTable()  # Variants of the verified files, in input path order
+        self.written_paths = []  # Input paths in the concatenated files, in order
+
+        self.output_path_concatenate_variants = output_path_for_format(
+            os.path.join(output_folder, "concatenate_variants.csv"), output_format)
+        self.output_path_concatenate_hpo = os.path.join(output_folder, "concatenate_HPO.csv")
+
+    def updating(self, snapshot):
+        """
+        Processes the new and changed files of a folder snapshot and updates the output tables.
+
+        :param snapshot: Dictionary { input_path: (mtime_ns, size) } (see scanning_input_folder).
+        :return: Tuple (new, changed, removed) numbers of files, or None if nothing changed.
+        """
+        new = sorted(path for path in snapshot if path not in self.signatures)
+        changed = sorted(path for path in snapshot if path in self.signatures and self.signatures[path] != snapshot[path])
+        removed = [path for path in self.signatures if path not in snapshot]
+        if not (new or changed or removed):
+            return None
+
+        to_process = sorted(new + changed)
+        for input_path, patient_result in zip(to_process, self.process_results(to_process)):
+            self.results[input_path] = patient_result
+            self.signatures[input_path] = snapshot[input_path]
+
+            status = patient_status(patient_result)
+            if status == "error":
+                logging.error(f"Error processing file '{patient_result['filename']}': {patient_result['error']}\n")
+            elif status == "failed":
+                logging.error(f"File '{patient_result['filename']}' failed verification: {patient_result['reason']}.\n")
+
+        for input_path in removed:
+            del self.results[input_path], self.signatures[input_path]
+
+        # New files sorting after every written file only add rows at the end of the concatenated files
+        appending = (not changed and not removed and self.output_format == "csv"
+                     and bool(self.written_paths) and new[0] > self.written_paths[-1])
+        self.writing_outputs(new if appending else None)
+
+        return len(new), len(changed), len(removed)
+
+    def writing_outputs(self, appended_paths=None):
+        """
+        Writes the output tables from the in-memory results.
+
+        :param appended_paths: Input paths whose rows are appended to the concatenated files, or None to
+                               rewrite them.
+        """
+        ordered_paths = sorted(self.results)
+        verified = [self.results[path] for path in ordered_paths if patient_status(self.results[path]) == "passed"]
+
+        # HPO terms by patient, a patient with several samples keeping its last sample (as in main)
+        hpo_result = {}
+        for patient_result in verified:
+            hpo_result.update(patient_result["hpo"])
+
+        if appended_paths is None:
+            self.variant_table = VariantTable()
+            for patient_result in verified:
+                self.variant_table.add_variants(patient_result["variants"], patient_result["patient"])
+            self.rewriting_concatenated_files(hpo_result)
+        else:
+            self.appending_concatenated_files(appended_paths, hpo_result)
+        self.written_paths = ordered_paths
+
+        report_rows = [{"filename": self.results[path]["filename"], "status": patient_status(self.results[path]),
+                        "reason": self.results[path].get("reason", "")} for path in ordered_paths]
+        writing_verification_report(report_rows, self.output_folder, self.report_format)
+
+        main_generation_absence_presence_hpo(hpo_result, self.output_folder, self.hpo_matrix_format,
+                                             self.hpo_propagation)
+        generation_clinical_table_from_information(self.variant_table.patient_information(), self.output_folder,
+                                                   self.output_format)
+
+    def rewriting_concatenated_files(self, hpo_result):
+        """
+        Rewrites the concatenated variant and HPO files.
+
+        :param hpo_result: Dictionary { patient_id: [(hpo_id, hpo_name), ...] } of the cohort.
+        """
+        if self.output_format == "csv":
+            generate_variant_csv(self.variant_table, self.output_path_concatenate_variants, self.annotation)
+        else:
+            generate_variant_columnar(self.variant_table, self.output_path_concatenate_variants, self.output_format,
+                                      self.annotation)
+        hpo_standard_output_file(hpo_result, self.output_path_concatenate_hpo)
+
+    def appending_concatenated_files(self, appended_paths, hpo_result):
+        """
+        Appends the rows of new files to the concatenated variant and HPO CSV files.
+
+        The HPO file is rewritten instead when a new file belongs to a patient already written, whose HPO
+        rows are replaced by those of the new sample.
+
+        :param appended_paths: Input paths of the new files, in order.
+        :param hpo_result: Dictionary { patient_id: [(hpo_id, hpo_name), ...] } of the cohort.
+        """
+        new_results = [self.results[path] for path in appended_paths if patient_status(self.results[path]) == "passed"]
+        new_patients = [patient_id for patient_result in new_results for patient_id in patient_result["hpo"]]
+
+        with open(self.output_path_concatenate_variants, "a", newline="") as fh_out:
+            writer = csv.writer(fh_out, delimiter=";")
+            for patient_result in new_results:
+                self.variant_table.add_variants(patient_result["variants"], patient_result["patient"])
+                writing_variant_rows(writer, expanding_variants(patient_result["variants"], patient_result["patient"]),
+                                     self.annotation)
+
+        written_patients = len(hpo_result) - len(set(new_patients))
+        if len(set(new_patients)) != len(new_patients) or list(hpo_result)[written_patients:] != new_patients:
+            hpo_standard_output_file(hpo_result, self.output_path_concatenate_hpo)
+            return
+
+        with open(self.output_path_concatenate_hpo, "a", newline="") as fh_out:
+            writing_hpo_rows(csv.writer(fh_out, delimiter=";"),
+                             {patient_id: hpo_result[patient_id] for patient_id in new_patients})
+
+
+def watching_input_folder(input_folder, cohort, interval=WATCH_INTERVAL, max_cycles=None):
+    """
+    Polls the input folder and updates the watched cohort until interrupted (Ctrl+C).
+
+    :param input_folder: Folder of the patient JSON files.
+    :param cohort: WatchedCohort updated at every change.
+    :param interval: Delay between two scans, in seconds.
+    :param max_cycles: Number of scans before returning (None = until interrupted).
+    """
+    logging.info(f"Watching '{input_folder}' every {interval} s.")
+    cycle = 0
+
+    try:
+        while max_cycles is None or cycle < max_cycles:
+            cycle += 1
+            start = time.perf_counter()
+            try:
+                counts = cohort.updating(scanning_input_folder(input_folder))
+            except OSError as e:
+                # The folder may be unavailable for a moment (network share, files being moved)
+                logging.warning(f"Could not scan '{input_folder}': {e}")
+                counts = None
+
+            if counts is not None:
+                logging.info(f"Watch: {counts[0]} new, {counts[1]} changed and {counts[2]} removed file(s), "
+                             f"outputs updated in {time.perf_counter() - start:.3f} s "
+                             f"({len(cohort.results)} files in the cohort).")
+
+            if max_cycles is None or cycle < max_cycles:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logging.info("Watch mode stopped.")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+Tests of the HPO API client (HPO_terms_API_request.HPOAPIClient) against a local stub of the HPO API:
+deduplication of the requested terms, in-memory and persistent cache, TTL and failed or malformed responses.
+
+Usage:
+    python3 -m pytest Pipeline_JSON_to_formattedTable/tests
+"""
+
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.parse
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from HPO_terms_API_request import HPOAPIClient
+
+UNKNOWN_HPO = "HP:9999999"  # Term the stub API does not know
+FAILING_HPO = "HP:5000000"  # Term whose request fails (HTTP 500)
+MALFORMED_HPO = "HP:4000000"  # Term whose response is not a search result
+
+
+class StubHPOAPIHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers like the HPO search API: [count, [ids], extra fields, [[name], ...]], the name of a term being
+    "name_<term>".
+    """
+
+    def do_GET(self):
+        hpo = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)["terms"][0]
+        self.server.requested.append(hpo)
+
+        if hpo == FAILING_HPO:
+            self.send_error(500)
+            return
+        if hpo == UNKNOWN_HPO:
+            body = [0, [], None, []]
+        elif hpo == MALFORMED_HPO:
+            body = [1, [hpo], None, {"name": "not a list"}]
+        else:
+            body = [1, [hpo], None, [[f"name_{hpo}"]]]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class HPOAPIClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHPOAPIHandler)
+        self.server.requested = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = f"http://127.0.0.1:{self.server.server_address[1]}/search"
+
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.folder.name, "hpo_api_cache.json")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def test_duplicates_are_requested_once(self):
+        client = HPOAPIClient(self.api_url, max_workers=4)
+        names = client.lookup(["HP:0001250", "HP:0001251", "HP:0001250", UNKNOWN_HPO, "HP:0001251"])
+
+        self.assertEqual(names, {"HP:0001250": "name_HP:0001250", "HP:0001251": "name_HP:0001251",
+                                 UNKNOWN_HPO: ""})
+        self.assertEqual(sorted(self.server.requested), ["HP:0001250", "HP:0001251", UNKNOWN_HPO])
+
+    def test_cached_names_are_not_requested_again(self):
+        client = HPOAPIClient(self.api_url, cache_path=self.cache_path)
+        client.lookup(["HP:0001250", UNKNOWN_HPO])
+        self.assertEqual(client.lookup(["HP:0001250", UNKNOWN_HPO]), {"HP:0001250": "name_HP:0001250",
+                                                                       UNKNOWN_HPO: ""})
+
+        # A new client reads the persistent cache
+        names = HPOAPIClient(self.api_url, cache_path=self.cache_path).lookup(["HP:0001250", "HP:0001263"])
+        self.assertEqual(names, {"HP:0001250": "name_HP:0001250", "HP:0001263": "name_HP:0001263"})
+        self.assertEqual(sorted(self.server.requested), ["HP:0001250", "HP:0001263", UNKNOWN_HPO])
+
+    def test_expired_names_are_requested_again(self):
+        HPOAPIClient(self.api_url, cache_path=self.cache_path).lookup(["HP:0001250"])
+        with open(self.cache_path) as fh:
+            cache = json.load(fh)
+        cache["HP:0001250"][1] -= 3600  # Fetched an hour ago
+        with open(self.cache_path, "w") as fh:
+            json.dump(cache, fh)
+
+        HPOAPIClient(self.api_url, cache_path=self.cache_path, ttl=7200).lookup(["HP:0001250"])
+        self.assertEqual(self.server.requested, ["HP:0001250"])
+
+        HPOAPIClient(self.api_url, cache_path=self.cache_path, ttl=1800).lookup(["HP:0001250"])
+        self.assertEqual(self.server.requested, ["HP:0001250", "HP:0001250"])
+
+    def test_failed_and_malformed_responses_are_not_cached(self):
+        client = HPOAPIClient(self.api_url, cache_path=self.cache_path)
+        names = client.lookup(["HP:0001250", FAILING_HPO, MALFORMED_HPO])
+
+        self.assertEqual(names, {"HP:0001250": "name_HP:0001250", FAILING_HPO: "", MALFORMED_HPO: ""})
+        self.assertEqual(set(client.cache), {"HP:0001250"})
+
+        # They are retried on the next lookup
+        client.lookup([FAILING_HPO, MALFORMED_HPO])
+        self.assertEqual(self.server.requested.count(MALFORMED_HPO), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
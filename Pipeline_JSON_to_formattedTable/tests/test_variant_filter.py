@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Tests of the variant filter (variant_filter.building_variant_filter) against the variant annotation
+(variant_annotation.VariantAnnotation): every variant kept by the loci and tRNA filters is annotated
+with one of the selected loci, substitutions, indels and rows whose alternative allele is the
+reference included.
+
+Usage:
+    python3 -m pytest Pipeline_JSON_to_formattedTable/tests
+"""
+
+import os
+import sys
+import unittest
+
+# Adding the 'pipeline' directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'pipeline'))
+
+from variant_annotation import ALT_ALLELES, DEFAULT_ANNOTATION_FOLDER, GENOME_LENGTH, build_variant_annotation
+from variant_filter import building_variant_filter, parsing_position_ranges, reading_trna_names
+from variant_generation_csv import VARIANT_HEADER
+
+LOCUS_COLUMN = len(VARIANT_HEADER)  # First annotation column of an annotated row
+
+
+def every_variant_row():
+    """
+    Returns one variant row per position and alternative allele, plus an insertion, a deletion and an
+    N allele per position.
+    """
+    rows = []
+    for position in range(1, GENOME_LENGTH + 1):
+        for alternative in ALT_ALLELES + "N":
+            rows.append(["chrM", position, "A", alternative, 50.0])
+        rows.append(["chrM", position, "A", "AT", 50.0])
+        rows.append(["chrM", position, "AT", "A", 50.0])
+    return rows
+
+
+class VariantFilterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.annotation = build_variant_annotation(DEFAULT_ANNOTATION_FOLDER)
+        cls.rows = every_variant_row()
+
+    def kept_loci(self, variant_filter):
+        # Locus annotated on every row kept by the filter
+        kept = [row for row in self.rows if variant_filter.accepting(row[1], row[2], row[3])]
+        self.assertTrue(kept)
+        return [row[LOCUS_COLUMN] for row in self.annotation.annotating_rows(kept)]
+
+    def test_loci_filter_keeps_annotated_loci(self):
+        loci = ["MT-TL1", "MT-CR"]
+        variant_filter = building_variant_filter(self.annotation, loci=loci)
+        self.assertEqual(set(self.kept_loci(variant_filter)), set(loci))
+
+    def test_trna_filter_keeps_trna_loci(self):
+        variant_filter = building_variant_filter(self.annotation, trna_only=True)
+        self.assertTrue(set(self.kept_loci(variant_filter)) <= set(reading_trna_names(DEFAULT_ANNOTATION_FOLDER)))
+
+    def test_position_ranges(self):
+        self.assertEqual(parsing_position_ranges("3230-3304, 8344,"), [(3230, 3304), (8344, 8344)])
+        for position_ranges in ("3304-3230", "0-10", "16560-16570", "16570", "a-b"):
+            with self.assertRaises(ValueError):
+                parsing_position_ranges(position_ranges)
+
+
+if __name__ == '__main__':
+    unittest.main()